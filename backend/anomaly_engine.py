@@ -0,0 +1,310 @@
+"""
+Moteur de détection d'anomalies par auto-encoder
+
+Découpe l'image (ou la ROI de la piste) en tuiles, score toutes les tuiles
+en un seul passage batché et retourne une heatmap d'erreur de reconstruction
+par tuile ainsi que des boîtes candidates. Sert aussi de pré-filtre
+(AnomalyGate) avant YOLO/SAM avec des seuils calibrés par caméra.
+"""
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import torch
+
+try:
+    from inference_precision import precision_policy
+except ImportError:
+    from backend.inference_precision import precision_policy
+
+# Configuration (surchargée par variables d'environnement)
+AUTOENCODER_INPUT_SIZE = int(os.getenv('AUTOENCODER_INPUT_SIZE', '224'))
+AUTOENCODER_TILE_SIZE = int(os.getenv('AUTOENCODER_TILE_SIZE', '160'))
+AUTOENCODER_TILE_STRIDE = int(os.getenv('AUTOENCODER_TILE_STRIDE', '160'))
+AUTOENCODER_BATCH_SIZE = int(os.getenv('AUTOENCODER_BATCH_SIZE', '32'))
+AUTOENCODER_THRESHOLD = float(os.getenv('AUTOENCODER_THRESHOLD', '0.1'))
+# Carte d'anomalies dans la boucle vidéo : activée par défaut ou non, et fréquence
+# (1 = chaque frame échantillonnée, 5 = une frame échantillonnée sur 5)
+AUTOENCODER_VIDEO_TILES = os.getenv('AUTOENCODER_VIDEO_TILES', '0') == '1'
+AUTOENCODER_VIDEO_EVERY = max(1, int(os.getenv('AUTOENCODER_VIDEO_EVERY', '1')))
+# Cascade auto-encoder -> YOLO/SAM : seuls les frames anormales passent aux modèles lourds
+AUTOENCODER_GATE = os.getenv('AUTOENCODER_GATE', '0') == '1'
+AUTOENCODER_CALIBRATION_SIGMA = float(os.getenv('AUTOENCODER_CALIBRATION_SIGMA', '3.0'))
+AUTOENCODER_THRESHOLDS_PATH = Path(os.getenv(
+    'AUTOENCODER_THRESHOLDS_PATH',
+    str(Path(__file__).parent / 'autoencoder_thresholds.json')
+))
+
+
+def resolve_autoencoder(autoencoder_model) -> Optional[torch.nn.Module]:
+    """
+    Retourne le nn.Module utilisable pour l'inférence, ou None si le
+    checkpoint chargé ne contient pas d'architecture exploitable
+    """
+    if isinstance(autoencoder_model, dict):
+        autoencoder_model = autoencoder_model.get('model')
+    if isinstance(autoencoder_model, torch.nn.Module):
+        return autoencoder_model
+    return None
+
+
+def _tile_starts(start: int, end: int, tile: int, stride: int) -> List[int]:
+    """Positions de départ des tuiles sur un axe (la dernière tuile est alignée sur le bord)"""
+    starts = list(range(start, end - tile + 1, stride))
+    if not starts or starts[-1] + tile < end:
+        starts.append(end - tile)
+    return starts
+
+
+def extract_tiles(img_array: np.ndarray,
+                  tile_size: int = AUTOENCODER_TILE_SIZE,
+                  stride: int = AUTOENCODER_TILE_STRIDE,
+                  roi: Optional[Tuple[int, int, int, int]] = None):
+    """
+    Découpe l'image en tuiles
+
+    Args:
+        img_array: Image numpy array (H, W, 3)
+        tile_size: Côté d'une tuile en pixels
+        stride: Pas entre deux tuiles (== tile_size pour des tuiles jointives)
+        roi: Région d'intérêt (x1, y1, x2, y2) en pixels, None = image entière
+
+    Returns:
+        (tiles, positions, grid) avec tiles de forme (N, tile, tile, 3),
+        positions la liste des (x1, y1, x2, y2) et grid = (lignes, colonnes)
+    """
+    img_height, img_width = img_array.shape[:2]
+    if roi is None:
+        x0, y0, x1, y1 = 0, 0, img_width, img_height
+    else:
+        x0 = max(0, int(roi[0]))
+        y0 = max(0, int(roi[1]))
+        x1 = min(img_width, int(roi[2]))
+        y1 = min(img_height, int(roi[3]))
+
+    # Tuile plus grande que la ROI : on réduit la tuile à la ROI
+    tile = max(1, min(tile_size, x1 - x0, y1 - y0))
+    stride = max(1, stride)
+
+    xs = _tile_starts(x0, x1, tile, stride)
+    ys = _tile_starts(y0, y1, tile, stride)
+
+    tiles = np.empty((len(ys) * len(xs), tile, tile, img_array.shape[2]), dtype=img_array.dtype)
+    positions = []
+    k = 0
+    for ty in ys:
+        for tx in xs:
+            tiles[k] = img_array[ty:ty + tile, tx:tx + tile]
+            positions.append((tx, ty, tx + tile, ty + tile))
+            k += 1
+
+    return tiles, positions, (len(ys), len(xs))
+
+
+def heatmap_to_boxes(heatmap: np.ndarray,
+                     positions: List[Tuple[int, int, int, int]],
+                     threshold: float,
+                     img_width: int,
+                     img_height: int) -> List[Dict]:
+    """
+    Regroupe les tuiles anormales adjacentes (connexité 8) en boîtes candidates
+
+    Returns:
+        Liste de boîtes {'bbox': {...} en %, 'xyxy': [...] en pixels, 'score', 'tiles'}
+    """
+    mask = (heatmap > threshold).astype(np.uint8)
+    if not mask.any():
+        return []
+
+    cols = heatmap.shape[1]
+    num_labels, labels = cv2.connectedComponents(mask, connectivity=8)
+    boxes = []
+    for label in range(1, num_labels):
+        cells = np.argwhere(labels == label)
+        cell_positions = [positions[r * cols + c] for r, c in cells]
+        x1 = min(p[0] for p in cell_positions)
+        y1 = min(p[1] for p in cell_positions)
+        x2 = max(p[2] for p in cell_positions)
+        y2 = max(p[3] for p in cell_positions)
+        score = float(heatmap[labels == label].max())
+        boxes.append({
+            'xyxy': [int(x1), int(y1), int(x2), int(y2)],
+            'bbox': {
+                'x': (x1 / img_width) * 100,
+                'y': (y1 / img_height) * 100,
+                'width': ((x2 - x1) / img_width) * 100,
+                'height': ((y2 - y1) / img_height) * 100
+            },
+            'score': score,
+            'tiles': int(len(cells))
+        })
+
+    boxes.sort(key=lambda b: b['score'], reverse=True)
+    return boxes
+
+
+def score_tiles_with_autoencoder(img_array: np.ndarray,
+                                 autoencoder_model,
+                                 device: str = 'cpu',
+                                 threshold: float = AUTOENCODER_THRESHOLD,
+                                 tile_size: int = AUTOENCODER_TILE_SIZE,
+                                 stride: int = AUTOENCODER_TILE_STRIDE,
+                                 input_size: int = AUTOENCODER_INPUT_SIZE,
+                                 batch_size: int = AUTOENCODER_BATCH_SIZE,
+                                 roi: Optional[Tuple[int, int, int, int]] = None) -> Dict:
+    """
+    Score toutes les tuiles de l'image avec l'auto-encoder en passages batchés
+
+    Args:
+        img_array: Image numpy array (H, W, 3), RGB
+        autoencoder_model: Modèle auto-encoder chargé
+        device: Device ('cpu' ou 'cuda')
+        threshold: Seuil d'erreur de reconstruction par tuile
+        tile_size: Côté d'une tuile en pixels
+        stride: Pas entre deux tuiles
+        input_size: Taille d'entrée attendue par l'auto-encoder
+        batch_size: Nombre maximal de tuiles par passage
+        roi: Région d'intérêt (x1, y1, x2, y2) en pixels
+
+    Returns:
+        dict avec 'is_anomaly', 'reconstruction_error' (moyenne), 'max_error',
+        'anomaly_score', 'heatmap' (lignes x colonnes), 'boxes' (candidats)
+    """
+    model = resolve_autoencoder(autoencoder_model)
+    if model is None:
+        return {
+            'is_anomaly': False,
+            'reconstruction_error': 0.0,
+            'max_error': 0.0,
+            'anomaly_score': 0.0,
+            'heatmap': [],
+            'boxes': [],
+            'error': 'Auto-encoder sans architecture exploitable'
+        }
+
+    img_height, img_width = img_array.shape[:2]
+    tiles, positions, grid = extract_tiles(img_array, tile_size, stride, roi)
+    effective_tile = tiles.shape[1]
+
+    # Redimensionner les tuiles à la taille d'entrée du modèle si nécessaire
+    if effective_tile != input_size:
+        tiles = np.stack([cv2.resize(t, (input_size, input_size)) for t in tiles])
+
+    # Normaliser [0, 255] -> [0, 1] en une seule opération sur tout le batch
+    batch = tiles.astype(np.float32) / 255.0
+
+    errors = np.empty(len(batch), dtype=np.float32)
+    with precision_policy.context(device):
+        for start in range(0, len(batch), batch_size):
+            # (N, H, W, C) -> (N, C, H, W)
+            chunk = torch.from_numpy(batch[start:start + batch_size]).permute(0, 3, 1, 2).to(device)
+            chunk = precision_policy.prepare_input(chunk)
+            reconstructed = model(chunk).float()
+            # MSE par tuile (pas de réduction sur le batch)
+            chunk_errors = ((chunk - reconstructed) ** 2).mean(dim=(1, 2, 3))
+            errors[start:start + len(chunk_errors)] = chunk_errors.float().cpu().numpy()
+
+    heatmap = errors.reshape(grid)
+    max_error = float(errors.max())
+    boxes = heatmap_to_boxes(heatmap, positions, threshold, img_width, img_height)
+
+    return {
+        'is_anomaly': max_error > threshold,
+        'reconstruction_error': float(errors.mean()),
+        'max_error': max_error,
+        'anomaly_score': min(max_error / threshold, 1.0) if threshold > 0 else 0.0,
+        'heatmap': heatmap.tolist(),
+        'grid': {'rows': grid[0], 'cols': grid[1], 'tileSize': effective_tile, 'stride': stride},
+        'boxes': boxes
+    }
+
+
+class AnomalyGate:
+    """
+    Porte de pré-filtrage avant YOLO/SAM (cascade à deux étages)
+
+    L'auto-encoder score chaque frame échantillonnée ; seules les frames dont
+    l'erreur de reconstruction max dépasse le seuil de la caméra sont envoyées
+    aux modèles lourds. Les seuils sont calibrés par caméra à partir d'un clip
+    de référence de piste propre et persistés dans un fichier JSON.
+    """
+
+    def __init__(self,
+                 thresholds_path: Path = AUTOENCODER_THRESHOLDS_PATH,
+                 default_threshold: float = AUTOENCODER_THRESHOLD):
+        self.thresholds_path = Path(thresholds_path)
+        self.default_threshold = default_threshold
+        self.input_size = AUTOENCODER_INPUT_SIZE  # Mis à jour depuis le manifeste au chargement
+        self.thresholds = {}  # {camera_id: {'threshold': float, 'mean': float, ...}}
+        self._load()
+
+    def _load(self):
+        """Charger les seuils calibrés depuis le disque"""
+        if not self.thresholds_path.exists():
+            return
+        try:
+            with open(self.thresholds_path, 'r', encoding='utf-8') as f:
+                self.thresholds = json.load(f)
+            print(f"✅ Seuils auto-encoder chargés pour {len(self.thresholds)} caméra(s)")
+        except Exception as e:
+            print(f"⚠️ Impossible de lire {self.thresholds_path}: {e}")
+            self.thresholds = {}
+
+    def save(self):
+        """Persister les seuils calibrés"""
+        with open(self.thresholds_path, 'w', encoding='utf-8') as f:
+            json.dump(self.thresholds, f, indent=2)
+
+    def get_threshold(self, camera_id: Optional[str] = None) -> float:
+        """Seuil de la caméra, ou seuil par défaut si elle n'est pas calibrée"""
+        entry = self.thresholds.get(camera_id or 'default')
+        if entry is None:
+            return self.default_threshold
+        return float(entry['threshold'])
+
+    def calibrate(self, camera_id: str, max_errors: List[float],
+                  sigma: float = AUTOENCODER_CALIBRATION_SIGMA) -> Dict:
+        """
+        Calibrer le seuil d'une caméra à partir des erreurs max par frame
+        mesurées sur un clip de référence propre (seuil = moyenne + sigma * écart-type)
+        """
+        if not max_errors:
+            raise ValueError("Aucune frame de référence pour la calibration")
+
+        errors = np.asarray(max_errors, dtype=np.float64)
+        mean = float(errors.mean())
+        std = float(errors.std())
+        entry = {
+            'threshold': mean + sigma * std,
+            'mean': mean,
+            'std': std,
+            'max': float(errors.max()),
+            'sigma': sigma,
+            'frames': int(len(errors)),
+            'calibratedAt': datetime.utcnow().isoformat()
+        }
+        self.thresholds[camera_id] = entry
+        self.save()
+        return entry
+
+    def check(self, img_array: np.ndarray, autoencoder_model, device: str = 'cpu',
+              camera_id: Optional[str] = None) -> Dict:
+        """
+        Scorer la frame avec le seuil de la caméra
+
+        Returns:
+            Résultat de score_tiles_with_autoencoder complété par 'threshold'
+        """
+        threshold = self.get_threshold(camera_id)
+        result = score_tiles_with_autoencoder(img_array, autoencoder_model, device=device,
+                                              threshold=threshold, input_size=self.input_size)
+        result['threshold'] = threshold
+        return result
+
+
+# Instance globale
+anomaly_gate = AnomalyGate()
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, stream_with_context, g, make_response, send_file
 from flask_cors import CORS
 import numpy as np
 from PIL import Image
@@ -11,6 +11,10 @@ import base64
 import json
 import tempfile
 import time
+import logging
+import functools
+import threading
+import queue
 
 # Import SAM (Segment Anything Model) - optionnel
 try:
@@ -29,30 +33,116 @@ except:
 
 from ultralytics import YOLO
 
-# Import MongoDB Service
+# Import du moteur d'anomalies par tuiles (auto-encoder batché)
+try:
+    from anomaly_engine import (anomaly_gate, resolve_autoencoder, AUTOENCODER_VIDEO_TILES, AUTOENCODER_VIDEO_EVERY,
+                                AUTOENCODER_GATE, AUTOENCODER_CALIBRATION_SIGMA)
+except ImportError:
+    from backend.anomaly_engine import (anomaly_gate, resolve_autoencoder, AUTOENCODER_VIDEO_TILES, AUTOENCODER_VIDEO_EVERY,
+                                        AUTOENCODER_GATE, AUTOENCODER_CALIBRATION_SIGMA)
+
+# Import de la politique de précision (FP16/BF16, channels-last, inference_mode)
+try:
+    from inference_precision import precision_policy
+except ImportError:
+    from backend.inference_precision import precision_policy
+
+# Import du backend d'inférence YOLO compilé (TorchScript / torch.compile + préchauffage)
+try:
+    from compiled_inference import YOLOInferenceBackend, YOLO_WARMUP
+except ImportError:
+    from backend.compiled_inference import YOLOInferenceBackend, YOLO_WARMUP
+
+# Import du registre d'architectures auto-encoder (reconstruction des state_dict)
+try:
+    from autoencoder_models import load_autoencoder, AUTOENCODER_BACKEND
+except ImportError:
+    from backend.autoencoder_models import load_autoencoder, AUTOENCODER_BACKEND
+
+# Import de la journalisation structurée (file non bloquante, JSON, ID de corrélation)
+try:
+    from structured_logging import get_logger, request_id_var, new_request_id, dropped_records, REQUEST_ID_HEADER
+except ImportError:
+    from backend.structured_logging import get_logger, request_id_var, new_request_id, dropped_records, REQUEST_ID_HEADER
+
+logger = get_logger('api')
+
+# Import de l'instrumentation (durées par étape, compteurs, GET /metrics)
+try:
+    import metrics
+    from metrics import stage_timer, observe_stage
+except ImportError:
+    from backend import metrics
+    from backend.metrics import stage_timer, observe_stage
+
+# Import du profilage à la demande (en-tête X-Profile)
+try:
+    import request_profiler
+    from request_profiler import profile_store
+except ImportError:
+    from backend import request_profiler
+    from backend.request_profiler import profile_store
+
+# Import de l'ingestion de flux caméra (RTSP / fichiers, dernière frame gagnante)
+try:
+    from stream_ingest import StreamIngestService, parse_sources, STREAM_SOURCES
+except ImportError:
+    from backend.stream_ingest import StreamIngestService, parse_sources, STREAM_SOURCES
+
+# Import de l'ordonnanceur multi-caméras (forwards batchés sur le modèle partagé)
+try:
+    from inference_scheduler import InferenceScheduler, priority_weight, STREAM_BATCHING
+except ImportError:
+    from backend.inference_scheduler import InferenceScheduler, priority_weight, STREAM_BATCHING
+
+try:
+    from track_smoothing import BBoxSmoother, bbox_array, bbox_dicts, BBOX_SMOOTHING
+except ImportError:
+    from backend.track_smoothing import BBoxSmoother, bbox_array, bbox_dicts, BBOX_SMOOTHING
+
+try:
+    from video_decoding import open_video
+except ImportError:
+    from backend.video_decoding import open_video
+
+try:
+    from keyframe_tracking import BoxPropagator, VIDEO_KEYFRAME_PROPAGATION
+except ImportError:
+    from backend.keyframe_tracking import BoxPropagator, VIDEO_KEYFRAME_PROPAGATION
+
+try:
+    from track_events import TrackEventAggregator, event_frames, TRACK_THUMBNAIL_SIZE, VIDEO_PERSIST_MODE
+except ImportError:
+    from backend.track_events import TrackEventAggregator, event_frames, TRACK_THUMBNAIL_SIZE, VIDEO_PERSIST_MODE
+
+# Import des empreintes de contenu (sauvegardes idempotentes, analyses déjà faites réutilisées)
+try:
+    from content_hash import content_hash, model_fingerprint, recent_results, DEDUP_ENABLED
+    import detection_schema
+except ImportError:
+    from backend.content_hash import content_hash, model_fingerprint, recent_results, DEDUP_ENABLED
+    from backend import detection_schema
+
+# Import du backend de stockage (MongoDB par défaut, SQLite avec STORAGE_BACKEND=sqlite)
+# Le nom `mongodb_service` est conservé : il désigne le backend configuré, quel qu'il soit
 MONGODB_AVAILABLE = False
 mongodb_service = None
 
 print("=" * 60)
-print("🔌 INITIALISATION MONGODB")
+print("🔌 INITIALISATION DU STOCKAGE")
 print("=" * 60)
 
 try:
     # Essayer d'abord avec import relatif (si on est dans le dossier backend)
     try:
-        print("📦 Tentative d'import: from mongodb_service import mongodb_service")
-        from mongodb_service import mongodb_service
-        print("✅ Import réussi avec import relatif")
-    except ImportError as e1:
-        print(f"⚠️ Import relatif échoué: {e1}")
+        from storage_backends import (create_storage_backend, STORAGE_BACKEND,
+                                      rebuild_allowed, REBUILD_TOKEN_HEADER)
+    except ImportError:
         # Sinon essayer avec backend. (si on est à la racine)
-        try:
-            print("📦 Tentative d'import: from backend.mongodb_service import mongodb_service")
-            from backend.mongodb_service import mongodb_service
-            print("✅ Import réussi avec import absolu")
-        except ImportError as e2:
-            print(f"❌ Import absolu échoué: {e2}")
-            raise ImportError(f"Impossible d'importer mongodb_service. Erreurs: {e1}, {e2}")
+        from backend.storage_backends import (create_storage_backend, STORAGE_BACKEND,
+                                              rebuild_allowed, REBUILD_TOKEN_HEADER)
+    print(f"📦 Backend de stockage: {STORAGE_BACKEND}")
+    mongodb_service = create_storage_backend(STORAGE_BACKEND)
     
     # Le service est disponible même si pas connecté (on pourra reconnecter plus tard)
     if mongodb_service:
@@ -80,6 +170,52 @@ except Exception as e:
     traceback.print_exc()
     mongodb_service = None
 
+# File d'écriture différée : les requêtes n'attendent plus MongoDB
+persistence_queue = None
+if MONGODB_AVAILABLE and mongodb_service:
+    try:
+        from persistence_queue import PersistenceQueue, PERSISTENCE_WRITE_BEHIND
+    except ImportError:
+        from backend.persistence_queue import PersistenceQueue, PERSISTENCE_WRITE_BEHIND
+    if PERSISTENCE_WRITE_BEHIND:
+        persistence_queue = PersistenceQueue(mongodb_service)
+        persistence_queue.start()
+        print(f"✅ Écriture MongoDB différée activée (file: {persistence_queue.queue.maxsize}, lots: {persistence_queue.batch_size})")
+
+# Requêtes sur l'historique (filtres + pagination par curseur) et export en flux
+detection_query = None
+detection_export = None
+if MONGODB_AVAILABLE and mongodb_service:
+    try:
+        import detection_query
+        import detection_export
+    except ImportError:
+        from backend import detection_query, detection_export
+
+# Jauges évaluées à chaque lecture de GET /metrics
+metrics.registry.gauge(
+    'fod_storage_connected', 'Stockage des détections joignable (1) ou non (0)',
+    callback=lambda: int(bool(mongodb_service is not None and mongodb_service.is_connected()))
+)
+metrics.registry.gauge(
+    'fod_dedup_cache_entries', 'Résultats récents gardés en mémoire pour la déduplication',
+    callback=lambda: len(recent_results)
+)
+metrics.registry.gauge(
+    'fod_log_records_dropped', 'Lignes de log abandonnées (file de journalisation pleine)',
+    callback=dropped_records
+)
+if persistence_queue is not None:
+    metrics.registry.gauge(
+        'fod_persistence_queue_depth', "Sauvegardes en attente dans la file d'écriture différée",
+        callback=persistence_queue.queue.qsize
+    )
+    metrics.registry.gauge(
+        'fod_persistence_events', "Compteurs de la file d'écriture différée (écrits, réessais, déversés...)", ('event',),
+        callback=lambda: {(key,): value for key, value in persistence_queue.stats().items()
+                          if isinstance(value, (int, float)) and not isinstance(value, bool)}
+    )
+
 print("=" * 60)
 
 # Import supervision pour DetectionsSmoother et MaskAnnotator
@@ -126,6 +262,9 @@ AUTOENCODER_PATH = Path(__file__).parent / "autoencoder_fod.pth"
 # Chemin vers le modèle ONNX
 ONNX_MODEL_PATH = Path(__file__).parent / "best.onnx"
 
+# Version des poids (clé des empreintes de déduplication)
+MODEL_VERSION = model_fingerprint(MODEL_PATH)
+
 # Variable globale pour le type de modèle actuel ('yolo' ou 'onnx')
 current_model_type = 'yolo'  # Par défaut: YOLO
 onnx_session = None
@@ -150,6 +289,10 @@ else:
     print(f"⚠️  GPU non disponible - utilisation du CPU (plus lent)")
 print(f"⚡ Device par défaut: {device_info}")
 
+yolo_backend = None
+# Le modèle ultralytics n'est pas thread-safe : un seul forward à la fois (requêtes HTTP,
+# détection vidéo et ordonnanceur des flux caméra partagent ce verrou)
+inference_lock = threading.Lock()
 if not MODEL_PATH.exists():
     print(f"❌ ERREUR: Le fichier modèle n'existe pas à: {MODEL_PATH}")
     print("Veuillez vérifier le chemin du modèle dans app.py")
@@ -170,13 +313,25 @@ else:
         # Restaurer le torch.load original
         torch.load = original_load
         
+        # Format mémoire channels-last si la politique de précision le demande
+        model.model = precision_policy.prepare_module(model.model)
+        
         print("✅ Modèle chargé avec succès!")
         print(f"📊 Classes détectables: {list(model.names.values())}")
+        print(f"🎚️  Précision d'inférence: {precision_policy.describe('cuda' if torch.cuda.is_available() else 'cpu')}")
+        
+        # Backend compilé + préchauffage : la première requête coûte autant qu'une requête normale
+        yolo_backend = YOLOInferenceBackend(model, MODEL_PATH)
+        if YOLO_WARMUP:
+            device_warmup = 'cuda' if torch.cuda.is_available() else 'cpu'
+            with precision_policy.context(device_warmup):
+                yolo_backend.warmup(device_warmup, extra_kwargs=precision_policy.yolo_kwargs(device_warmup))
     except Exception as e:
         print(f"❌ Erreur lors du chargement du modèle: {e}")
         import traceback
         traceback.print_exc()
         model = None
+        yolo_backend = None
 
 print("=" * 60)
 
@@ -197,6 +352,7 @@ if SAM_AVAILABLE:
         else:
             print("⏳ Chargement du modèle SAM...")
             sam_model = sam_model_registry["vit_b"](checkpoint=str(SAM_CHECKPOINT_PATH))
+            sam_model = precision_policy.prepare_module(sam_model)
             sam_predictor = SamPredictor(sam_model)
             print("✅ Modèle SAM chargé avec succès!")
     except Exception as e:
@@ -214,32 +370,16 @@ if AUTOENCODER_PATH.exists():
         print("⏳ Chargement du modèle auto-encoder pour détection d'anomalies...")
         device_ae = 'cuda' if torch.cuda.is_available() else 'cpu'
         
-        # Charger le checkpoint
-        checkpoint = torch.load(str(AUTOENCODER_PATH), map_location=device_ae, weights_only=False)
-        
-        # Gérer différents formats de sauvegarde
-        if isinstance(checkpoint, dict):
-            if 'model' in checkpoint:
-                autoencoder_model = checkpoint['model']
-            elif 'state_dict' in checkpoint:
-                # Si seulement state_dict, on stocke le checkpoint pour utilisation ultérieure
-                autoencoder_model = checkpoint
-            else:
-                autoencoder_model = checkpoint
-        else:
-            autoencoder_model = checkpoint
-        
-        # Mettre en mode évaluation si c'est un modèle
-        if isinstance(autoencoder_model, torch.nn.Module):
-            autoencoder_model.eval()
-            autoencoder_model = autoencoder_model.to(device_ae)
-        elif isinstance(autoencoder_model, dict) and 'model' in autoencoder_model:
-            if isinstance(autoencoder_model['model'], torch.nn.Module):
-                autoencoder_model['model'].eval()
-                autoencoder_model['model'] = autoencoder_model['model'].to(device_ae)
+        # Charger le checkpoint (un state_dict seul est reconstruit via le manifeste d'architecture)
+        autoencoder_model, autoencoder_manifest = load_autoencoder(AUTOENCODER_PATH, device=device_ae)
+        autoencoder_model = precision_policy.prepare_module(autoencoder_model)
+        if 'input_size' in autoencoder_manifest:
+            anomaly_gate.input_size = int(autoencoder_manifest['input_size'])
         
         AUTOENCODER_AVAILABLE = True
-        print(f"✅ Modèle auto-encoder chargé avec succès sur {device_ae.upper()}")
+        print(f"✅ Modèle auto-encoder chargé avec succès sur {device_ae.upper()} ({AUTOENCODER_BACKEND})")
+        if autoencoder_manifest:
+            print(f"   Architecture: {autoencoder_manifest.get('architecture', 'inconnue')}")
     except Exception as e:
         print(f"⚠️ Erreur lors du chargement de l'auto-encoder: {e}")
         import traceback
@@ -256,73 +396,7 @@ print("=" * 60)
 if SUPERVISION_AVAILABLE:
     print("✅ Supervision disponible - utilisation de DetectionsSmoother professionnel")
 else:
-    print("⚠️ Supervision non disponible - utilisation du smoother personnalisé")
-    class BBoxSmoother:
-        """
-        Smoother pour réduire le jitter des bounding boxes avec tracking
-        Utilise un filtre exponentiel pour lisser les positions
-        """
-        def __init__(self, alpha=0.7, max_age=5):
-            """
-            alpha: facteur de lissage (0-1), plus proche de 1 = moins de lissage
-            max_age: nombre de frames sans détection avant suppression
-            """
-            self.alpha = alpha
-            self.max_age = max_age
-            self.tracks = {}  # {track_id: {'bbox': [...], 'age': 0, 'last_frame': 0}}
-        
-        def update(self, track_id, bbox, frame_number):
-            """
-            Met à jour ou crée une track avec lissage
-            bbox: {'x': float, 'y': float, 'width': float, 'height': float}
-            """
-            if track_id not in self.tracks:
-                # Nouvelle détection
-                self.tracks[track_id] = {
-                    'bbox': bbox.copy(),
-                    'age': 0,
-                    'last_frame': frame_number
-                }
-                return bbox.copy()
-            else:
-                # Mise à jour avec lissage exponentiel
-                old_bbox = self.tracks[track_id]['bbox']
-                smoothed_bbox = {
-                    'x': self.alpha * bbox['x'] + (1 - self.alpha) * old_bbox['x'],
-                    'y': self.alpha * bbox['y'] + (1 - self.alpha) * old_bbox['y'],
-                    'width': self.alpha * bbox['width'] + (1 - self.alpha) * old_bbox['width'],
-                    'height': self.alpha * bbox['height'] + (1 - self.alpha) * old_bbox['height']
-                }
-                self.tracks[track_id]['bbox'] = smoothed_bbox
-                self.tracks[track_id]['age'] = 0
-                self.tracks[track_id]['last_frame'] = frame_number
-                return smoothed_bbox
-        
-        def get_active_tracks(self, current_frame):
-            """
-            Retourne les tracks actives (non expirées)
-            """
-            active = {}
-            for track_id, track_data in self.tracks.items():
-                frames_since_last = current_frame - track_data['last_frame']
-                if frames_since_last <= self.max_age:
-                    active[track_id] = track_data
-            return active
-        
-        def cleanup(self, current_frame):
-            """
-            Supprime les tracks expirées
-            """
-            expired = []
-            for track_id, track_data in self.tracks.items():
-                frames_since_last = current_frame - track_data['last_frame']
-                if frames_since_last > self.max_age:
-                    expired.append(track_id)
-            
-            for track_id in expired:
-                del self.tracks[track_id]
-            
-            return len(expired)
+    print(f"⚠️ Supervision non disponible - utilisation du smoother personnalisé ({BBOX_SMOOTHING})")
 
 def calculate_real_size(bbox_width_px: float, bbox_height_px: float, img_width: int, img_height: int, mask_area_px: float = None) -> float:
     """
@@ -452,21 +526,23 @@ def detect_with_onnx(img_array, onnx_session, conf_threshold=0.2, imgsz=640):
         import onnxruntime as ort
         
         # Préparer l'image
-        img_resized = cv2.resize(img_array, (imgsz, imgsz))
-        img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
-        
-        # Normaliser [0, 255] -> [0, 1]
-        img_normalized = img_rgb.astype(np.float32) / 255.0
-        
-        # Convertir en tensor: (H, W, C) -> (1, C, H, W)
-        img_tensor = img_normalized.transpose(2, 0, 1)[np.newaxis, ...]
+        with stage_timer('preprocess'):
+            img_resized = cv2.resize(img_array, (imgsz, imgsz))
+            img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
+            
+            # Normaliser [0, 255] -> [0, 1]
+            img_normalized = img_rgb.astype(np.float32) / 255.0
+            
+            # Convertir en tensor: (H, W, C) -> (1, C, H, W)
+            img_tensor = img_normalized.transpose(2, 0, 1)[np.newaxis, ...]
         
         # Obtenir les noms d'entrée et de sortie
         input_name = onnx_session.get_inputs()[0].name
         output_name = onnx_session.get_outputs()[0].name
         
         # Inférence
-        outputs = onnx_session.run([output_name], {input_name: img_tensor})
+        with stage_timer('onnx_forward'):
+            outputs = onnx_session.run([output_name], {input_name: img_tensor})
         output = outputs[0]  # Shape: (1, num_detections, 85) ou similaire
         
         # Parser les résultats ONNX (format peut varier selon le modèle)
@@ -516,9 +592,7 @@ def detect_with_onnx(img_array, onnx_session, conf_threshold=0.2, imgsz=640):
         return [MockResult(detections_list)]
     
     except Exception as e:
-        print(f"⚠️ Erreur détection ONNX: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Erreur détection ONNX: %s", e)
         return []
 
 def detect_anomaly_with_autoencoder(img_array, autoencoder_model, device='cpu', threshold=0.1):
@@ -535,37 +609,33 @@ def detect_anomaly_with_autoencoder(img_array, autoencoder_model, device='cpu',
         dict avec 'is_anomaly' (bool), 'reconstruction_error' (float), 'anomaly_score' (float)
     """
     try:
-        # Préparer l'image pour l'auto-encoder
-        # Redimensionner à 224x224 (taille standard) ou utiliser la taille du modèle
-        img_resized = cv2.resize(img_array, (224, 224))
+        # Obtenir le modèle réel AVANT tout prétraitement (évite un resize/upload inutile)
+        model = resolve_autoencoder(autoencoder_model)
+        if model is None:
+            return {
+                'is_anomaly': False,
+                'reconstruction_error': 0.0,
+                'anomaly_score': 0.0,
+                'error': 'Auto-encoder sans architecture exploitable'
+            }
+        
+        # Préparer l'image pour l'auto-encoder (taille d'entrée issue du manifeste)
+        input_size = anomaly_gate.input_size
+        img_resized = cv2.resize(img_array, (input_size, input_size))
         
         # Normaliser [0, 255] -> [0, 1]
         img_normalized = img_resized.astype(np.float32) / 255.0
         
         # Convertir en tensor: (H, W, C) -> (1, C, H, W)
-        img_tensor = torch.from_numpy(img_normalized).permute(2, 0, 1).unsqueeze(0).to(device)
-        
-        # Obtenir le modèle réel
-        model = autoencoder_model
-        if isinstance(autoencoder_model, dict):
-            if 'model' in autoencoder_model:
-                model = autoencoder_model['model']
-            elif 'state_dict' in autoencoder_model:
-                # Si seulement state_dict, on ne peut pas faire d'inférence directement
-                return {
-                    'is_anomaly': False,
-                    'reconstruction_error': 0.0,
-                    'anomaly_score': 0.0,
-                    'error': 'Modèle avec seulement state_dict - architecture nécessaire'
-                }
+        img_tensor = precision_policy.prepare_input(torch.from_numpy(img_normalized).permute(2, 0, 1).unsqueeze(0).to(device))
         
-        # Inférence avec l'auto-encoder
-        with torch.no_grad():
+        # Inférence avec l'auto-encoder (précision selon la politique)
+        with precision_policy.context(device):
             # Reconstruire l'image
             reconstructed = model(img_tensor)
             
             # Calculer l'erreur de reconstruction (MSE)
-            mse = torch.nn.functional.mse_loss(img_tensor, reconstructed)
+            mse = torch.nn.functional.mse_loss(img_tensor, reconstructed.float())
             reconstruction_error = mse.item()
             
             # Normaliser le score d'anomalie (0-1)
@@ -579,9 +649,7 @@ def detect_anomaly_with_autoencoder(img_array, autoencoder_model, device='cpu',
         }
     
     except Exception as e:
-        print(f"⚠️ Erreur lors de la détection d'anomalie: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Erreur lors de la détection d'anomalie: %s", e)
         return {
             'is_anomaly': False,
             'reconstruction_error': 0.0,
@@ -618,7 +686,12 @@ def health():
         'sam_available': sam_predictor is not None,
         'autoencoder_available': AUTOENCODER_AVAILABLE,
         'current_model_type': current_model_type,
-        'onnx_available': ONNX_MODEL_PATH.exists()
+        'onnx_available': ONNX_MODEL_PATH.exists(),
+        'precision': precision_policy.describe('cuda' if torch.cuda.is_available() else 'cpu'),
+        'yolo_backend': yolo_backend.describe() if yolo_backend is not None else None,
+        'persistence': persistence_queue.stats() if persistence_queue is not None else None,
+        'storage_backend': mongodb_service.name if mongodb_service is not None else None,
+        'mongodb': mongodb_service.health() if mongodb_service is not None else None
     })
 
 @app.route('/api/model/switch', methods=['POST', 'OPTIONS'])
@@ -672,7 +745,169 @@ def get_current_model():
         'onnx_available': ONNX_MODEL_PATH.exists()
     })
 
+def form_int(name, default):
+    """
+    Entier du champ FormData `name` (default si absent ou vide)
+
+    Raises:
+        ValueError: Valeur non entière (message destiné à une réponse 400)
+    """
+    raw = request.form.get(name, '').strip()
+    if not raw:
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValueError(f"Champ '{name}' invalide : entier attendu (reçu '{raw}')") from None
+
+def requested_imgsz(default):
+    """Taille d'entrée demandée par le champ FormData 'imgsz' (multiple de 32, bornée à [160, 1280])"""
+    value = form_int('imgsz', default)
+    return min(1280, max(160, round(value / 32) * 32))
+
+def inference_fingerprint(media_bytes, media_type, camera_id, use_gate, params):
+    """
+    Empreinte de déduplication d'une requête de détection
+
+    Args:
+        media_bytes: Octets du fichier reçu
+        media_type: 'image' ou 'video'
+        camera_id: Caméra (métadonnée enregistrée avec le résultat)
+        use_gate: Pré-filtre auto-encoder actif (son seuil influe sur le résultat)
+        params: Paramètres d'inférence propres à l'endpoint (seuils, taille d'entrée...)
+
+    Returns:
+        Empreinte hexadécimale, ou None si la déduplication est désactivée
+    """
+    if not (DEDUP_ENABLED and MONGODB_AVAILABLE and mongodb_service):
+        return None
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    onnx = media_type == 'image' and current_model_type == 'onnx'
+    model_version = model_fingerprint(ONNX_MODEL_PATH) if onnx else MODEL_VERSION
+    return content_hash(media_bytes, model_version, {
+        **params,
+        'mediaType': media_type,
+        'device': device,
+        'precision': precision_policy.describe(device),
+        'cameraId': camera_id,
+        'gateThreshold': anomaly_gate.get_threshold(camera_id) if use_gate else None
+    })
+
+def find_stored_result(media_hash, media_type, output='frames'):
+    """
+    Analyse déjà enregistrée pour cette empreinte
+
+    Args:
+        media_hash: Empreinte calculée par inference_fingerprint
+        media_type: 'image' ou 'video'
+        output: Vidéo : 'frames' (détections par frame + événements) ou 'events' (événements seuls)
+
+    Returns:
+        (mongoId, réponse JSON) ou None s'il faut (re)lancer l'inférence
+    """
+    cached = recent_results.get(media_hash)
+    if cached is not None and cached[1] is not None:
+        metrics.DEDUP_HITS.inc(media_type=media_type, source='memory')
+        return cached
+    try:
+        document = mongodb_service.find_by_content_hash(media_hash)
+    except Exception as e:
+        logger.warning("Recherche d'empreinte impossible: %s", e)
+        return None
+    if document is None:
+        return None
+
+    mongo_id = str(document['_id'])
+    metadata = document.get('metadata') or {}
+    response = {
+        'hasDangerAlert': document.get('has_danger_alert', False),
+        'maxAlertLevel': document.get('max_alert_level', 1)
+    }
+    if media_type == 'image':
+        # Les masques de segmentation ne sont pas stockés : seules les boîtes sont renvoyées
+        detections = document.get('detections', [])
+        response.update({'detections': detections, 'count': len(detections), 'gated': metadata.get('gated', False)})
+        metrics.DEDUP_HITS.inc(media_type=media_type, source='storage')
+        return mongo_id, response
+
+    events_only = metadata.get('result_mode') == 'events'
+    if events_only and output != 'events':
+        # Run enregistré en événements : les détections par frame ne sont pas reconstructibles
+        return None
+    raw_detections = mongodb_service.get_video_detections(mongo_id)
+    if document.get('detection_count', 0) and not raw_detections:
+        # Détections brutes expirées (rétention) : libérer l'empreinte et refaire l'analyse
+        mongodb_service.release_content_hash(mongo_id)
+        recent_results.discard(media_hash)
+        return None
+    video_info = document.get('video_info') or {}
+    fps = video_info.get('fps') or 0
+    by_frame = {}
+    for det in raw_detections:
+        frame_number = det.pop('frame_number', None)
+        frame_time = det.pop('frame_time', 0)
+        for key in ('_id', 'run_id', 'timestamp', 'meta'):
+            det.pop(key, None)
+        by_frame.setdefault(frame_number, (frame_time, []))[1].append(det)
+    if events_only:
+        # Événements reconstruits depuis les frame_number enregistrés
+        events = [event for frame_idx in sorted(by_frame) for event in by_frame[frame_idx][1]]
+        frames = []
+    else:
+        # Seules les frames enregistrées (avec détections), comme les frames traitées d'une analyse
+        frames = [
+            {'frame': frame_idx, 'time': frame_time, 'detections': frame_dets, 'count': len(frame_dets)}
+            for frame_idx, (frame_time, frame_dets) in sorted(by_frame.items())
+        ]
+        # Run enregistré par frame : événements recalculés (sans vignettes)
+        aggregator = TrackEventAggregator()
+        for frame in frames:
+            aggregator.update(frame['frame'], frame['time'], frame['detections'])
+        events = aggregator.finish()
+        if output == 'events':
+            frames = []
+    response.update({
+        'frames': frames,
+        'events': events,
+        'totalFrames': video_info.get('totalFrames', document.get('total_frames', 0)),
+        'processedFrames': video_info.get('processedFrames', 0),
+        'fps': fps,
+        'duration': video_info.get('duration', 0),
+        'uniqueTracks': metadata.get('unique_tracks', document.get('track_count', 0)),
+        'gatedFrames': metadata.get('gated_frames', 0),
+        'propagatedFrames': video_info.get('propagatedFrames', 0)
+    })
+    metrics.DEDUP_HITS.inc(media_type=media_type, source='storage')
+    return mongo_id, response
+
+def profile_if_requested(view):
+    """
+    Profiler la vue si la requête porte l'en-tête X-Profile (ou ?profile=1)
+
+    L'ID du rapport est renvoyé dans l'en-tête X-Profile-Id (voir GET /api/profiles/<id>).
+    Sans l'en-tête, la vue est appelée directement.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method == 'OPTIONS' or not request_profiler.profiling_requested(
+                request.headers.get(request_profiler.PROFILE_HEADER), request.args.get('profile')):
+            return view(*args, **kwargs)
+        session = request_profiler.start_profile(request.endpoint, getattr(g, 'request_id', None))
+        if session is None:
+            response = make_response(view(*args, **kwargs))
+            response.headers[request_profiler.PROFILE_STATUS_HEADER] = 'busy'
+            return response
+        try:
+            response = make_response(view(*args, **kwargs))
+        finally:
+            profile_id = session.stop()
+        response.headers[request_profiler.PROFILE_ID_HEADER] = profile_id
+        logger.info("Profil enregistré", extra={'profile_id': profile_id, 'endpoint': request.endpoint})
+        return response
+    return wrapper
+
 @app.route('/api/detect', methods=['POST', 'OPTIONS'])
+@profile_if_requested
 def detect():
     """Endpoint pour la détection d'objets sur une image"""
     global current_model_type, onnx_session
@@ -695,6 +930,11 @@ def detect():
             'error': 'Aucune image fournie'
         }), 400
     
+    try:
+        imgsz = requested_imgsz(640)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     try:
         # Récupérer l'image
         file = request.files['image']
@@ -703,49 +943,70 @@ def detect():
                 'error': 'Fichier vide'
             }), 400
         
-        print(f"\n📥 Réception d'une image: {file.filename}")
-        
         # Lire l'image
         image_bytes = file.read()
-        image_size_mb = len(image_bytes) / (1024 * 1024)
-        print(f"📊 Taille de l'image: {image_size_mb:.2f} MB")
-        
-        image = Image.open(io.BytesIO(image_bytes))
-        print(f"🖼️  Dimensions: {image.size[0]}x{image.size[1]} pixels")
         
-        # Convertir en RGB si nécessaire
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Convertir en numpy array
-        img_array = np.array(image)
+        with stage_timer('decode'):
+            image = Image.open(io.BytesIO(image_bytes))
+            
+            # Convertir en RGB si nécessaire
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            
+            # Convertir en numpy array
+            img_array = np.array(image)
         img_height, img_width = img_array.shape[:2]
-        print(f"📐 Dimensions de l'image numpy: {img_width}x{img_height}")
+        logger.info("Image reçue", extra={'media_filename': file.filename, 'bytes': len(image_bytes),
+                                          'width': img_width, 'height': img_height})
         
         # Effectuer la détection avec le modèle sélectionné
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
         conf_threshold = 0.2
         
-        if current_model_type == 'onnx' and onnx_session is not None:
-            print("🔍 Démarrage de la détection ONNX...")
-            print(f"⚡ Device utilisé: {device.upper()}")
-            print(f"📊 Seuil de confiance utilisé: {conf_threshold}")
-            results = detect_with_onnx(img_array, onnx_session, conf_threshold=conf_threshold, imgsz=640)
+        # Cascade optionnelle : l'auto-encoder filtre l'image avant YOLO/SAM
+        camera_id = request.form.get('cameraId', 'default')
+        use_gate = AUTOENCODER_AVAILABLE and (
+            AUTOENCODER_GATE or request.form.get('aeGate', '').lower() == 'true'
+        )
+        
+        # Même image, même modèle, mêmes paramètres : réutiliser l'analyse déjà enregistrée
+        media_hash = inference_fingerprint(image_bytes, 'image', camera_id, use_gate, {
+            'model': current_model_type,
+            'conf': conf_threshold,
+            'imgsz': imgsz,
+            'sam': sam_predictor is not None
+        })
+        if media_hash is not None:
+            with stage_timer('dedup_lookup'):
+                stored = find_stored_result(media_hash, 'image')
+            if stored is not None:
+                mongo_id, response = stored
+                logger.info("Image déjà analysée, inférence et sauvegarde ignorées", extra={'mongo_id': mongo_id})
+                return jsonify({**response, 'mongoId': mongo_id, 'contentHash': media_hash, 'duplicate': True})
+        
+        anomaly_result = None
+        gated = False
+        if use_gate:
+            with stage_timer('anomaly_gate'):
+                anomaly_result = anomaly_gate.check(img_array, autoencoder_model, device=device, camera_id=camera_id)
+            gated = 'error' not in anomaly_result and not anomaly_result['is_anomaly']
+            if 'error' not in anomaly_result:
+                logger.debug("Pré-filtre auto-encoder: erreur max %.4f (seuil %.4f) -> %s",
+                             anomaly_result['max_error'], anomaly_result['threshold'],
+                             'image propre, YOLO/SAM ignorés' if gated else 'anomalie, passage à YOLO')
+        
+        if gated:
+            results = []
+        elif current_model_type == 'onnx' and onnx_session is not None:
+            logger.debug("Détection ONNX (device %s, seuil %.2f)", device, conf_threshold)
+            results = detect_with_onnx(img_array, onnx_session, conf_threshold=conf_threshold, imgsz=imgsz)
         else:
-            print("🔍 Démarrage de la détection YOLOv8...")
-            print(f"⚡ Device utilisé: {device.upper()}")
-            print(f"📊 Seuil de confiance utilisé: {conf_threshold}")
+            logger.debug("Détection YOLOv8 (device %s, seuil %.2f)", device, conf_threshold)
             # YOLOv8 retourne les coordonnées dans le système de l'image originale
-            results = model(img_array, conf=conf_threshold, imgsz=640, device=device)
-        
-        # Configurer SAM avec l'image UNE SEULE FOIS (optimisation)
-        if sam_predictor is not None:
-            print("🎨 Configuration de SAM pour la segmentation...")
-            img_rgb = img_array.copy()
-            sam_predictor.set_image(img_rgb)
+            with inference_lock, stage_timer('yolo_forward'), precision_policy.context(device):
+                results = yolo_backend(img_array, conf=conf_threshold, imgsz=imgsz, device=device, **precision_policy.yolo_kwargs(device))
         
         # Parser les résultats
-        print("📋 Analyse des résultats...")
         detections = []
         
         # Vérifier si des résultats ont été trouvés
@@ -754,12 +1015,46 @@ def detect():
             if result.boxes is not None:
                 total_boxes += len(result.boxes)
         
-        print(f"📊 Nombre de détections brutes trouvées: {total_boxes}")
+        logger.debug("Détections brutes: %d", total_boxes)
         
-        # Si YOLO ne trouve rien, afficher "Anomalie détectée"
-        if total_boxes == 0:
-            print("⚠️ Aucune détection YOLO trouvée")
-            print("🚨 ANOMALIE DÉTECTÉE")
+        # Configurer SAM avec l'image UNE SEULE FOIS (optimisation), seulement s'il y a des boxes
+        if sam_predictor is not None and total_boxes > 0:
+            img_rgb = img_array.copy()
+            with stage_timer('sam_set_image'), precision_policy.context(device):
+                sam_predictor.set_image(img_rgb)
+            # Embeddings en FP32 : predict() tourne hors autocast (ses sorties passent par .numpy())
+            sam_predictor.features = sam_predictor.features.float()
+        
+        # Si YOLO ne trouve rien, utiliser les boîtes candidates de l'auto-encoder
+        if total_boxes == 0 and AUTOENCODER_AVAILABLE:
+            if anomaly_result is None:
+                with stage_timer('anomaly_gate'):
+                    anomaly_result = anomaly_gate.check(img_array, autoencoder_model, device=device, camera_id=camera_id)
+        
+        if total_boxes == 0 and anomaly_result is not None and 'error' not in anomaly_result:
+            threshold = anomaly_result['threshold']
+            for k, candidate in enumerate(anomaly_result['boxes']):
+                detections.append({
+                    'id': f'anomaly_{k}',
+                    'label': 'Anomalie',
+                    'confidence': min(1.0, candidate['score'] / (2 * threshold)) if threshold > 0 else 0.5,
+                    'riskLevel': 'Low',
+                    'alertLevel': 1,
+                    'alertType': 'NORMAL',
+                    'sizeMeters': 0.0,
+                    'sizeCm': 0.0,
+                    'position': format_position(candidate['xyxy'], img_width, img_height),
+                    'bbox': candidate['bbox'],
+                    'hasSegmentation': False,
+                    'segmentationMask': None,
+                    'isAnomaly': True,
+                    'reconstructionError': candidate['score']
+                })
+            if detections:
+                logger.info("Anomalie détectée par l'auto-encoder", extra={'zones': len(detections)})
+        elif total_boxes == 0:
+            # Pas d'auto-encoder exploitable : ancien comportement (détection "Anomalie" générique)
+            logger.info("Aucune détection YOLO, anomalie générique signalée")
             
             # Créer une détection d'anomalie (sans alerte, juste "Anomalie")
             anomaly_detection_obj = {
@@ -779,6 +1074,9 @@ def detect():
             }
             detections.append(anomaly_detection_obj)
         
+        # Post-traitement = boucle de parsing hors SAM predict / encodage des masques (mesurés à part)
+        postprocess_start = time.perf_counter()
+        sam_seconds = 0.0
         for idx, result in enumerate(results):
             boxes = result.boxes
             if boxes is None or len(boxes) == 0:
@@ -786,7 +1084,7 @@ def detect():
             for i, box in enumerate(boxes):
                 # Coordonnées de la bounding box (x1, y1, x2, y2)
                 # YOLOv8 retourne les coordonnées dans le système de l'image d'entrée
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+                x1, y1, x2, y2 = box.xyxy[0].float().cpu().numpy()
                 
                 # Vérifier que les coordonnées sont dans les limites
                 x1 = max(0, min(x1, img_width))
@@ -795,10 +1093,10 @@ def detect():
                 y2 = max(y1, min(y2, img_height))
                 
                 # Confiance
-                confidence = float(box.conf[0].cpu().numpy())
+                confidence = float(box.conf[0].float().cpu().numpy())
                 
                 # Classe
-                class_id = int(box.cls[0].cpu().numpy())
+                class_id = int(box.cls[0].float().cpu().numpy())
                 # Utiliser les noms de classes du modèle YOLO (même si on utilise ONNX)
                 if model is not None and hasattr(model, 'names'):
                     class_name = model.names[class_id]
@@ -833,10 +1131,12 @@ def detect():
                         box_sam = np.array([x1, y1, x2, y2])
                         
                         # Prédire le masque (SAM est déjà configuré avec l'image)
-                        masks, scores, logits = sam_predictor.predict(
-                            box=box_sam,
-                            multimask_output=False
-                        )
+                        with stage_timer('sam_predict') as sam_timer, torch.inference_mode():
+                            masks, scores, logits = sam_predictor.predict(
+                                box=box_sam,
+                                multimask_output=False
+                            )
+                        sam_seconds += sam_timer.elapsed
                         
                         if len(masks) > 0:
                             mask = masks[0]  # Masque complet de l'image (img_height x img_width)
@@ -863,7 +1163,7 @@ def detect():
                             
                             # Vérifier que la taille correspond
                             if mask_region.shape[0] != bbox_h or mask_region.shape[1] != bbox_w:
-                                print(f"⚠️  Taille du masque incompatible: {mask_region.shape} vs ({bbox_h}, {bbox_w})")
+                                logger.debug("Taille du masque incompatible: %s vs (%d, %d)", mask_region.shape, bbox_h, bbox_w)
                                 mask_region = mask[y1_int:y2_int, x1_int:x2_int].copy()
                             
                             # Calculer la taille AVANT d'utiliser risk_info pour les couleurs
@@ -878,34 +1178,37 @@ def detect():
                             else:
                                 color_rgba = [0, 255, 0, 102]  # Vert
                             
-                            # Créer un masque RGBA pour la région de la bounding box
-                            seg_mask_rgba = np.zeros((bbox_h, bbox_w, 4), dtype=np.uint8)
-                            
-                            # Appliquer la couleur uniquement là où le masque est True
-                            seg_mask_rgba[mask_region] = color_rgba
-                            
-                            # Ajouter le contour sur le masque
-                            mask_uint8 = mask_region.astype(np.uint8) * 255
-                            contours, _ = cv2.findContours(
-                                mask_uint8, 
-                                cv2.RETR_EXTERNAL, 
-                                cv2.CHAIN_APPROX_SIMPLE
-                            )
-                            # Dessiner le contour en couleur opaque (2px d'épaisseur)
-                            contour_color = tuple(color_rgba[:3]) + (255,)  # Même couleur mais opaque
-                            cv2.drawContours(seg_mask_rgba, contours, -1, contour_color, 2)
-                            
-                            # Convertir en base64 pour l'envoyer au frontend (format PNG avec transparence)
-                            seg_img_pil = Image.fromarray(seg_mask_rgba, 'RGBA')
-                            buffer = io.BytesIO()
-                            seg_img_pil.save(buffer, format='PNG')
-                            mask_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+                            with stage_timer('mask_encode') as mask_timer:
+                                # Créer un masque RGBA pour la région de la bounding box
+                                seg_mask_rgba = np.zeros((bbox_h, bbox_w, 4), dtype=np.uint8)
+                                
+                                # Appliquer la couleur uniquement là où le masque est True
+                                seg_mask_rgba[mask_region] = color_rgba
+                                
+                                # Ajouter le contour sur le masque
+                                mask_uint8 = mask_region.astype(np.uint8) * 255
+                                contours, _ = cv2.findContours(
+                                    mask_uint8, 
+                                    cv2.RETR_EXTERNAL, 
+                                    cv2.CHAIN_APPROX_SIMPLE
+                                )
+                                # Dessiner le contour en couleur opaque (2px d'épaisseur)
+                                contour_color = tuple(color_rgba[:3]) + (255,)  # Même couleur mais opaque
+                                cv2.drawContours(seg_mask_rgba, contours, -1, contour_color, 2)
+                                
+                                # Convertir en base64 pour l'envoyer au frontend (format PNG avec transparence)
+                                seg_img_pil = Image.fromarray(seg_mask_rgba, 'RGBA')
+                                buffer = io.BytesIO()
+                                seg_img_pil.save(buffer, format='PNG')
+                                mask_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+                            sam_seconds += mask_timer.elapsed
                             
-                            print(f"✅ Segmentation créée pour {class_name} (Alerte {risk_info_for_color['level']}) - Box: [{x1_int},{y1_int}→{x2_int},{y2_int}] Masque: {mask_region.shape}")
+                            logger.debug("Segmentation créée pour %s (alerte %d), masque %s",
+                                         class_name, risk_info_for_color['level'], mask_region.shape)
                     except Exception as e:
-                        print(f"⚠️ Erreur lors de la segmentation SAM: {e}")
-                        import traceback
-                        traceback.print_exc()
+                        # Trace complète seulement en DEBUG (évite une trace par box en production)
+                        logger.warning("Segmentation SAM échouée pour %s: %s", class_name, e,
+                                       exc_info=logger.isEnabledFor(logging.DEBUG))
                         segmentation_available = False
                 
                 # Calculer la taille réelle en mètres (utiliser la surface du masque si disponible)
@@ -932,50 +1235,63 @@ def detect():
                 
                 detections.append(detection)
         
+        observe_stage('postprocess', time.perf_counter() - postprocess_start - sam_seconds)
+        metrics.count_detections(detections, 'image')
+        
         # Vérifier s'il y a des alertes de niveau 3 (danger)
         has_danger_alert = any(d.get('alertLevel', 0) == 3 for d in detections)
         max_alert = max([d.get('alertLevel', 1) for d in detections], default=1)
         
-        print(f"✅ Détection terminée: {len(detections)} objet(s) détecté(s)")
         seg_count = sum(1 for d in detections if d.get('hasSegmentation', False))
-        if seg_count > 0:
-            print(f"🎨 Segmentation: {seg_count} objet(s) segmenté(s)")
-        if sam_predictor is None:
-            print("⚠️  SAM non disponible - segmentation désactivée")
-        if has_danger_alert:
-            print("🚨 ALERTE DANGER détectée (Alerte 3)!")
-        elif max_alert == 2:
-            print("⚠️  Alerte Attention détectée (Alerte 2)")
-        else:
-            print("✓ Aucune alerte critique")
+        # Une seule ligne par requête ; les alertes de danger sont remontées en WARNING
+        logger.log(logging.WARNING if has_danger_alert else logging.INFO, "Détection terminée", extra={
+            'detections': len(detections),
+            'segmented': seg_count,
+            'max_alert_level': max_alert,
+            'gated': gated
+        })
         
         # Sauvegarder automatiquement dans MongoDB
         mongo_id = None
         if MONGODB_AVAILABLE and mongodb_service:
-            mongo_id = mongodb_service.save_image_detection(
-                detections=detections,
-                image_filename=file.filename,
-                image_size={'width': img_width, 'height': img_height},
-                metadata={
-                    'has_danger_alert': has_danger_alert,
-                    'max_alert_level': max_alert,
-                    'segmentation_count': seg_count
-                }
-            )
-        
-        return jsonify({
+            # Écriture différée si disponible (ID pré-attribué retourné immédiatement)
+            save_image = persistence_queue.submit_image if persistence_queue else mongodb_service.save_image_detection
+            with stage_timer('persist'):
+                mongo_id = save_image(
+                    detections=detections,
+                    image_filename=file.filename,
+                    image_size={'width': img_width, 'height': img_height},
+                    metadata={
+                        'has_danger_alert': has_danger_alert,
+                        'max_alert_level': max_alert,
+                        'segmentation_count': seg_count,
+                        'camera_id': camera_id,
+                        'gated': gated
+                    },
+                    media_hash=media_hash
+                )
+        
+        response = {
             'detections': detections,
             'count': len(detections),
             'hasDangerAlert': has_danger_alert,
             'maxAlertLevel': max_alert,
-            'mongoId': mongo_id  # ID MongoDB si sauvegardé
-        })
+            'gated': gated  # True si l'auto-encoder a jugé l'image propre (YOLO/SAM ignorés)
+        }
+        if media_hash is not None and mongo_id:
+            recent_results.put(media_hash, mongo_id, response)
+        
+        with stage_timer('serialize'):
+            return jsonify({
+                **response,
+                'mongoId': mongo_id,  # ID MongoDB si sauvegardé
+                'contentHash': media_hash,  # À renvoyer à /api/export-mongodb pour éviter un doublon
+                'duplicate': False
+            })
         
     except Exception as e:
         error_msg = str(e)
-        print(f"❌ Erreur lors de la détection: {error_msg}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Erreur lors de la détection: %s", error_msg)
         return jsonify({
             'error': f'Erreur lors du traitement: {error_msg}',
             'detections': [],
@@ -983,7 +1299,28 @@ def detect():
         }), 500
 
 
+def track_thumbnail(frame_bgr, detection):
+    """Vignette JPEG (base64) de la bbox d'une détection, plus grand côté TRACK_THUMBNAIL_SIZE"""
+    bbox = detection.get('bbox')
+    if not bbox:
+        return None
+    height, width = frame_bgr.shape[:2]
+    x1 = max(0, int(bbox['x'] * width / 100))
+    y1 = max(0, int(bbox['y'] * height / 100))
+    x2 = min(width, int((bbox['x'] + bbox['width']) * width / 100) + 1)
+    y2 = min(height, int((bbox['y'] + bbox['height']) * height / 100) + 1)
+    crop = frame_bgr[y1:y2, x1:x2]
+    if crop.size == 0:
+        return None
+    scale = TRACK_THUMBNAIL_SIZE / max(crop.shape[:2])
+    if scale < 1:
+        crop = cv2.resize(crop, (max(1, round(crop.shape[1] * scale)), max(1, round(crop.shape[0] * scale))),
+                          interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    return base64.b64encode(buffer.tobytes()).decode('ascii') if ok else None
+
 @app.route('/api/detect-video', methods=['POST', 'OPTIONS'])
+@profile_if_requested
 def detect_video():
     """Endpoint pour la détection d'objets sur une vidéo avec tracking YOLO"""
     if request.method == 'OPTIONS':
@@ -994,18 +1331,17 @@ def detect_video():
             'error': 'Modèle non chargé'
         }), 500
     
-    # Debug : afficher les fichiers reçus
-    print(f"🔍 DEBUG - Fichiers reçus: {list(request.files.keys())}")
-    print(f"🔍 DEBUG - Content-Type: {request.content_type}")
-    print(f"🔍 DEBUG - Form data keys: {list(request.form.keys())}")
+    # Debug : fichiers et champs reçus
+    logger.debug("Fichiers reçus: %s, Content-Type: %s, champs: %s",
+                 list(request.files.keys()), request.content_type, list(request.form.keys()))
     
     if 'video' not in request.files:
         # Vérifier si c'est peut-être 'file' au lieu de 'video'
         if 'file' in request.files:
-            print("⚠️ 'video' non trouvé, mais 'file' trouvé - utilisation de 'file'")
+            logger.debug("Champ 'video' absent, utilisation de 'file'")
             file = request.files['file']
         else:
-            print("❌ Erreur: Aucun fichier 'video' ou 'file' trouvé")
+            logger.warning("Aucun fichier 'video' ou 'file' dans la requête")
             return jsonify({
                 'error': 'Aucune vidéo fournie. Utilisez le champ "video" dans le FormData.'
             }), 400
@@ -1014,23 +1350,62 @@ def detect_video():
     
     try:
         if file.filename == '' or file.filename is None:
-            print("❌ Erreur: Nom de fichier vide")
+            logger.warning("Nom de fichier vide")
             return jsonify({
                 'error': 'Fichier vide ou nom de fichier manquant'
             }), 400
         
-        print(f"\n📥 Réception d'une vidéo: {file.filename}")
-        
         # Lire le contenu pour vérifier la taille
         file_content = file.read()
         file_size_mb = len(file_content) / (1024*1024)
-        print(f"📊 Taille du fichier: {file_size_mb:.2f} MB")
+        logger.info("Vidéo reçue", extra={'media_filename': file.filename, 'bytes': len(file_content)})
         
         if file_size_mb == 0:
             return jsonify({
                 'error': 'Le fichier vidéo est vide (0 bytes)'
             }), 400
         
+        # OPTIMISATION PERFORMANCE : Traiter seulement 1 frame sur plusieurs pour accélérer
+        # Augmenter frame_skip réduit drastiquement le temps de traitement
+        # frame_skip = 1 : toutes les frames (très lent, 20+ min)
+        # frame_skip = 3 : 1 frame sur 3 (3x plus rapide)
+        # frame_skip = 5 : 1 frame sur 5 (5x plus rapide)
+        # Résolution YOLO : 416 équilibré (CPU), 512 plus précis pour les petits objets (GPU)
+        # Les deux valeurs peuvent être imposées par les champs FormData 'frameSkip' et 'imgsz'
+        device_check = 'cuda' if torch.cuda.is_available() else 'cpu'
+        try:
+            frame_skip = max(1, form_int('frameSkip', 5 if device_check == 'cpu' else 3))
+            imgsz_video = requested_imgsz(416 if device_check == 'cpu' else 512)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Même vidéo, même modèle, mêmes paramètres : réutiliser l'analyse déjà enregistrée
+        camera_id = request.form.get('cameraId', 'default')
+        use_gate = AUTOENCODER_AVAILABLE and (
+            AUTOENCODER_GATE or request.form.get('aeGate', '').lower() == 'true'
+        )
+        # 'frames' : détections par frame (lecture annotée) + événements ; 'events' : événements seuls
+        output_mode = 'events' if request.form.get('output', '').lower() == 'events' else 'frames'
+        # Détection sur les keyframes seulement, boxes propagées par flux optique entre elles
+        propagate = VIDEO_KEYFRAME_PROPAGATION or request.form.get('propagate', '').lower() == 'true'
+        media_hash = inference_fingerprint(file_content, 'video', camera_id, use_gate, {
+            'conf': 0.2,
+            'iou': 0.5,
+            'frameSkip': frame_skip,
+            'propagate': propagate,
+            'imgsz': imgsz_video,
+            'anomalyMap': AUTOENCODER_AVAILABLE and (
+                request.form.get('anomalyMap', '').lower() == 'true' or AUTOENCODER_VIDEO_TILES
+            )
+        })
+        if media_hash is not None:
+            with stage_timer('dedup_lookup', 'video'):
+                stored = find_stored_result(media_hash, 'video', output_mode)
+            if stored is not None:
+                mongo_id, response = stored
+                logger.info("Vidéo déjà analysée, traitement et sauvegarde ignorés", extra={'mongo_id': mongo_id})
+                return jsonify({**response, 'mongoId': mongo_id, 'contentHash': media_hash, 'duplicate': True})
+        
         # Réinitialiser le pointeur du fichier après la lecture
         file.seek(0)
         
@@ -1043,38 +1418,34 @@ def detect_video():
         with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_file:
             file.save(tmp_file.name)
             video_path = tmp_file.name
-            print(f"💾 Vidéo sauvegardée temporairement: {video_path}")
+            logger.debug("Vidéo sauvegardée temporairement: %s", video_path)
         
-        # Ouvrir la vidéo avec OpenCV
-        cap = cv2.VideoCapture(video_path)
+        # Ouvrir la vidéo (PyAV si installé, sinon OpenCV ; voir VIDEO_DECODER)
+        cap = open_video(video_path)
         
         if not cap.isOpened():
+            cap.release()
             os.unlink(video_path)
             return jsonify({
                 'error': 'Impossible d\'ouvrir la vidéo'
             }), 400
         
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        # Nombre de frames exact avec PyAV (en-tête ou comptage des paquets), estimé avec OpenCV
+        fps = cap.fps
+        total_frames = cap.frame_count
+        duration = cap.duration or (total_frames / fps if fps > 0 else 0)
+        # Taille des frames décodées (réduite si VIDEO_DECODE_WIDTH) : référence des coordonnées
+        width = cap.width
+        height = cap.height
         
-        print(f"📹 Vidéo: {width}x{height}, {fps:.2f} FPS, {total_frames} frames")
-        print(f"🎯 Utilisation du tracking YOLO (ByteTrack) pour suivre les objets")
+        logger.debug("Vidéo %dx%d (source %dx%d), %.2f FPS, %d frames, décodeur %s", width, height,
+                     cap.source_width, cap.source_height, fps, total_frames, cap.backend)
         
         # Vérifier si le modèle supporte la segmentation
         model_has_segmentation = hasattr(model.model, 'seg') or 'seg' in str(type(model.model)).lower()
-        print(f"🎨 Segmentation du modèle: {'✅ Activée' if model_has_segmentation else '❌ Non disponible'}")
+        logger.debug("Segmentation du modèle: %s", 'activée' if model_has_segmentation else 'non disponible')
         
-        # OPTIMISATION PERFORMANCE : Traiter seulement 1 frame sur plusieurs pour accélérer
-        # Augmenter frame_skip réduit drastiquement le temps de traitement
-        # frame_skip = 1 : toutes les frames (très lent, 20+ min)
-        # frame_skip = 3 : 1 frame sur 3 (3x plus rapide)
-        # frame_skip = 5 : 1 frame sur 5 (5x plus rapide)
-        device_check = 'cuda' if torch.cuda.is_available() else 'cpu'
-        frame_skip = 5 if device_check == 'cpu' else 3  # Plus de frames sautées pour vitesse maximale
-        print(f"⚡ Traitement de 1 frame sur {frame_skip} pour optimiser les performances")
-        print(f"   (Temps estimé réduit de {frame_skip}x)")
+        logger.debug("Traitement de 1 frame sur %d (imgsz %d)", frame_skip, imgsz_video)
         
         # Initialiser ByteTrack de supervision (comme dans Colab) - MÊME SUR CPU
         # C'est crucial pour éviter les boxes qui flottent et améliorer la stabilité
@@ -1090,12 +1461,12 @@ def detect_video():
                 minimum_matching_threshold=0.8,
                 frame_rate=fps_video
             )
-            print(f"🎯 ByteTrack de supervision activé (même sur CPU) - paramètres comme Colab")
-            print(f"   track_activation_threshold=0.4, lost_track_buffer=30, minimum_matching_threshold=0.8")
+            logger.debug("ByteTrack de supervision activé (paramètres comme Colab)")
         else:
             # Fallback sur notre smoother personnalisé si supervision n'est pas disponible
-            smoother = BBoxSmoother(alpha=0.7, max_age=5)
-            print(f"⚠️ Supervision non disponible - utilisation du smoother personnalisé - {device_check.upper()}")
+            # max_age en numéros de frame : 5 frames traitées sans détection
+            smoother = BBoxSmoother(alpha=0.7, max_age=5 * frame_skip)
+            logger.debug("Supervision non disponible, utilisation du smoother personnalisé (%s)", device_check)
         
         # OPTIMISATION PERFORMANCE : SAM désactivé par défaut (très coûteux en temps)
         # Activer SAM ralentit considérablement le traitement (peut doubler le temps)
@@ -1106,44 +1477,86 @@ def detect_video():
             try:
                 from ultralytics import SAM
                 sam_model_video = SAM("mobile_sam.pt")  # Téléchargera automatiquement si nécessaire
-                print(f"✅ SAM initialisé pour la vidéo (ATTENTION: ralentit le traitement)")
+                logger.debug("SAM initialisé pour la vidéo")
             except Exception as e:
-                print(f"⚠️ Erreur lors de l'initialisation SAM: {e}")
+                logger.warning("Erreur lors de l'initialisation SAM: %s", e)
                 sam_model_video = None
-        else:
-            print(f"⚡ SAM désactivé pour optimiser les performances (peut être activé si nécessaire)")
+        
+        # Carte d'anomalies par tuiles (auto-encoder batché) sur les frames échantillonnées
+        # Activable par le champ FormData 'anomalyMap=true' ou AUTOENCODER_VIDEO_TILES=1
+        use_anomaly_tiles = AUTOENCODER_AVAILABLE and (
+            request.form.get('anomalyMap', '').lower() == 'true' or AUTOENCODER_VIDEO_TILES
+        )
+        if use_anomaly_tiles:
+            logger.debug("Carte d'anomalies auto-encoder activée (1 frame traitée sur %d)", AUTOENCODER_VIDEO_EVERY)
+        
+        # Cascade auto-encoder -> YOLO : les frames jugées propres ne passent pas par YOLO
+        # (camera_id et use_gate sont lus avec l'empreinte, avant le traitement)
+        gated_frame_count = 0
+        if use_gate:
+            logger.debug("Pré-filtre auto-encoder activé (caméra '%s', seuil %.4f)", camera_id, anomaly_gate.get_threshold(camera_id))
         
         # Initialiser les annotateurs pour l'affichage (si supervision disponible)
         if SUPERVISION_AVAILABLE:
             box_annotator = sv.BoxAnnotator()
             mask_annotator = sv.MaskAnnotator() if model_has_segmentation else None
-            print(f"🎨 MaskAnnotator: {'✅ Activé' if mask_annotator else '❌ Désactivé (pas de segmentation)'}")
+            logger.debug("MaskAnnotator: %s", 'activé' if mask_annotator else 'désactivé (pas de segmentation)')
+        
+        # Cycle de vie des tracks : un événement à l'apparition, à l'escalade et à la disparition
+        track_events = TrackEventAggregator(thumbnail_fn=track_thumbnail if TRACK_THUMBNAIL_SIZE > 0 else None)
         
         # Traiter chaque frame avec tracking (mais seulement certaines frames)
         processed_frames_data = []  # Stocker seulement les frames traitées avec leurs détections
         frame_number = 0
         processed_frame_count = 0
         start_time = time.time()  # Chronomètre pour estimer le temps restant
+        box_propagator = BoxPropagator() if propagate else None
+        propagated_frame_count = 0
+        propagation_fallbacks = 0
+        if propagate:
+            logger.debug("Propagation des boxes entre keyframes activée (1 keyframe sur %d)", frame_skip)
         
         while True:
-            ret, frame = cap.read()
+            # Frame sautée sans propagation : décodée mais pas convertie en image
+            needs_pixels = (frame_number + 1) % frame_skip == 0 or (box_propagator is not None and box_propagator.active)
+            with stage_timer('frame_decode', 'video'):
+                ret, frame = cap.read() if needs_pixels else (cap.grab(), None)
             if not ret:
                 break
             
             frame_number += 1
+            frame_time = cap.timestamp  # PTS de la frame (exact pour les vidéos à fréquence variable)
             
             # Traiter seulement 1 frame sur frame_skip pour optimiser
             if frame_number % frame_skip != 0:
-                continue
+                if box_propagator is None or not box_propagator.active:
+                    metrics.VIDEO_FRAMES.inc(result='skipped')
+                    continue
+                # Frame intermédiaire : boxes de la dernière keyframe déplacées par flux optique
+                with stage_timer('propagate', 'video'):
+                    propagated = box_propagator.propagate(frame)
+                if propagated is not None:
+                    for det in propagated:
+                        b = det['bbox']
+                        det['position'] = format_position([b['x'] * width / 100, b['y'] * height / 100,
+                                                           (b['x'] + b['width']) * width / 100,
+                                                           (b['y'] + b['height']) * height / 100], width, height)
+                    processed_frames_data.append({
+                        'frame': frame_number - 1,
+                        'time': frame_time,
+                        'detections': propagated,
+                        'count': len(propagated),
+                        'propagated': True
+                    })
+                    track_events.update(frame_number - 1, processed_frames_data[-1]['time'], propagated)
+                    propagated_frame_count += 1
+                    metrics.VIDEO_FRAMES.inc(result='propagated')
+                    continue
+                # Suivi perdu : la frame passe par le détecteur et devient une keyframe
+                propagation_fallbacks += 1
             
-            # OPTIMISATION PERFORMANCE : Résolution optimisée pour détecter les petits objets
-            # Plus la résolution est élevée, mieux on détecte les petits objets
-            # 320 : très rapide mais moins précis pour petits objets
-            # 416 : équilibré (CPU) - bon pour petits objets
-            # 512 : plus précis mais plus lent (GPU) - excellent pour petits objets
-            device = 'cuda' if torch.cuda.is_available() else 'cpu'
-            # Résolution augmentée pour mieux détecter les petits objets
-            imgsz_video = 416 if device == 'cpu' else 512  # Meilleure détection des petits objets
+            # Résolution YOLO (imgsz_video) choisie avant la boucle, voir frame_skip
+            device = device_check
             scale_factor = 1.0  # Résolution originale pour les coordonnées finales
             frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             
@@ -1152,16 +1565,43 @@ def detect_video():
             conf_threshold = 0.2  # Seuil réduit pour détecter plus de petits objets (était 0.25)
             iou_threshold = 0.5    # IOU réduit pour mieux détecter les petits objets proches (était 0.6)
             
+            # Pré-filtre auto-encoder (un seul passage batché sur les tuiles de la frame)
+            anomaly_result = None
+            if use_gate or (use_anomaly_tiles and processed_frame_count % AUTOENCODER_VIDEO_EVERY == 0):
+                with stage_timer('anomaly_gate', 'video'):
+                    anomaly_result = anomaly_gate.check(frame_rgb, autoencoder_model, device=device, camera_id=camera_id)
+                if 'error' in anomaly_result:
+                    anomaly_result = None
+            
+            if use_gate and anomaly_result is not None and not anomaly_result['is_anomaly']:
+                # Frame propre : pas d'appel à YOLO/SAM
+                processed_frames_data.append({
+                    'frame': frame_number - 1,
+                    'time': frame_time,
+                    'detections': [],
+                    'count': 0,
+                    'gated': True
+                })
+                track_events.update(frame_number - 1, processed_frames_data[-1]['time'], [])
+                if box_propagator is not None:
+                    box_propagator.anchor(frame, [])
+                processed_frame_count += 1
+                gated_frame_count += 1
+                metrics.VIDEO_FRAMES.inc(result='gated')
+                continue
+            
             # Détection YOLO (sans tracking intégré - comme dans Colab)
-            if tracker_sv is not None:
-                # Utiliser model() pour la détection, puis ByteTrack de supervision pour le tracking
-                results = model(frame_rgb, conf=conf_threshold, iou=iou_threshold, imgsz=imgsz_video, device=device, verbose=False)
-            else:
-                # Fallback : utiliser model.track() si supervision n'est pas disponible
-                try:
-                    results = model.track(frame_rgb, conf=conf_threshold, persist=True, tracker="bytetrack.yaml", imgsz=imgsz_video, device=device, verbose=False)
-                except:
-                    results = model.track(frame_rgb, conf=conf_threshold, persist=True, imgsz=imgsz_video, device=device, verbose=False)
+            precision_kwargs = precision_policy.yolo_kwargs(device)
+            with inference_lock, stage_timer('yolo_forward', 'video'), precision_policy.context(device):
+                if tracker_sv is not None:
+                    # Utiliser model() pour la détection, puis ByteTrack de supervision pour le tracking
+                    results = yolo_backend(frame_rgb, conf=conf_threshold, iou=iou_threshold, imgsz=imgsz_video, device=device, verbose=False, **precision_kwargs)
+                else:
+                    # Fallback : utiliser model.track() si supervision n'est pas disponible
+                    try:
+                        results = model.track(frame_rgb, conf=conf_threshold, persist=True, tracker="bytetrack.yaml", imgsz=imgsz_video, device=device, verbose=False, **precision_kwargs)
+                    except:
+                        results = model.track(frame_rgb, conf=conf_threshold, persist=True, imgsz=imgsz_video, device=device, verbose=False, **precision_kwargs)
             
             # Conversion en format supervision et application de ByteTrack (comme dans Colab)
             detections_sv = None
@@ -1171,9 +1611,9 @@ def detect_video():
                     result = results[0] if isinstance(results, list) else results
                     
                     if result.boxes is not None and len(result.boxes) > 0:
-                        bboxes = result.boxes.xyxy.cpu().numpy()
-                        confidences = result.boxes.conf.cpu().numpy()
-                        class_ids = result.boxes.cls.cpu().numpy().astype(int)
+                        bboxes = result.boxes.xyxy.float().cpu().numpy()
+                        confidences = result.boxes.conf.float().cpu().numpy()
+                        class_ids = result.boxes.cls.float().cpu().numpy().astype(int)
                         
                         # OPTIMISATION PERFORMANCE : SAM désactivé par défaut (très coûteux)
                         # Activer SAM seulement si USE_SAM_SEGMENTATION = True
@@ -1185,7 +1625,7 @@ def detect_video():
                                 # ATTENTION: Cela ralentit considérablement le traitement
                                 sam_results = sam_model_video(frame_rgb, bboxes=bboxes, verbose=False)
                                 if sam_results[0].masks is not None:
-                                    masks = sam_results[0].masks.data.cpu().numpy()
+                                    masks = sam_results[0].masks.data.float().cpu().numpy()
                             except Exception as e:
                                 # Désactiver les logs pour performance
                                 # print(f"⚠️ Erreur SAM frame {frame_number}: {e}")
@@ -1201,12 +1641,14 @@ def detect_video():
                         
                         # CRUCIAL : Appliquer ByteTrack de supervision (comme dans Colab)
                         # C'est cette étape qui évite les boxes qui flottent et améliore la stabilité
-                        detections_sv = tracker_sv.update_with_detections(detections_sv)
+                        with stage_timer('tracking', 'video'):
+                            detections_sv = tracker_sv.update_with_detections(detections_sv)
                 except Exception as e:
-                    print(f"⚠️ Erreur supervision frame {frame_number}: {e}")
+                    logger.warning("Erreur supervision frame %d: %s", frame_number, e)
                     detections_sv = None
             
             detections = []
+            postprocess_start = time.perf_counter()
             
             # IMPORTANT : Utiliser ByteTrack de supervision si disponible (comme dans Colab)
             # Cela évite les boxes qui flottent et améliore la stabilité
@@ -1238,7 +1680,8 @@ def detect_video():
                         'height': (bbox_height_px / height) * 100
                     }
                     
-                    # Calculer la taille réelle en mètres (utiliser la surface du masque si disponible)
+                    # Calculer la taille réelle en mètres (pas de surface de masque : SAM intervient après)
+                    mask_area_px = None
                     size_meters = calculate_real_size(bbox_width_px, bbox_height_px, width, height, mask_area_px)
                     risk_info = determine_risk_level_by_size(size_meters, confidence)
                     position = format_position([x1, y1, x2, y2], width, height)
@@ -1330,7 +1773,7 @@ def detect_video():
                         continue
                     
                     for i, box in enumerate(boxes):
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+                        x1, y1, x2, y2 = box.xyxy[0].float().cpu().numpy()
                         
                         # Vérifier les limites
                         x1 = max(0, min(x1, width))
@@ -1338,8 +1781,8 @@ def detect_video():
                         x2 = max(x1, min(x2, width))
                         y2 = max(y1, min(y2, height))
                         
-                        confidence = float(box.conf[0].cpu().numpy())
-                        class_id = int(box.cls[0].cpu().numpy())
+                        confidence = float(box.conf[0].float().cpu().numpy())
+                        class_id = int(box.cls[0].float().cpu().numpy())
                         class_name = model.names[class_id]
                         
                         # Récupérer l'ID de tracking (si disponible)
@@ -1352,19 +1795,14 @@ def detect_video():
                         bbox_width_px = x2 - x1
                         bbox_height_px = y2 - y1
                         
-                        # Utiliser notre smoother personnalisé si disponible
-                        bbox_percent_raw = {
+                        # Lissage appliqué après la boucle, en une passe pour toute la frame
+                        bbox_percent = {
                             'x': (x1 / width) * 100,
                             'y': (y1 / height) * 100,
                             'width': (bbox_width_px / width) * 100,
                             'height': (bbox_height_px / height) * 100
                         }
                         
-                        if smoother is not None and track_id is not None:
-                            bbox_percent = smoother.update(track_id, bbox_percent_raw, frame_number - 1)
-                        else:
-                            bbox_percent = bbox_percent_raw
-                        
                         # Segmentation désactivée pour performance (pas de masque disponible)
                         mask_area_px = None
                         
@@ -1394,48 +1832,57 @@ def detect_video():
                         }
                         
                         detections.append(detection)
+                
+                # Smoother personnalisé : toutes les boxes trackées de la frame en un seul appel vectorisé
+                tracked = [d for d in detections if d['trackId'] is not None]
+                if smoother is not None and tracked:
+                    smoothed = smoother.update_batch([d['trackId'] for d in tracked],
+                                                     bbox_array([d['bbox'] for d in tracked]), frame_number - 1)
+                    for detection, bbox_percent in zip(tracked, bbox_dicts(smoothed)):
+                        detection['bbox'] = bbox_percent
+            
+            observe_stage('postprocess', time.perf_counter() - postprocess_start, 'video')
+            metrics.VIDEO_FRAMES.inc(result='processed')
             
             # Stocker les données de la frame traitée
-            processed_frames_data.append({
+            frame_data = {
                 'frame': frame_number - 1,
-                'time': (frame_number - 1) / fps if fps > 0 else 0,
+                'time': frame_time,
                 'detections': detections,
                 'count': len(detections)
-            })
+            }
             
-            processed_frame_count += 1
+            # Carte d'anomalies (réutilise le score calculé par le pré-filtre)
+            if use_anomaly_tiles and anomaly_result is not None:
+                frame_data['anomaly'] = {
+                    'isAnomaly': anomaly_result['is_anomaly'],
+                    'maxError': anomaly_result['max_error'],
+                    'heatmap': anomaly_result['heatmap'],
+                    'grid': anomaly_result['grid'],
+                    'boxes': [{'bbox': b['bbox'], 'score': b['score']} for b in anomaly_result['boxes']]
+                }
+            
+            processed_frames_data.append(frame_data)
+            track_events.update(frame_number - 1, frame_data['time'], detections, frame)
+            if box_propagator is not None:
+                box_propagator.anchor(frame, detections)
             
-            # Nettoyer les tracks expirées (seulement pour notre smoother personnalisé) - moins souvent pour performance
-            if smoother is not None and processed_frame_count % 50 == 0:  # Moins souvent (50 au lieu de 10)
-                expired_count = smoother.cleanup(frame_number - 1)
-                # Désactiver le log pour performance
-                # if expired_count > 0:
-                #     print(f"   🧹 {expired_count} tracks expirées supprimées")
+            processed_frame_count += 1
             
-            # Afficher la progression (réduit pour performance)
-            if processed_frame_count % 20 == 0:  # Afficher plus souvent pour suivre la progression
+            # Progression (DEBUG uniquement : calcul de l'ETA évité sinon)
+            if processed_frame_count % 20 == 0 and logger.isEnabledFor(logging.DEBUG):
                 progress_pct = (processed_frame_count / (total_frames // frame_skip)) * 100 if total_frames > 0 else 0
-                elapsed_time = time.time() - start_time if 'start_time' in locals() else 0
-                if elapsed_time > 0:
-                    fps_processing = processed_frame_count / elapsed_time
-                    remaining_frames = (total_frames // frame_skip) - processed_frame_count
-                    eta_seconds = remaining_frames / fps_processing if fps_processing > 0 else 0
-                    eta_min = int(eta_seconds // 60)
-                    eta_sec = int(eta_seconds % 60)
-                    if smoother is not None:
-                        active_tracks = len(smoother.get_active_tracks(frame_number - 1))
-                        print(f"   ⏳ {processed_frame_count} frames ({progress_pct:.1f}%) - {active_tracks} tracks - ETA: {eta_min}m{eta_sec}s")
-                    else:
-                        print(f"   ⏳ {processed_frame_count} frames ({progress_pct:.1f}%) - ETA: {eta_min}m{eta_sec}s")
-                else:
-                    if smoother is not None:
-                        active_tracks = len(smoother.get_active_tracks(frame_number - 1))
-                        print(f"   ⏳ Traité {processed_frame_count} frames - {progress_pct:.1f}% - {active_tracks} tracks")
-                    else:
-                        print(f"   ⏳ Traité {processed_frame_count} frames - {progress_pct:.1f}%")
+                elapsed_time = time.time() - start_time
+                fps_processing = processed_frame_count / elapsed_time if elapsed_time > 0 else 0
+                remaining_frames = (total_frames // frame_skip) - processed_frame_count
+                eta_seconds = remaining_frames / fps_processing if fps_processing > 0 else 0
+                active_tracks = len(smoother) if smoother is not None else None
+                logger.debug("Progression vidéo: %d frames (%.1f%%), ETA %ds", processed_frame_count, progress_pct,
+                             int(eta_seconds), extra={'active_tracks': active_tracks})
         
         cap.release()
         os.unlink(video_path)
+        events = track_events.finish()
         
         # Nettoyer les tracks restantes avant interpolation (seulement pour notre smoother)
         if smoother is not None:
@@ -1447,11 +1894,11 @@ def detect_video():
         
         if not USE_FULL_INTERPOLATION:
             # Mode rapide : retourner seulement les frames traitées (pas d'interpolation)
-            print(f"⚡ Mode rapide : retour des {processed_frame_count} frames traitées uniquement")
+            logger.debug("Mode rapide : retour des %d frames traitées uniquement", processed_frame_count)
             frame_detections = processed_frames_data
         else:
             # Mode complet : interpolation de toutes les frames (plus lent mais plus fluide)
-            print(f"🔄 Interpolation des positions pour suivi fluide...")
+            logger.debug("Interpolation des positions pour suivi fluide")
             frame_detections = []
             
             # Créer un dictionnaire pour suivre les objets par trackId
@@ -1559,6 +2006,8 @@ def detect_video():
                 'count': len(interpolated_detections)
             })
         
+        metrics.count_detections((d for fd in processed_frames_data if not fd.get('propagated') for d in fd['detections']), 'video')
+        
         # Vérifier les alertes
         all_detections = [d for fd in frame_detections for d in fd['detections']]
         has_danger_alert = any(d.get('alertLevel', 0) == 3 for d in all_detections)
@@ -1570,57 +2019,84 @@ def detect_video():
             if d.get('trackId') is not None:
                 unique_tracks.add(d['trackId'])
         
-        print(f"✅ Vidéo traitée: {processed_frame_count} frames analysées, {total_frames} frames interpolées")
-        print(f"📊 Détections totales: {len(all_detections)}")
-        print(f"🎯 Objets trackés uniques: {len(unique_tracks)}")
-        
-        # Afficher un résumé des classes détectées
+        # Résumé des classes détectées
         if all_detections:
             class_counts = {}
             for d in all_detections:
                 label = d.get('label', 'unknown')
                 class_counts[label] = class_counts.get(label, 0) + 1
-            print(f"📋 Classes détectées: {class_counts}")
+        
+        # Une seule ligne par vidéo ; les alertes de danger sont remontées en WARNING
+        logger.log(logging.WARNING if has_danger_alert else logging.INFO, "Vidéo traitée", extra={
+            'processed_frames': processed_frame_count,
+            'total_frames': total_frames,
+            'gated_frames': gated_frame_count,
+            'propagated_frames': propagated_frame_count,
+            'propagation_fallbacks': propagation_fallbacks,
+            'detections': len(all_detections),
+            'unique_tracks': len(unique_tracks),
+            'track_events': len(events),
+            'max_alert_level': max_alert,
+            'classes': class_counts if all_detections else {}
+        })
         
         # Sauvegarder automatiquement dans MongoDB
         mongo_id = None
         if MONGODB_AVAILABLE and mongodb_service:
-            mongo_id = mongodb_service.save_video_detection(
-                frames=frame_detections,
-                video_filename=file.filename,
-                video_info={
-                    'fps': fps,
-                    'duration': total_frames / fps if fps > 0 else 0,
-                    'totalFrames': total_frames,
-                    'processedFrames': processed_frame_count,
-                    'width': width,
-                    'height': height
-                },
-                metadata={
-                    'has_danger_alert': has_danger_alert,
-                    'max_alert_level': max_alert,
-                    'unique_tracks': len(unique_tracks),
-                    'class_counts': class_counts if all_detections else {}
-                }
-            )
-        
-        return jsonify({
-            'frames': frame_detections,
-            'totalFrames': total_frames,
-            'processedFrames': processed_frame_count,
-            'fps': fps,
-            'duration': total_frames / fps if fps > 0 else 0,
-            'hasDangerAlert': has_danger_alert,
-            'maxAlertLevel': max_alert,
-            'uniqueTracks': len(unique_tracks),
-            'mongoId': mongo_id  # ID MongoDB si sauvegardé
-        })
+            # Écriture différée si disponible (ID pré-attribué retourné immédiatement)
+            save_video = persistence_queue.submit_video if persistence_queue else mongodb_service.save_video_detection
+            # Mode 'events' : un enregistrement par événement de track au lieu d'un par détection
+            persist_events = VIDEO_PERSIST_MODE == 'events'
+            with stage_timer('persist', 'video'):
+                mongo_id = save_video(
+                    frames=event_frames(events) if persist_events else frame_detections,
+                    video_filename=file.filename,
+                    video_info={
+                        'fps': fps,
+                        'duration': duration,
+                        'totalFrames': total_frames,
+                        'processedFrames': processed_frame_count,
+                        'propagatedFrames': propagated_frame_count,
+                        'width': width,
+                        'height': height
+                    },
+                    metadata={
+                        'has_danger_alert': has_danger_alert,
+                        'max_alert_level': max_alert,
+                        'unique_tracks': len(unique_tracks),
+                        'class_counts': class_counts if all_detections else {},
+                        'camera_id': camera_id,
+                        'gated_frames': gated_frame_count,
+                        'result_mode': 'events' if persist_events else 'frames'
+                    },
+                    media_hash=media_hash
+                )
+            if media_hash is not None and mongo_id:
+                # Réponse non conservée en mémoire (volumineuse) : reconstruite depuis le stockage
+                recent_results.put(media_hash, mongo_id)
+        
+        with stage_timer('serialize', 'video'):
+            return jsonify({
+                'frames': frame_detections if output_mode == 'frames' else [],
+                'events': events,  # Apparition / escalade / disparition de chaque track
+                'totalFrames': total_frames,
+                'processedFrames': processed_frame_count,
+                'fps': fps,
+                'duration': duration,
+                'hasDangerAlert': has_danger_alert,
+                'maxAlertLevel': max_alert,
+                'uniqueTracks': len(unique_tracks),
+                'gatedFrames': gated_frame_count,  # Frames jugées propres par l'auto-encoder (YOLO ignoré)
+                'propagatedFrames': propagated_frame_count,  # Frames sans détecteur (boxes suivies par flux optique)
+                'propagationFallbacks': propagation_fallbacks,  # Suivi perdu : détecteur relancé hors keyframe
+                'mongoId': mongo_id,  # ID MongoDB si sauvegardé
+                'contentHash': media_hash,
+                'duplicate': False
+            })
         
     except Exception as e:
         error_msg = str(e)
-        print(f"❌ Erreur lors du traitement vidéo: {error_msg}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Erreur lors du traitement vidéo: %s", error_msg)
         
         # Nettoyer le fichier temporaire en cas d'erreur
         if 'video_path' in locals() and os.path.exists(video_path):
@@ -1632,6 +2108,435 @@ def detect_video():
             'totalFrames': 0
         }), 500
 
+@app.route('/api/anomaly/calibrate', methods=['POST', 'OPTIONS'])
+def calibrate_anomaly_threshold():
+    """Calibre le seuil du pré-filtre auto-encoder d'une caméra à partir d'un clip de piste propre"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    if not AUTOENCODER_AVAILABLE:
+        return jsonify({'error': 'Auto-encoder non disponible'}), 500
+    
+    file = request.files.get('video') or request.files.get('file')
+    if file is None or not file.filename:
+        return jsonify({'error': 'Aucune vidéo de référence fournie (champ "video")'}), 400
+    
+    camera_id = request.form.get('cameraId', 'default')
+    try:
+        frame_skip = max(1, form_int('frameSkip', 5))
+        sigma = float(request.form.get('sigma', AUTOENCODER_CALIBRATION_SIGMA))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    
+    file_ext = os.path.splitext(file.filename)[1] or '.mp4'
+    with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_file:
+        file.save(tmp_file.name)
+        video_path = tmp_file.name
+    
+    # Même décodeur (et même VIDEO_DECODE_WIDTH) que /api/detect-video : seuils comparables
+    cap = open_video(video_path)
+    try:
+        if not cap.isOpened():
+            return jsonify({'error': 'Impossible d\'ouvrir la vidéo'}), 400
+        
+        print(f"🧪 Calibration auto-encoder pour la caméra '{camera_id}' (1 frame sur {frame_skip})")
+        max_errors = []
+        frame_number = 0
+        while True:
+            frame_number += 1
+            if frame_number % frame_skip != 0:
+                # Frame sautée : décodée sans conversion
+                if not cap.grab():
+                    break
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            result = anomaly_gate.check(frame_rgb, autoencoder_model, device=device, camera_id=camera_id)
+            if 'error' in result:
+                return jsonify({'error': result['error']}), 500
+            max_errors.append(result['max_error'])
+        
+        entry = anomaly_gate.calibrate(camera_id, max_errors, sigma=sigma)
+        print(f"✅ Seuil calibré pour '{camera_id}': {entry['threshold']:.4f} ({entry['frames']} frames)")
+        return jsonify({'success': True, 'cameraId': camera_id, **entry})
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Erreur lors de la calibration: {str(e)}'}), 500
+    finally:
+        cap.release()
+        if os.path.exists(video_path):
+            os.unlink(video_path)
+
+def tracked_detection(xyxy, confidence, class_id, track_id, width, height, detection_id):
+    """
+    Détection au format /api/detect-video (sans masque de segmentation)
+
+    Args:
+        xyxy: Box en pixels (x1, y1, x2, y2)
+        confidence: Confiance du modèle
+        class_id: Indice de classe YOLO
+        track_id: ID ByteTrack (ou None)
+        width, height: Dimensions de la frame
+        detection_id: Identifiant de la détection
+
+    Returns:
+        Dict de détection (taille réelle, niveau d'alerte, position, bbox en %)
+    """
+    x1, y1, x2, y2 = (float(v) for v in xyxy)
+    x1 = max(0.0, min(x1, width))
+    y1 = max(0.0, min(y1, height))
+    x2 = max(x1, min(x2, width))
+    y2 = max(y1, min(y2, height))
+    size_meters = calculate_real_size(x2 - x1, y2 - y1, width, height)
+    risk_info = determine_risk_level_by_size(size_meters, confidence)
+    return {
+        'id': detection_id,
+        'trackId': track_id,
+        'label': model.names[class_id],
+        'confidence': float(confidence),
+        'riskLevel': risk_info['risk'],
+        'alertLevel': risk_info['level'],
+        'alertType': risk_info['alert'],
+        'sizeMeters': risk_info['size_meters'],
+        'sizeCm': risk_info['size_cm'],
+        'position': format_position([x1, y1, x2, y2], width, height),
+        'bbox': {
+            'x': (x1 / width) * 100,
+            'y': (y1 / height) * 100,
+            'width': ((x2 - x1) / width) * 100,
+            'height': ((y2 - y1) / height) * 100
+        },
+        'hasSegmentation': False,
+        'segmentationMask': None
+    }
+
+def stream_boxes_batch(frames_rgb):
+    """
+    Forward YOLO batché sur des frames de plusieurs caméras (paramètres de detect_video)
+
+    Args:
+        frames_rgb: Liste de frames RGB (tailles quelconques, letterbox par ultralytics)
+
+    Returns:
+        Liste de (xyxy, confidences, class_ids) en pixels de chaque frame, dans le même ordre
+    """
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    with inference_lock, stage_timer('yolo_forward', 'stream'), precision_policy.context(device):
+        results = yolo_backend(frames_rgb, conf=0.2, iou=0.5, imgsz=416 if device == 'cpu' else 512,
+                               device=device, verbose=False, **precision_policy.yolo_kwargs(device))
+    boxes_per_frame = []
+    for result in results:
+        boxes = result.boxes
+        if boxes is not None and len(boxes) > 0:
+            boxes_per_frame.append((boxes.xyxy.float().cpu().numpy(), boxes.conf.float().cpu().numpy(),
+                                    boxes.cls.float().cpu().numpy().astype(int)))
+        else:
+            boxes_per_frame.append((np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=int)))
+    return boxes_per_frame
+
+# Un seul forward batché pour toutes les caméras (STREAM_BATCHING=1)
+stream_scheduler = None
+if STREAM_BATCHING and model is not None:
+    stream_scheduler = InferenceScheduler(stream_boxes_batch)
+    stream_scheduler.start()
+
+def process_stream_frame(camera_id, frame_bgr, state):
+    """
+    Détection YOLO + suivi ByteTrack d'une frame de flux caméra
+
+    Le forward passe par l'ordonnanceur multi-caméras (ou directement sous verrou
+    si STREAM_BATCHING=0) ; le suivi reste propre au flux.
+
+    Args:
+        camera_id: Identifiant du flux
+        frame_bgr: Frame OpenCV (BGR)
+        state: État propre au flux (tracker et priorité, créés au premier appel)
+
+    Returns:
+        Liste de détections au format /api/detect-video
+    """
+    height, width = frame_bgr.shape[:2]
+    if 'tracker' not in state:
+        state['tracker'] = sv.ByteTracker(
+            track_activation_threshold=0.4,
+            lost_track_buffer=30,
+            minimum_matching_threshold=0.8,
+            frame_rate=30
+        ) if SUPERVISION_AVAILABLE else None
+        state['frame_index'] = 0
+        state['priority'] = priority_weight(1)
+    state['frame_index'] += 1
+
+    frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+    if stream_scheduler is not None:
+        xyxy, confidences, class_ids = stream_scheduler.infer(camera_id, frame_rgb, state['priority'])
+    else:
+        xyxy, confidences, class_ids = stream_boxes_batch([frame_rgb])[0]
+
+    track_ids = [None] * len(xyxy)
+    tracker = state['tracker']
+    if tracker is not None:
+        # Mise à jour même sans détection : les tracks perdus vieillissent
+        with stage_timer('tracking', 'stream'):
+            tracked = tracker.update_with_detections(
+                Detections(xyxy=xyxy, confidence=confidences, class_id=class_ids)
+            )
+        xyxy, confidences, class_ids = tracked.xyxy, tracked.confidence, tracked.class_id
+        track_ids = [int(t) for t in tracked.tracker_id] if tracked.tracker_id is not None else [None] * len(xyxy)
+
+    detections = [
+        tracked_detection(xyxy[i], confidences[i], int(class_ids[i]), track_ids[i], width, height,
+                          f"track_{track_ids[i]}" if track_ids[i] is not None else f"{camera_id}_{state['frame_index']}_{i}")
+        for i in range(len(xyxy))
+    ]
+    # Caméra prioritaire au prochain lot si elle suit des objets de niveau d'alerte élevé
+    state['priority'] = priority_weight(max((d['alertLevel'] for d in detections), default=1))
+    return detections
+
+# Flux configurés au démarrage (STREAM_SOURCES), ajoutés / retirés ensuite via /api/streams
+stream_service = StreamIngestService(process_stream_frame)
+if STREAM_SOURCES and model is not None:
+    for stream_camera_id, stream_source in parse_sources(STREAM_SOURCES):
+        stream_service.add(stream_camera_id, stream_source)
+    print(f"📡 {len(stream_service.streams)} flux caméra démarré(s)")
+
+@app.route('/api/streams', methods=['GET', 'POST', 'OPTIONS'])
+def streams():
+    """
+    GET : état des flux (fps lecture/traitement, frames abandonnées, latence p50/p95)
+    POST : démarrer un flux {"cameraId": "...", "source": "rtsp://..." ou chemin de fichier}
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    if request.method == 'GET':
+        return jsonify({
+            'streams': stream_service.stats(),
+            'scheduler': stream_scheduler.stats() if stream_scheduler is not None else {'batching': False}
+        })
+
+    if model is None:
+        return jsonify({'error': 'Modèle non chargé'}), 500
+    data = request.get_json(silent=True) or {}
+    camera_id = data.get('cameraId')
+    source = data.get('source')
+    if not camera_id or not source:
+        return jsonify({'error': 'Champs "cameraId" et "source" requis'}), 400
+    try:
+        stream = stream_service.add(camera_id, source)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify(stream.stats()), 201
+
+@app.route('/api/streams/<camera_id>', methods=['DELETE', 'OPTIONS'])
+def stop_stream(camera_id):
+    """Arrêter un flux"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    if not stream_service.remove(camera_id):
+        return jsonify({'error': 'Flux introuvable'}), 404
+    return jsonify({'stopped': camera_id})
+
+@app.route('/api/streams/alerts', methods=['GET'])
+def stream_alerts():
+    """Alertes des flux en direct (Server-Sent Events, une alerte par track et par hausse de niveau)"""
+    subscriber = stream_service.alert_bus.subscribe()
+
+    def generate():
+        try:
+            while True:
+                try:
+                    event = subscriber.get(timeout=15)
+                except queue.Empty:
+                    # Commentaire SSE : garde la connexion ouverte derrière les proxys
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"data: {json.dumps(event, default=str)}\n\n"
+        finally:
+            stream_service.alert_bus.unsubscribe(subscriber)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/persistence/stats', methods=['GET', 'OPTIONS'])
+def persistence_stats():
+    """Métriques de la file d'écriture MongoDB différée"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    if persistence_queue is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **persistence_queue.stats()})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Métriques au format texte Prometheus (durées par étape, compteurs, files)"""
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+def profiles_access_required(view):
+    """Refuser la lecture des profils si le profilage est désactivé ou si le jeton manque (403)"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not request_profiler.profiles_readable(
+                request.headers.get(request_profiler.PROFILE_HEADER), request.args.get('profile')):
+            return jsonify({'error': 'Profilage désactivé ou jeton X-Profile invalide'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.route('/api/profiles', methods=['GET'])
+@profiles_access_required
+def list_profiles():
+    """Profils enregistrés (du plus récent au plus ancien)"""
+    return jsonify({'profiles': profile_store.list()})
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+@profiles_access_required
+def get_profile(profile_id):
+    """Rapport d'un profil : fonctions Python (cProfile) et opérateurs torch"""
+    report = profile_store.load(profile_id)
+    if report is None:
+        return jsonify({'error': 'Profil introuvable'}), 404
+    return jsonify(report)
+
+@app.route('/api/profiles/<profile_id>/pstats', methods=['GET'])
+@profiles_access_required
+def download_profile_stats(profile_id):
+    """Fichier pstats brut (snakeviz, python -m pstats)"""
+    path = profile_store.path(profile_id, '.prof')
+    if path is None:
+        return jsonify({'error': 'Profil introuvable'}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f'{profile_id}.prof')
+
+@app.route('/api/detections', methods=['GET', 'OPTIONS'])
+def list_detections():
+    """
+    Historique des détections avec filtres et pagination par curseur
+    
+    Paramètres: from, to (ISO 8601), mediaType, alertLevel, minAlertLevel, label,
+    cameraId, limit (<= 500), cursor (nextCursor de la page précédente),
+    includeDetections=1 (détections des images ; les frames ne sont jamais renvoyées)
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    if not MONGODB_AVAILABLE or not mongodb_service or detection_query is None:
+        return jsonify({'error': 'MongoDB non disponible'}), 500
+    if mongodb_service.collection is None:
+        return jsonify({'error': 'MongoDB non connecté'}), 503
+    
+    try:
+        filters = detection_query.parse_filters(request.args)
+        limit = detection_query.parse_page_size(request.args)
+        page = mongodb_service.query_detections(
+            filters,
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            include_detections=request.args.get('includeDetections') == '1'
+        )
+    except detection_query.QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Erreur lors de la requête: {str(e)}'}), 500
+    
+    return jsonify({
+        'items': [detection_query.serialize_document(doc) for doc in page['items']],
+        'count': len(page['items']),
+        'nextCursor': page['nextCursor']
+    })
+
+@app.route('/api/stats', methods=['GET', 'OPTIONS'])
+def detection_stats():
+    """
+    Statistiques (par label, niveau d'alerte, type, caméra et intervalle) lues dans les rollups
+    
+    Paramètres: granularity (hour|day, défaut day), from, to, cameraId
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    if not MONGODB_AVAILABLE or not mongodb_service or detection_query is None:
+        return jsonify({'error': 'MongoDB non disponible'}), 500
+    if mongodb_service.collection is None:
+        return jsonify({'error': 'MongoDB non connecté'}), 503
+    
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ('hour', 'day'):
+        return jsonify({'error': "granularity doit être 'hour' ou 'day'"}), 400
+    try:
+        filters = detection_query.parse_filters(request.args)
+        return jsonify(mongodb_service.get_statistics(granularity, filters))
+    except detection_query.QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except NotImplementedError as e:
+        return jsonify({'error': str(e)}), 501
+    except Exception as e:
+        return jsonify({'error': f'Erreur lors du calcul des statistiques: {str(e)}'}), 500
+
+@app.route('/api/stats/rebuild', methods=['GET', 'POST', 'OPTIONS'])
+def rebuild_stats():
+    """Reconstruire les rollups depuis l'historique, en arrière-plan (POST), ou lire l'état (GET)"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    if not MONGODB_AVAILABLE or not mongodb_service:
+        return jsonify({'error': 'MongoDB non disponible'}), 500
+    if not rebuild_allowed(request.headers.get(REBUILD_TOKEN_HEADER)):
+        return jsonify({'error': 'Reconstruction désactivée ou jeton X-Rebuild-Token invalide'}), 403
+    
+    if request.method == 'GET':
+        return jsonify(mongodb_service.rollup_rebuild_status())
+    
+    if mongodb_service.collection is None:
+        return jsonify({'error': 'MongoDB non connecté'}), 503
+    
+    try:
+        return jsonify(mongodb_service.start_rollup_rebuild()), 202
+    except NotImplementedError as e:
+        return jsonify({'error': str(e)}), 501
+    except Exception as e:
+        return jsonify({'error': f'Erreur lors de la reconstruction: {str(e)}'}), 500
+
+@app.route('/api/export', methods=['GET', 'OPTIONS'])
+def export_detections():
+    """
+    Export en flux des détections stockées (une ligne par détection)
+    
+    Paramètres: format (csv|jsonl|parquet, défaut csv) et les mêmes filtres que /api/detections
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    if not MONGODB_AVAILABLE or not mongodb_service or detection_export is None:
+        return jsonify({'error': 'MongoDB non disponible'}), 500
+    if mongodb_service.collection is None:
+        return jsonify({'error': 'MongoDB non connecté'}), 503
+    
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in detection_export.EXPORT_FORMATS:
+        return jsonify({'error': f"Format inconnu '{fmt}' (csv, jsonl ou parquet)"}), 400
+    if fmt == 'parquet' and not detection_export.parquet_available():
+        return jsonify({'error': 'Export Parquet indisponible. Installez pyarrow: pip install pyarrow'}), 501
+    try:
+        filters = detection_query.parse_filters(request.args)
+    except detection_query.QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    batch_size = detection_export.EXPORT_BATCH_SIZE
+    rows = mongodb_service.iter_detection_rows(filters, batch_size=batch_size)
+    mimetype, extension = detection_export.EXPORT_FORMATS[fmt]
+    filename = f"detections_{time.strftime('%Y%m%d_%H%M%S')}.{extension}"
+    
+    # Réponse chunked : le fichier est produit au fil de la lecture du curseur
+    return Response(
+        stream_with_context(detection_export.stream_export(rows, fmt, batch_size)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 @app.route('/api/export-csv', methods=['POST', 'OPTIONS'])
 def export_csv():
     """Endpoint pour exporter les détections en CSV"""
@@ -1732,6 +2637,33 @@ def export_mongodb():
         print(f"   Fichier: {filename}")
         print(f"   Clés disponibles: {list(data.keys())}")
         
+        # Déjà enregistré (sauvegarde automatique de /api/detect ou export précédent) :
+        # empreinte du média renvoyée par /api/detect, sinon mêmes détections pour le même fichier
+        if DEDUP_ENABLED:
+            existing_id = None
+            media_hash = data.get('contentHash')
+            if media_hash:
+                cached = recent_results.get(media_hash)
+                existing = mongodb_service.find_by_content_hash(media_hash) if cached is None else None
+                existing_id = cached[0] if cached is not None else (str(existing['_id']) if existing else None)
+            if existing_id is None:
+                if media_type == 'video':
+                    result_hash = detection_schema.video_result_hash(data.get('frames', []))
+                else:
+                    result_hash = detection_schema.image_result_hash(data.get('detections', []))
+                existing = mongodb_service.find_by_result_hash(result_hash, media_type, filename)
+                existing_id = str(existing['_id']) if existing else None
+            if existing_id is not None:
+                print(f"♻️ Déjà enregistré dans MongoDB (ID: {existing_id}) - export ignoré")
+                return jsonify({
+                    'success': True,
+                    'message': 'Détections déjà enregistrées dans MongoDB',
+                    'mongoId': existing_id,
+                    'mediaType': media_type,
+                    'filename': filename,
+                    'duplicate': True
+                })
+        
         if media_type == 'video':
             # Gestion vidéo
             frames = data.get('frames', [])
@@ -1786,7 +2718,8 @@ def export_mongodb():
                 'mongoId': mongo_id,
                 'mediaType': media_type,
                 'filename': filename,
-                'detectionCount': detection_count
+                'detectionCount': detection_count,
+                'duplicate': False
             })
         else:
             print("❌ Échec de la sauvegarde MongoDB (mongo_id est None)")
@@ -1799,11 +2732,7 @@ def export_mongodb():
     except Exception as e:
         error_msg = str(e)
         error_type = type(e).__name__
-        print(f"❌ Erreur lors de l'export MongoDB:")
-        print(f"   Type: {error_type}")
-        print(f"   Message: {error_msg}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Erreur lors de l'export MongoDB (%s): %s", error_type, error_msg)
         return jsonify({
             'error': f'Erreur lors de l\'export MongoDB: {error_msg}',
             'errorType': error_type
@@ -1815,7 +2744,7 @@ def not_found(error):
     return jsonify({
         'error': 'Route non trouvée',
         'message': f'La route {request.path} n\'existe pas',
-        'available_routes': ['/', '/api/health', '/api/detect', '/api/detect-video', '/api/export-csv', '/api/export-mongodb']
+        'available_routes': ['/', '/api/health', '/api/detect', '/api/detect-video', '/api/anomaly/calibrate', '/api/persistence/stats', '/metrics', '/api/profiles', '/api/streams', '/api/streams/alerts', '/api/detections', '/api/stats', '/api/stats/rebuild', '/api/export', '/api/export-csv', '/api/export-mongodb']
     }), 404
 
 @app.errorhandler(500)
@@ -1836,6 +2765,42 @@ def handle_preflight():
         response.headers.add('Access-Control-Allow-Methods', "*")
         return response
 
+@app.before_request
+def start_request_timer():
+    """Début du chronométrage de la requête (fod_http_request_duration_seconds)"""
+    g.request_start = time.perf_counter()
+
+@app.before_request
+def bind_request_id():
+    """Identifiant de corrélation repris de l'en-tête X-Request-ID (ou généré), ajouté aux logs"""
+    g.request_id = request.headers.get(REQUEST_ID_HEADER) or new_request_id()
+    g.request_id_token = request_id_var.set(g.request_id)
+
+@app.after_request
+def observe_request_duration(response):
+    """Durée de la requête par route (gabarit de route, pas l'URL : cardinalité bornée)"""
+    start = getattr(g, 'request_start', None)
+    if start is not None and metrics.METRICS_ENABLED:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - start, endpoint=endpoint, method=request.method, status=response.status_code
+        )
+    return response
+
+@app.after_request
+def add_request_id_header(response):
+    """Renvoyer l'identifiant de corrélation au client"""
+    request_id = getattr(g, 'request_id', None)
+    if request_id:
+        response.headers[REQUEST_ID_HEADER] = request_id
+    return response
+
+@app.teardown_request
+def reset_request_id(exc=None):
+    token = getattr(g, 'request_id_token', None)
+    if token is not None:
+        request_id_var.reset(token)
+
 if __name__ == '__main__':
     if model is None:
         print("\n⚠️  ATTENTION: Le modèle n'est pas chargé!")
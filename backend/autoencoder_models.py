@@ -0,0 +1,220 @@
+"""
+Registre des architectures d'auto-encoder et chargement des checkpoints
+
+Un checkpoint qui ne contient qu'un state_dict est reconstruit en nn.Module
+grâce au manifeste d'architecture stocké à côté du fichier .pth
+(autoencoder_fod.pth -> autoencoder_fod.json) :
+
+    {
+        "architecture": "conv_autoencoder",
+        "params": {"in_channels": 3, "channels": [16, 32, 64]},
+        "input_size": 224
+    }
+
+Le modèle peut aussi être exporté en TorchScript ou ONNX pour une inférence
+CPU plus rapide :
+
+    python autoencoder_models.py --format torchscript
+    python autoencoder_models.py --format onnx
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+# Format d'inférence préféré : 'pytorch', 'torchscript' ou 'onnx'
+# (retombe sur le .pth si l'artefact exporté n'existe pas)
+AUTOENCODER_BACKEND = os.getenv('AUTOENCODER_BACKEND', 'pytorch').lower()
+
+# Registre {nom: classe nn.Module}
+AUTOENCODER_ARCHITECTURES = {}
+
+
+def register_architecture(name: str):
+    """Décorateur pour enregistrer une architecture d'auto-encoder"""
+    def decorator(cls):
+        AUTOENCODER_ARCHITECTURES[name] = cls
+        return cls
+    return decorator
+
+
+@register_architecture('conv_autoencoder')
+class ConvAutoencoder(nn.Module):
+    """
+    Auto-encoder convolutionnel symétrique
+    Chaque étage divise la résolution par 2 (encodeur) puis la restaure (décodeur)
+    """
+    def __init__(self, in_channels: int = 3, channels: Optional[List[int]] = None):
+        super().__init__()
+        channels = channels or [16, 32, 64]
+
+        encoder = []
+        prev = in_channels
+        for ch in channels:
+            encoder += [nn.Conv2d(prev, ch, kernel_size=3, stride=2, padding=1), nn.ReLU(inplace=True)]
+            prev = ch
+        self.encoder = nn.Sequential(*encoder)
+
+        decoder = []
+        for ch in reversed([in_channels] + channels[:-1]):
+            decoder += [nn.ConvTranspose2d(prev, ch, kernel_size=3, stride=2, padding=1, output_padding=1)]
+            decoder += [nn.ReLU(inplace=True)] if ch != in_channels else [nn.Sigmoid()]
+            prev = ch
+        self.decoder = nn.Sequential(*decoder)
+
+    def forward(self, x):
+        return self.decoder(self.encoder(x))
+
+
+class OnnxAutoencoder(nn.Module):
+    """Enveloppe une session onnxruntime pour l'utiliser comme un nn.Module"""
+    def __init__(self, onnx_path: Path, providers: Optional[List[str]] = None):
+        super().__init__()
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(str(onnx_path), providers=providers or ['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+    def forward(self, x):
+        output = self.session.run([self.output_name], {self.input_name: x.detach().cpu().numpy().astype(np.float32)})[0]
+        return torch.from_numpy(output).to(x.device)
+
+
+def manifest_path_for(checkpoint_path: Path) -> Path:
+    """Chemin du manifeste d'architecture associé à un checkpoint"""
+    return Path(checkpoint_path).with_suffix('.json')
+
+
+def load_manifest(checkpoint_path: Path) -> Optional[Dict]:
+    """Lire le manifeste d'architecture, ou None s'il n'existe pas"""
+    path = manifest_path_for(checkpoint_path)
+    if not path.exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_from_manifest(manifest: Dict) -> nn.Module:
+    """Instancier l'architecture décrite par le manifeste"""
+    name = manifest.get('architecture')
+    if name not in AUTOENCODER_ARCHITECTURES:
+        raise ValueError(f"Architecture inconnue '{name}'. Disponibles: {list(AUTOENCODER_ARCHITECTURES)}")
+    return AUTOENCODER_ARCHITECTURES[name](**manifest.get('params', {}))
+
+
+def _extract_state_dict(checkpoint) -> Optional[Dict]:
+    """Retourne le state_dict contenu dans un checkpoint, ou None"""
+    if not isinstance(checkpoint, dict):
+        return None
+    if 'state_dict' in checkpoint:
+        return checkpoint['state_dict']
+    if 'model_state_dict' in checkpoint:
+        return checkpoint['model_state_dict']
+    if checkpoint and all(isinstance(v, torch.Tensor) for v in checkpoint.values()):
+        return checkpoint
+    return None
+
+
+def load_autoencoder(checkpoint_path: Path, device: str = 'cpu',
+                     backend: str = AUTOENCODER_BACKEND) -> Tuple[nn.Module, Dict]:
+    """
+    Charger l'auto-encoder en nn.Module prêt pour l'inférence
+
+    Args:
+        checkpoint_path: Chemin du checkpoint .pth
+        device: Device ('cpu' ou 'cuda')
+        backend: 'pytorch', 'torchscript' (.torchscript) ou 'onnx' (.onnx)
+
+    Returns:
+        (modèle en mode eval, manifeste)
+
+    Raises:
+        ValueError si le checkpoint ne contient qu'un state_dict sans manifeste
+    """
+    checkpoint_path = Path(checkpoint_path)
+    manifest = load_manifest(checkpoint_path) or {}
+
+    # Artefacts exportés (si demandés et présents)
+    if backend == 'torchscript' and checkpoint_path.with_suffix('.torchscript').exists():
+        model = torch.jit.load(str(checkpoint_path.with_suffix('.torchscript')), map_location=device)
+        return model.eval(), manifest
+    if backend == 'onnx' and checkpoint_path.with_suffix('.onnx').exists():
+        providers = ['CUDAExecutionProvider', 'CPUExecutionProvider'] if device == 'cuda' else ['CPUExecutionProvider']
+        return OnnxAutoencoder(checkpoint_path.with_suffix('.onnx'), providers).eval(), manifest
+
+    checkpoint = torch.load(str(checkpoint_path), map_location=device, weights_only=False)
+
+    if isinstance(checkpoint, nn.Module):
+        model = checkpoint
+    elif isinstance(checkpoint, dict) and isinstance(checkpoint.get('model'), nn.Module):
+        model = checkpoint['model']
+    else:
+        state_dict = _extract_state_dict(checkpoint)
+        if state_dict is None:
+            raise ValueError("Format de checkpoint auto-encoder non reconnu")
+        # Le manifeste peut aussi être embarqué dans le checkpoint
+        if not manifest and isinstance(checkpoint, dict) and 'architecture' in checkpoint:
+            manifest = {k: checkpoint[k] for k in ('architecture', 'params', 'input_size') if k in checkpoint}
+        if not manifest:
+            raise ValueError(
+                f"Checkpoint avec seulement state_dict : manifeste d'architecture requis "
+                f"({manifest_path_for(checkpoint_path).name})"
+            )
+        model = build_from_manifest(manifest)
+        model.load_state_dict(state_dict)
+
+    return model.to(device).eval(), manifest
+
+
+def export_autoencoder(model: nn.Module, checkpoint_path: Path, fmt: str = 'torchscript',
+                       input_size: int = 224) -> Path:
+    """
+    Exporter l'auto-encoder en TorchScript (.torchscript) ou ONNX (.onnx) à côté du checkpoint
+
+    Returns:
+        Chemin de l'artefact exporté
+    """
+    model = model.cpu().eval()
+    dummy = torch.rand(1, 3, input_size, input_size)
+    if fmt == 'torchscript':
+        output_path = Path(checkpoint_path).with_suffix('.torchscript')
+        with torch.no_grad():
+            traced = torch.jit.trace(model, dummy)
+        traced = torch.jit.freeze(traced)
+        traced.save(str(output_path))
+    elif fmt == 'onnx':
+        output_path = Path(checkpoint_path).with_suffix('.onnx')
+        torch.onnx.export(
+            model, dummy, str(output_path),
+            input_names=['input'], output_names=['reconstruction'],
+            dynamic_axes={'input': {0: 'batch'}, 'reconstruction': {0: 'batch'}},
+            opset_version=17
+        )
+    else:
+        raise ValueError(f"Format d'export inconnu: {fmt}")
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporter l'auto-encoder FOD en TorchScript ou ONNX")
+    parser.add_argument('--checkpoint', default=str(Path(__file__).parent / "autoencoder_fod.pth"))
+    parser.add_argument('--format', choices=['torchscript', 'onnx'], default='torchscript')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("📦 EXPORT DE L'AUTO-ENCODER")
+    print("=" * 60)
+
+    try:
+        ae_model, ae_manifest = load_autoencoder(Path(args.checkpoint), backend='pytorch')
+        exported = export_autoencoder(ae_model, Path(args.checkpoint), args.format,
+                                      input_size=ae_manifest.get('input_size', 224))
+        print(f"✅ Auto-encoder exporté: {exported}")
+        print(f"   Activez-le avec AUTOENCODER_BACKEND={args.format}")
+    except Exception as e:
+        print(f"❌ Erreur lors de l'export: {e}")
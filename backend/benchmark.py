@@ -0,0 +1,447 @@
+#!/usr/bin/env python
+"""
+Benchmark reproductible du pipeline de détection (CPU uniquement)
+
+Génère des entrées synthétiques (piste avec débris, comme create_test_video.py mais
+sans dépendre du dossier images/), puis mesure latence p50/p95/p99 et débit pour :
+- POST /api/detect (YOLO et ONNX si best.onnx est présent) par résolution et imgsz
+- POST /api/detect-video par résolution, frame_skip et imgsz
+- le décodage vidéo seul, par décodeur (OpenCV, PyAV si installé) et largeur de sortie
+- les sauvegardes en base (synchrone et via la file d'écriture différée)
+
+Les requêtes passent par le client de test Flask (pas de réseau). Les résultats sont
+écrits en JSON et peuvent être comparés à une référence enregistrée.
+
+Utilisation:
+    python benchmark.py --quick
+    python benchmark.py --output resultats.json --save-baseline
+    python benchmark.py --baseline benchmark_baseline.json --tolerance 0.10
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+BACKEND_DIR = Path(__file__).parent
+DEFAULT_OUTPUT = BACKEND_DIR / "benchmark_results.json"
+DEFAULT_BASELINE = BACKEND_DIR / "benchmark_baseline.json"
+
+
+# ----------------------------------------------------------------------
+# Entrées synthétiques
+# ----------------------------------------------------------------------
+def synthetic_runway(width: int, height: int, rng: np.random.Generator, n_objects: int = 4) -> np.ndarray:
+    """
+    Image BGR d'une portion de piste : asphalte bruité, marquage central, petits débris
+
+    Args:
+        width: Largeur en pixels
+        height: Hauteur en pixels
+        rng: Générateur aléatoire (graine fixée pour la reproductibilité)
+        n_objects: Nombre de débris dessinés
+
+    Returns:
+        Tableau uint8 (height, width, 3)
+    """
+    asphalt = rng.normal(95, 12, (height, width, 1)).clip(0, 255).astype(np.uint8)
+    img = np.repeat(asphalt, 3, axis=2)
+    # Marquage central en tirets
+    dash = max(height // 8, 4)
+    x_center = width // 2
+    line_w = max(width // 160, 2)
+    for y in range(0, height, 2 * dash):
+        cv2.rectangle(img, (x_center - line_w, y), (x_center + line_w, y + dash), (235, 235, 235), -1)
+    # Débris : boulons, fragments métalliques, morceaux de caoutchouc
+    for _ in range(n_objects):
+        size = int(width * rng.uniform(0.005, 0.03)) + 2
+        x = int(rng.integers(size, width - size))
+        y = int(rng.integers(size, height - size))
+        color = tuple(int(c) for c in rng.integers(20, 230, 3))
+        if rng.random() < 0.5:
+            cv2.circle(img, (x, y), size, color, -1)
+        else:
+            cv2.rectangle(img, (x - size, y - size // 2), (x + size, y + size // 2), color, -1)
+    return img
+
+
+def synthetic_image_bytes(width: int, height: int, seed: int = 0) -> bytes:
+    """Image synthétique encodée en JPEG"""
+    img = synthetic_runway(width, height, np.random.default_rng(seed))
+    ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise RuntimeError("Encodage JPEG impossible")
+    return buffer.tobytes()
+
+
+def synthetic_video_bytes(width: int, height: int, frames: int, fps: int = 30, seed: int = 0) -> bytes:
+    """
+    Vidéo MP4 synthétique : la caméra remonte une piste continue (défilement vertical)
+
+    Args:
+        width: Largeur en pixels
+        height: Hauteur en pixels
+        frames: Nombre de frames
+        fps: Images par seconde
+        seed: Graine aléatoire
+
+    Returns:
+        Octets du fichier MP4
+    """
+    rng = np.random.default_rng(seed)
+    track = synthetic_runway(width, height * 4, rng, n_objects=16)
+    total_distance = track.shape[0] - height
+    with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as tmp_file:
+        path = tmp_file.name
+    try:
+        out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+        if not out.isOpened():
+            raise RuntimeError("Impossible de créer la vidéo synthétique (codec mp4v)")
+        for frame_num in range(frames):
+            y = int(frame_num / max(frames - 1, 1) * total_distance)
+            out.write(track[y:y + height])
+        out.release()
+        return Path(path).read_bytes()
+    finally:
+        os.unlink(path)
+
+
+def synthetic_detections(count: int, rng: np.random.Generator):
+    """Détections au format renvoyé par /api/detect (pour les mesures de sauvegarde)"""
+    labels = ['Bolt', 'Nut', 'Metal sheet', 'Rubber', 'Plastic']
+    detections = []
+    for i in range(count):
+        x, y = rng.uniform(0, 90, 2)
+        detections.append({
+            'id': f'bench_{i}',
+            'label': labels[i % len(labels)],
+            'confidence': float(rng.uniform(0.2, 1.0)),
+            'riskLevel': 'Medium',
+            'alertLevel': int(rng.integers(1, 4)),
+            'alertType': 'NORMAL',
+            'sizeMeters': 0.05,
+            'sizeCm': 5.0,
+            'position': {'x': float(x), 'y': float(y)},
+            'bbox': {'x': float(x), 'y': float(y), 'width': 2.0, 'height': 2.0},
+            'hasSegmentation': False,
+            'segmentationMask': None
+        })
+    return detections
+
+
+# ----------------------------------------------------------------------
+# Statistiques et comparaison
+# ----------------------------------------------------------------------
+def summarize(samples, items_per_sample: int = 1) -> dict:
+    """
+    Résumé d'une série de durées (secondes)
+
+    Args:
+        samples: Durées mesurées, une par exécution
+        items_per_sample: Unités traitées par exécution (frames pour une vidéo)
+
+    Returns:
+        Dict avec n, mean/p50/p95/p99/min/max en millisecondes et throughput_per_s
+    """
+    values = np.asarray(samples, dtype=float)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    total = float(values.sum())
+    return {
+        'n': int(len(values)),
+        'mean_ms': round(float(values.mean()) * 1000, 3),
+        'p50_ms': round(float(p50) * 1000, 3),
+        'p95_ms': round(float(p95) * 1000, 3),
+        'p99_ms': round(float(p99) * 1000, 3),
+        'min_ms': round(float(values.min()) * 1000, 3),
+        'max_ms': round(float(values.max()) * 1000, 3),
+        'throughput_per_s': round(len(values) * items_per_sample / total, 3) if total > 0 else None
+    }
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float):
+    """
+    Comparer p50/p95 à la référence
+
+    Returns:
+        Liste des régressions (clé, métrique, référence, actuel, ratio)
+    """
+    regressions = []
+    print(f"\n{'Scénario':<48} {'p50 réf':>10} {'p50':>10} {'p95 réf':>10} {'p95':>10}")
+    for key, current in sorted(results.items()):
+        reference = baseline.get('results', {}).get(key)
+        if reference is None or 'p50_ms' not in current or 'p50_ms' not in reference:
+            continue
+        flags = ''
+        for metric in ('p50_ms', 'p95_ms'):
+            if reference[metric] > 0:
+                ratio = current[metric] / reference[metric]
+                if ratio > 1 + tolerance:
+                    regressions.append((key, metric, reference[metric], current[metric], ratio))
+                    flags += f" ⚠️ {metric} x{ratio:.2f}"
+        print(f"{key:<48} {reference['p50_ms']:>10.1f} {current['p50_ms']:>10.1f} "
+              f"{reference['p95_ms']:>10.1f} {current['p95_ms']:>10.1f}{flags}")
+    return regressions
+
+
+# ----------------------------------------------------------------------
+# Exécution
+# ----------------------------------------------------------------------
+def load_app():
+    """Importer l'application en mode benchmark (CPU, base dédiée, pas de déduplication)"""
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    os.environ.setdefault('DEDUP_ENABLED', '0')
+    os.environ.setdefault('MONGODB_DATABASE', 'fod_benchmark')
+    os.environ.setdefault('SQLITE_PATH', str(Path(tempfile.gettempdir()) / 'fod_benchmark.db'))
+    os.environ.setdefault('PERSISTENCE_SPILL_PATH', str(Path(tempfile.gettempdir()) / 'fod_benchmark_spill.jsonl'))
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    sys.path.insert(0, str(BACKEND_DIR))
+    import app as app_module
+    return app_module
+
+
+def time_request(client, url: str, data_factory, repeats: int, warmup: int):
+    """
+    Durées (s) de `repeats` requêtes après `warmup` requêtes non mesurées
+
+    data_factory construit le formulaire à chaque requête (le client de test consomme
+    les flux de fichiers). Lève RuntimeError si une réponse n'est pas 200.
+    """
+    samples = []
+    for i in range(warmup + repeats):
+        start = time.perf_counter()
+        response = client.post(url, data=data_factory(), content_type='multipart/form-data')
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"{url}: HTTP {response.status_code} {response.get_data(as_text=True)[:200]}")
+        if i >= warmup:
+            samples.append(elapsed)
+    return samples, response.get_json()
+
+
+def bench_images(app_module, client, args, results: dict):
+    model_types = ['yolo']
+    if app_module.ONNX_MODEL_PATH.exists() and not args.skip_onnx:
+        model_types.append('onnx')
+
+    for model_type in model_types:
+        switch = client.post('/api/model/switch', json={'modelType': model_type})
+        if switch.status_code != 200:
+            print(f"⚠️ Modèle {model_type} indisponible: {switch.get_json()}")
+            continue
+        for width, height in args.image_sizes:
+            image_bytes = synthetic_image_bytes(width, height, seed=args.seed)
+            for imgsz in args.imgsz:
+                key = f"image/{model_type}/{width}x{height}/imgsz{imgsz}"
+                factory = lambda: {'image': (io.BytesIO(image_bytes), 'bench.jpg'), 'imgsz': str(imgsz)}
+                samples, _ = time_request(client, '/api/detect', factory, args.repeats, args.warmup)
+                results[key] = summarize(samples)
+                print(f"   {key:<48} p50 {results[key]['p50_ms']:>9.1f} ms  p95 {results[key]['p95_ms']:>9.1f} ms")
+    client.post('/api/model/switch', json={'modelType': 'yolo'})
+
+
+def bench_videos(client, args, results: dict):
+    for width, height in args.video_sizes:
+        video_bytes = synthetic_video_bytes(width, height, args.video_frames, seed=args.seed)
+        for frame_skip in args.frame_skip:
+            for imgsz in args.video_imgsz:
+                key = f"video/{width}x{height}/skip{frame_skip}/imgsz{imgsz}"
+                factory = lambda: {'video': (io.BytesIO(video_bytes), 'bench.mp4'),
+                                   'frameSkip': str(frame_skip), 'imgsz': str(imgsz)}
+                samples, response = time_request(client, '/api/detect-video', factory,
+                                                 args.video_repeats, args.video_warmup)
+                # Débit en frames de la vidéo source par seconde
+                results[key] = summarize(samples, items_per_sample=response.get('totalFrames') or args.video_frames)
+                print(f"   {key:<48} p50 {results[key]['p50_ms']:>9.1f} ms  "
+                      f"{results[key]['throughput_per_s']:>7.1f} frames/s")
+
+
+def bench_decode(args, results: dict):
+    from video_decoding import open_video, PYAV_AVAILABLE
+    decoders = ['opencv'] + (['pyav'] if PYAV_AVAILABLE else [])
+    for width, height in args.video_sizes:
+        video_bytes = synthetic_video_bytes(width, height, args.video_frames, seed=args.seed)
+        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as tmp_file:
+            tmp_file.write(video_bytes)
+            path = tmp_file.name
+        try:
+            for decoder in decoders:
+                for output_width in args.decode_widths:
+                    samples = []
+                    for _ in range(args.video_repeats + args.video_warmup):
+                        start = time.perf_counter()
+                        reader = open_video(path, output_width=output_width, decoder=decoder)
+                        frames = 0
+                        while reader.read()[0]:
+                            frames += 1
+                        reader.release()
+                        samples.append(time.perf_counter() - start)
+                    key = f"decode/{width}x{height}/{decoder}/w{output_width or width}"
+                    results[key] = summarize(samples[args.video_warmup:], items_per_sample=frames)
+                    print(f"   {key:<48} p50 {results[key]['p50_ms']:>9.1f} ms  "
+                          f"{results[key]['throughput_per_s']:>7.1f} frames/s")
+        finally:
+            os.unlink(path)
+
+
+def bench_storage(app_module, args, results: dict):
+    storage = app_module.mongodb_service
+    if storage is None or not storage.is_connected():
+        print("⚠️ Stockage non joignable - mesures de sauvegarde ignorées")
+        return
+    rng = np.random.default_rng(args.seed)
+    for count in args.detection_counts:
+        detections = synthetic_detections(count, rng)
+        samples = []
+        for _ in range(args.storage_repeats):
+            start = time.perf_counter()
+            storage.save_image_detection(detections=detections, image_filename='bench.jpg',
+                                         image_size={'width': 1280, 'height': 720}, metadata={'benchmark': True})
+            samples.append(time.perf_counter() - start)
+        key = f"storage/{storage.name}/image_sync/{count}det"
+        results[key] = summarize(samples)
+        print(f"   {key:<48} p50 {results[key]['p50_ms']:>9.1f} ms  p99 {results[key]['p99_ms']:>9.1f} ms")
+
+        if app_module.persistence_queue is not None:
+            samples = []
+            for _ in range(args.storage_repeats):
+                start = time.perf_counter()
+                app_module.persistence_queue.submit_image(detections=detections, image_filename='bench.jpg',
+                                                          image_size={'width': 1280, 'height': 720},
+                                                          metadata={'benchmark': True})
+                samples.append(time.perf_counter() - start)
+            key = f"storage/{storage.name}/image_queued/{count}det"
+            results[key] = summarize(samples)
+            print(f"   {key:<48} p50 {results[key]['p50_ms']:>9.3f} ms  p99 {results[key]['p99_ms']:>9.3f} ms")
+
+    frames = [{'frame': i, 'time': i / 30, 'detections': synthetic_detections(3, rng)} for i in range(args.video_frames)]
+    for detection in (d for frame in frames for d in frame['detections']):
+        detection['trackId'] = int(rng.integers(1, 20))
+    samples = []
+    for _ in range(max(args.storage_repeats // 10, 3)):
+        start = time.perf_counter()
+        storage.save_video_detection(frames=frames, video_filename='bench.mp4',
+                                     video_info={'fps': 30, 'totalFrames': len(frames)}, metadata={'benchmark': True})
+        samples.append(time.perf_counter() - start)
+    key = f"storage/{storage.name}/video_sync/{len(frames)}frames"
+    results[key] = summarize(samples)
+    print(f"   {key:<48} p50 {results[key]['p50_ms']:>9.1f} ms")
+
+
+def environment_info(app_module) -> dict:
+    import torch
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'torch_threads': torch.get_num_threads(),
+        'model_version': app_module.MODEL_VERSION,
+        'precision': app_module.precision_policy.describe('cpu')
+    }
+
+
+def parse_sizes(value: str):
+    """'640x480,1280x720' -> [(640, 480), (1280, 720)]"""
+    return [tuple(int(v) for v in size.lower().split('x')) for size in value.split(',') if size.strip()]
+
+
+def parse_ints(value: str):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark CPU du pipeline de détection FOD")
+    parser.add_argument('--output', default=str(DEFAULT_OUTPUT))
+    parser.add_argument('--baseline', default=None, help="Référence JSON à comparer (régression => code 1)")
+    parser.add_argument('--save-baseline', action='store_true', help=f"Enregistrer aussi les résultats dans {DEFAULT_BASELINE.name}")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Dégradation tolérée de p50/p95 (0.10 = 10%%)")
+    parser.add_argument('--quick', action='store_true', help="Grille réduite pour une vérification rapide")
+    parser.add_argument('--only', choices=['image', 'video', 'decode', 'storage'], action='append')
+    parser.add_argument('--threads', type=int, default=None, help="torch.set_num_threads (fixer pour comparer)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--image-sizes', type=parse_sizes, default=parse_sizes('640x480,1280x720,1920x1080'))
+    parser.add_argument('--imgsz', type=parse_ints, default=parse_ints('320,416,640'))
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--skip-onnx', action='store_true')
+    parser.add_argument('--video-sizes', type=parse_sizes, default=parse_sizes('640x480,1280x720'))
+    parser.add_argument('--video-frames', type=int, default=90)
+    parser.add_argument('--frame-skip', type=parse_ints, default=parse_ints('1,3,5'))
+    parser.add_argument('--video-imgsz', type=parse_ints, default=parse_ints('416'))
+    parser.add_argument('--video-repeats', type=int, default=3)
+    parser.add_argument('--video-warmup', type=int, default=1)
+    parser.add_argument('--decode-widths', type=parse_ints, default=parse_ints('0,640'),
+                        help="Largeurs de sortie du décodeur (0 = d'origine)")
+    parser.add_argument('--detection-counts', type=parse_ints, default=parse_ints('0,5,50'))
+    parser.add_argument('--storage-repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.quick:
+        args.image_sizes, args.imgsz, args.repeats, args.warmup = [(640, 480)], [416, 640], 5, 1
+        args.video_sizes, args.video_frames, args.frame_skip, args.video_repeats = [(640, 480)], 30, [5], 1
+        args.detection_counts, args.storage_repeats = [5], 10
+
+    app_module = load_app()
+    import torch
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    if app_module.model is None:
+        print("❌ Modèle YOLO non chargé - benchmark impossible")
+        sys.exit(2)
+
+    sections = set(args.only or ['image', 'video', 'decode', 'storage'])
+    client = app_module.app.test_client()
+    results = {}
+
+    print("=" * 60)
+    print(f"⏱️  Benchmark CPU ({torch.get_num_threads()} threads), sections: {', '.join(sorted(sections))}")
+    print("=" * 60)
+    if 'image' in sections:
+        print("\n🖼️  /api/detect")
+        bench_images(app_module, client, args, results)
+    if 'video' in sections:
+        print("\n🎬 /api/detect-video")
+        bench_videos(client, args, results)
+    if 'decode' in sections:
+        print("\n🎞️  Décodage vidéo")
+        bench_decode(args, results)
+    if 'storage' in sections:
+        print("\n💾 Sauvegardes")
+        bench_storage(app_module, args, results)
+
+    report = {'environment': environment_info(app_module), 'config': {
+        key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'save_baseline')
+    }, 'results': results}
+    Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f"\n📁 Résultats: {args.output}")
+    if args.save_baseline:
+        DEFAULT_BASELINE.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"📌 Référence enregistrée: {DEFAULT_BASELINE}")
+
+    if app_module.persistence_queue is not None:
+        app_module.persistence_queue.stop()
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} régression(s) au-delà de {args.tolerance:.0%}")
+            sys.exit(1)
+        print(f"\n✅ Aucune régression au-delà de {args.tolerance:.0%}")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Vérification de parité des détections entre FP32 et une politique de précision réduite
+
+Compare, image par image, les boxes YOLO obtenues en FP32 (référence) avec celles
+obtenues sous la politique demandée (FP16/BF16, channels-last). Une box est
+considérée identique si la classe est la même et l'IoU >= --iou.
+
+Utilisation:
+    python check_precision_parity.py --precision bf16 --channels-last
+    python check_precision_parity.py --images ../images --precision fp16 --min-match 0.98
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+
+from inference_precision import PrecisionPolicy
+
+BASE_DIR = Path(__file__).parent.parent
+MODEL_PATH = BASE_DIR / "yolov8n_fod_final_v7" / "weights" / "best.pt"
+IMAGES_DIR = BASE_DIR / "images"
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Matrice d'IoU entre deux ensembles de boxes xyxy (N, 4) et (M, 4)"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def run_detection(model, img_array, policy: PrecisionPolicy, device: str, imgsz: int, conf: float):
+    """Retourne (xyxy, classes, confiances) pour une image sous une politique donnée"""
+    with policy.context(device):
+        results = model(img_array, conf=conf, imgsz=imgsz, device=device, verbose=False, **policy.yolo_kwargs(device))
+    boxes = results[0].boxes
+    if boxes is None or len(boxes) == 0:
+        return np.zeros((0, 4)), np.zeros(0, dtype=int), np.zeros(0)
+    return (boxes.xyxy.float().cpu().numpy(),
+            boxes.cls.float().cpu().numpy().astype(int),
+            boxes.conf.float().cpu().numpy())
+
+
+def match_detections(ref, cand, iou_threshold: float):
+    """Appariement glouton par classe ; retourne (nb appariés, écarts de confiance)"""
+    ref_xyxy, ref_cls, ref_conf = ref
+    cand_xyxy, cand_cls, cand_conf = cand
+    ious = box_iou(ref_xyxy, cand_xyxy)
+    used = set()
+    matched = 0
+    conf_deltas = []
+    for i in np.argsort(-ref_conf):
+        best_j, best_iou = None, iou_threshold
+        for j in range(len(cand_xyxy)):
+            if j in used or cand_cls[j] != ref_cls[i]:
+                continue
+            if ious[i, j] >= best_iou:
+                best_j, best_iou = j, ious[i, j]
+        if best_j is not None:
+            used.add(best_j)
+            matched += 1
+            conf_deltas.append(abs(float(ref_conf[i]) - float(cand_conf[best_j])))
+    return matched, conf_deltas
+
+
+def check_parity(images_dir: Path, precision: str, channels_last: bool,
+                 imgsz: int = 640, conf: float = 0.2, iou_threshold: float = 0.9,
+                 min_match: float = 0.98) -> bool:
+    """Exécute la vérification et retourne True si la parité est respectée"""
+    from ultralytics import YOLO
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    image_files = sorted(list(images_dir.glob("*.png")) + list(images_dir.glob("*.jpg")))
+    if not image_files:
+        print(f"❌ Aucune image trouvée dans {images_dir}")
+        return False
+
+    reference_policy = PrecisionPolicy('fp32', channels_last=False)
+    candidate_policy = PrecisionPolicy(precision, channels_last=channels_last)
+
+    print(f"📁 Images: {len(image_files)} ({images_dir})")
+    print(f"⚡ Device: {device.upper()}")
+    print(f"🎚️  Candidat: {candidate_policy.describe(device)}")
+
+    # Deux instances pour ne pas mélanger les formats mémoire des poids
+    reference_model = YOLO(str(MODEL_PATH))
+    candidate_model = YOLO(str(MODEL_PATH))
+    candidate_model.model = candidate_policy.prepare_module(candidate_model.model)
+
+    total_ref = total_cand = total_matched = 0
+    all_deltas = []
+    for img_path in image_files:
+        img_array = np.array(Image.open(img_path).convert('RGB'))
+        ref = run_detection(reference_model, img_array, reference_policy, device, imgsz, conf)
+        cand = run_detection(candidate_model, img_array, candidate_policy, device, imgsz, conf)
+        matched, deltas = match_detections(ref, cand, iou_threshold)
+        total_ref += len(ref[0])
+        total_cand += len(cand[0])
+        total_matched += matched
+        all_deltas += deltas
+        if matched != len(ref[0]) or matched != len(cand[0]):
+            print(f"   ⚠️ {img_path.name}: {len(ref[0])} box(es) FP32, {len(cand[0])} candidate(s), {matched} appariée(s)")
+
+    recall = total_matched / total_ref if total_ref else 1.0
+    precision_ratio = total_matched / total_cand if total_cand else 1.0
+    max_delta = max(all_deltas, default=0.0)
+
+    print("=" * 60)
+    print(f"📊 Boxes FP32: {total_ref} | candidates: {total_cand} | appariées: {total_matched}")
+    print(f"   Rappel vs FP32: {recall:.2%} | précision vs FP32: {precision_ratio:.2%}")
+    print(f"   Écart de confiance max: {max_delta:.4f}")
+
+    ok = recall >= min_match and precision_ratio >= min_match
+    print("✅ Parité respectée" if ok else f"❌ Parité insuffisante (seuil {min_match:.0%})")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parité des détections FP32 vs précision réduite")
+    parser.add_argument('--images', default=str(IMAGES_DIR))
+    parser.add_argument('--precision', choices=['fp32', 'fp16', 'bf16'], default='bf16')
+    parser.add_argument('--channels-last', action='store_true')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--conf', type=float, default=0.2)
+    parser.add_argument('--iou', type=float, default=0.9)
+    parser.add_argument('--min-match', type=float, default=0.98)
+    args = parser.parse_args()
+
+    success = check_parity(Path(args.images), args.precision, args.channels_last,
+                           imgsz=args.imgsz, conf=args.conf, iou_threshold=args.iou,
+                           min_match=args.min_match)
+    sys.exit(0 if success else 1)
@@ -0,0 +1,134 @@
+"""
+Backend d'inférence YOLO compilé avec préchauffage au démarrage
+
+Trois modes (variable YOLO_COMPILE_BACKEND) :
+- 'none'        : graphe eager ultralytics (défaut), seulement préchauffé
+- 'torchscript' : export TorchScript par taille d'entrée (imgsz), mis en cache sur disque
+- 'compile'     : torch.compile du modèle, cache Inductor sur disque
+
+Le préchauffage exécute une inférence factice à chaque taille configurée
+(640 pour les images, 416/512 pour la vidéo) pour payer au démarrage la
+sélection des kernels CUDA/oneDNN et l'initialisation du predictor ultralytics.
+"""
+import hashlib
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+
+YOLO_COMPILE_BACKEND = os.getenv('YOLO_COMPILE_BACKEND', 'none').lower()
+YOLO_WARMUP = os.getenv('YOLO_WARMUP', '1') == '1'
+YOLO_WARMUP_SIZES = [int(s) for s in os.getenv('YOLO_WARMUP_SIZES', '640,416,512').split(',') if s.strip()]
+COMPILE_CACHE_DIR = Path(os.getenv('COMPILE_CACHE_DIR', str(Path(__file__).parent / 'compile_cache')))
+
+
+def _weights_key(model_path: Path) -> str:
+    """Clé de cache liée aux poids et à la version de torch (invalide le cache si l'un change)"""
+    stat = Path(model_path).stat()
+    raw = f"{Path(model_path).resolve()}|{stat.st_size}|{stat.st_mtime_ns}|{torch.__version__}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]
+
+
+class YOLOInferenceBackend:
+    """
+    Point d'entrée unique des inférences YOLO (détection sans tracking)
+
+    Appelé comme le modèle ultralytics : backend(source, imgsz=..., conf=..., ...)
+    """
+
+    def __init__(self, model, model_path: Path, backend: str = YOLO_COMPILE_BACKEND,
+                 cache_dir: Path = COMPILE_CACHE_DIR):
+        if backend not in ('none', 'torchscript', 'compile'):
+            print(f"⚠️ YOLO_COMPILE_BACKEND inconnu '{backend}', utilisation du mode eager")
+            backend = 'none'
+        self.model = model
+        self.model_path = Path(model_path)
+        self.backend = backend
+        self.cache_dir = Path(cache_dir)
+        self.compiled_models = {}  # {imgsz: YOLO TorchScript}
+        self.compiled = False
+        self.warmup_times = {}  # {imgsz: secondes}
+
+    def _torchscript_path(self, imgsz: int, half: bool) -> Path:
+        suffix = '_fp16' if half else ''
+        return self.cache_dir / f"{self.model_path.stem}_{imgsz}{suffix}_{_weights_key(self.model_path)}.torchscript"
+
+    def _load_torchscript(self, imgsz: int, device: str, half: bool):
+        """Charger (ou exporter puis mettre en cache) la variante TorchScript d'une taille"""
+        from ultralytics import YOLO
+
+        cached = self._torchscript_path(imgsz, half)
+        if not cached.exists():
+            print(f"   📦 Export TorchScript imgsz={imgsz} (mise en cache: {cached.name})")
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            exported = self.model.export(format='torchscript', imgsz=imgsz, half=half, device=device)
+            shutil.move(str(exported), str(cached))
+        return YOLO(str(cached), task='detect')
+
+    def _compile(self):
+        """torch.compile du réseau ultralytics déjà initialisé par le predictor"""
+        os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', str(self.cache_dir / 'inductor'))
+        try:
+            import torch._inductor.config as inductor_config
+            inductor_config.fx_graph_cache = True
+        except Exception:
+            pass
+        # model.predictor.model est l'AutoBackend (poids fusionnés) créé au premier appel
+        autobackend = self.model.predictor.model
+        autobackend.model = torch.compile(autobackend.model)
+        self.compiled = True
+
+    def warmup(self, device: str, sizes: Optional[List[int]] = None, extra_kwargs: Optional[Dict] = None):
+        """
+        Préchauffer (et compiler si demandé) le modèle à chaque taille d'entrée
+
+        Args:
+            device: Device ('cpu' ou 'cuda')
+            sizes: Tailles imgsz à préchauffer (défaut: YOLO_WARMUP_SIZES)
+            extra_kwargs: Arguments supplémentaires passés à l'inférence (ex: half=True)
+        """
+        sizes = sizes or YOLO_WARMUP_SIZES
+        extra_kwargs = extra_kwargs or {}
+        print(f"🔥 Préchauffage YOLO ({self.backend}) aux tailles {sizes}...")
+
+        for imgsz in sizes:
+            dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+            start = time.time()
+            try:
+                if self.backend == 'torchscript':
+                    self.compiled_models[imgsz] = self._load_torchscript(imgsz, device, extra_kwargs.get('half', False))
+                # Premier appel eager : initialise le predictor (nécessaire avant torch.compile)
+                self.model(dummy, imgsz=imgsz, device=device, verbose=False, **extra_kwargs)
+                if self.backend == 'compile' and not self.compiled:
+                    self._compile()
+                # Deux passes : compilation / sélection des kernels, puis régime établi
+                for _ in range(2):
+                    self(dummy, imgsz=imgsz, device=device, verbose=False, **extra_kwargs)
+            except Exception as e:
+                print(f"   ⚠️ Préchauffage imgsz={imgsz} échoué ({e}) - retour au mode eager pour cette taille")
+                self.compiled_models.pop(imgsz, None)
+            self.warmup_times[imgsz] = round(time.time() - start, 3)
+            print(f"   ✅ imgsz={imgsz} prêt en {self.warmup_times[imgsz]:.2f}s")
+
+    def __call__(self, source, imgsz: int = 640, **kwargs):
+        compiled_model = self.compiled_models.get(imgsz)
+        # Les exports TorchScript ont un batch statique de 1 : un lot de frames passe par le graphe eager
+        batched = isinstance(source, (list, tuple)) and len(source) > 1
+        if compiled_model is not None and not batched:
+            # Les exports TorchScript gèrent eux-mêmes la précision choisie à l'export
+            kwargs.pop('half', None)
+            return compiled_model(source, imgsz=imgsz, **kwargs)
+        return self.model(source, imgsz=imgsz, **kwargs)
+
+    def describe(self) -> Dict:
+        """Résumé (pour /api/health)"""
+        return {
+            'backend': self.backend,
+            'compiled': self.compiled or bool(self.compiled_models),
+            'torchscriptSizes': sorted(self.compiled_models),
+            'warmupSeconds': self.warmup_times
+        }
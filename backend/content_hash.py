@@ -0,0 +1,88 @@
+"""
+Empreintes de contenu pour des sauvegardes idempotentes
+
+- content hash : SHA-256 des octets du média + version du modèle + paramètres
+  d'inférence (seuils, taille d'entrée, précision...). Deux requêtes avec la
+  même empreinte produisent le même résultat : la seconde réutilise le document
+  existant au lieu de relancer l'inférence et de réécrire en base.
+- RecentResults : cache mémoire borné (empreinte -> mongoId + réponse) qui couvre
+  l'intervalle pendant lequel une sauvegarde différée n'est pas encore en base.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', '1') == '1'
+DEDUP_CACHE_SIZE = int(os.getenv('DEDUP_CACHE_SIZE', '256'))
+
+
+def model_fingerprint(model_path: Path) -> str:
+    """Version du modèle dérivée du fichier de poids (nom, taille, date de modification)"""
+    model_path = Path(model_path)
+    if not model_path.exists():
+        return 'unknown'
+    stat = model_path.stat()
+    raw = f"{model_path.name}|{stat.st_size}|{stat.st_mtime_ns}"
+    return f"{model_path.stem}-{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]}"
+
+
+def content_hash(media_bytes: bytes, model_version: str, params: Dict) -> str:
+    """
+    Empreinte d'un média et des conditions d'inférence
+
+    Args:
+        media_bytes: Octets du fichier envoyé (image ou vidéo)
+        model_version: Version du modèle (voir model_fingerprint)
+        params: Paramètres influant sur le résultat (seuils, taille d'entrée, précision, caméra...)
+
+    Returns:
+        Empreinte SHA-256 hexadécimale
+    """
+    digest = hashlib.sha256(media_bytes)
+    digest.update(b'\0')
+    digest.update(model_version.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class RecentResults:
+    """
+    Cache LRU borné empreinte -> (mongoId, réponse JSON)
+
+    La réponse peut être None (vidéos : trop volumineuses pour rester en mémoire) ;
+    l'appelant la reconstruit alors depuis le stockage.
+    """
+
+    def __init__(self, maxsize: int = DEDUP_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def discard(self, key: str):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def get(self, key: str) -> Optional[Tuple[Optional[str], Optional[Dict]]]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key: str, mongo_id: Optional[str], response: Optional[Dict] = None):
+        with self._lock:
+            self._items[key] = (mongo_id, response)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+
+recent_results = RecentResults()
@@ -0,0 +1,157 @@
+"""
+Export en flux des détections stockées (CSV / JSONL / Parquet)
+
+Les lignes (une par détection) sont produites par un générateur qui lit le
+curseur MongoDB par lots bornés (MongoDBService.iter_detection_rows) ; chaque
+format transforme ce flux en morceaux d'octets envoyés directement dans une
+réponse HTTP chunked. La mémoire reste constante quelle que soit la taille de
+l'export (un lot de lignes au plus, un row group pour Parquet).
+"""
+import csv
+import io
+import json
+import os
+from typing import Dict, Iterable, Iterator
+
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))
+
+# Colonnes exportées (une ligne par détection)
+EXPORT_COLUMNS = [
+    'document_id', 'timestamp', 'media_type', 'filename', 'camera_id',
+    'frame_number', 'frame_time', 'track_id', 'detection_id', 'label',
+    'confidence', 'risk_level', 'alert_level', 'size_cm', 'size_m', 'position',
+    'bbox_x', 'bbox_y', 'bbox_width', 'bbox_height'
+]
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+
+def detection_row(document: Dict, det: Dict) -> Dict:
+    """Aplatir une détection (et son document parent) en ligne d'export"""
+    bbox = det.get('bbox') or {}
+    return {
+        'document_id': str(document['_id']),
+        'timestamp': document['timestamp'].isoformat() if document.get('timestamp') else None,
+        'media_type': document.get('media_type'),
+        'filename': document.get('image_filename') or document.get('video_filename'),
+        'camera_id': (document.get('metadata') or {}).get('camera_id'),
+        'frame_number': det.get('frame_number'),
+        'frame_time': det.get('frame_time'),
+        'track_id': det.get('trackId'),
+        'detection_id': det.get('id'),
+        'label': det.get('label'),
+        'confidence': det.get('confidence'),
+        'risk_level': det.get('riskLevel'),
+        'alert_level': det.get('alertLevel'),
+        'size_cm': det.get('sizeCm'),
+        'size_m': det.get('sizeMeters'),
+        'position': det.get('position'),
+        'bbox_x': bbox.get('x'),
+        'bbox_y': bbox.get('y'),
+        'bbox_width': bbox.get('width'),
+        'bbox_height': bbox.get('height')
+    }
+
+
+def _batched(rows: Iterable[Dict], batch_size: int) -> Iterator[list]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_csv(rows: Iterable[Dict], batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    """CSV avec en-tête, un morceau par lot de lignes"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for batch in _batched(rows, batch_size):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    # En-tête seul si aucune ligne
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_jsonl(rows: Iterable[Dict], batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    """Une ligne JSON par détection, un morceau par lot de lignes"""
+    for batch in _batched(rows, batch_size):
+        yield ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in batch)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Fichier en écriture seule dont on vide le contenu après chaque row group"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        chunk = bytes(self.buffer)
+        self.buffer.clear()
+        return chunk
+
+
+def stream_parquet(rows: Iterable[Dict], batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """Parquet en colonnes, un row group par lot de lignes (nécessite pyarrow)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('document_id', pa.string()), ('timestamp', pa.string()), ('media_type', pa.string()),
+        ('filename', pa.string()), ('camera_id', pa.string()), ('frame_number', pa.int64()),
+        ('frame_time', pa.float64()), ('track_id', pa.int64()), ('detection_id', pa.string()),
+        ('label', pa.string()), ('confidence', pa.float64()), ('risk_level', pa.string()),
+        ('alert_level', pa.int64()), ('size_cm', pa.float64()), ('size_m', pa.float64()),
+        ('position', pa.string()), ('bbox_x', pa.float64()), ('bbox_y', pa.float64()),
+        ('bbox_width', pa.float64()), ('bbox_height', pa.float64())
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for batch in _batched(rows, batch_size):
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def stream_export(rows: Iterable[Dict], fmt: str, batch_size: int = EXPORT_BATCH_SIZE):
+    """Générateur de morceaux pour le format demandé ('csv', 'jsonl' ou 'parquet')"""
+    if fmt == 'csv':
+        return stream_csv(rows, batch_size)
+    if fmt == 'jsonl':
+        return stream_jsonl(rows, batch_size)
+    if fmt == 'parquet':
+        return stream_parquet(rows, batch_size)
+    raise ValueError(f"Format d'export inconnu: {fmt}")
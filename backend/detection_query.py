@@ -0,0 +1,156 @@
+"""
+Requêtes sur les détections stockées (filtres, projection, pagination par curseur)
+
+Les filtres de /api/detections sont traduits en filtre MongoDB servi par les
+index composés créés dans MongoDBService (égalité, puis tri timestamp/_id).
+La pagination est de type keyset : le curseur encode le couple (timestamp, _id)
+du dernier document renvoyé, la page suivante reprend strictement après lui
+sans `skip` (coût constant quelle que soit la profondeur de l'historique).
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Dict, Optional
+
+from bson import ObjectId
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Projection "résumé" : jamais les tableaux de frames ni les détections détaillées
+SUMMARY_PROJECTION = {
+    'timestamp': 1,
+    'media_type': 1,
+    'image_filename': 1,
+    'video_filename': 1,
+    'storage_layout': 1,
+    'status': 1,
+    'detection_count': 1,
+    'track_count': 1,
+    'total_frames': 1,
+    'frames_with_detections': 1,
+    'has_danger_alert': 1,
+    'max_alert_level': 1,
+    'labels': 1,
+    'metadata.camera_id': 1
+}
+
+
+class QueryError(ValueError):
+    """Paramètre de requête invalide (renvoyé en 400 par l'API)"""
+
+
+def _parse_datetime(value: str, name: str) -> datetime:
+    try:
+        # Accepte '2024-05-01', '2024-05-01T12:00:00' et le suffixe 'Z'
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise QueryError(f"Date invalide pour '{name}': {value}")
+
+
+def _parse_int(value: str, name: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        raise QueryError(f"Entier attendu pour '{name}': {value}")
+
+
+def parse_filters(args) -> Dict:
+    """
+    Extraire les filtres des paramètres de requête (request.args)
+
+    Paramètres reconnus: from, to, mediaType, alertLevel, minAlertLevel, label, cameraId
+
+    Returns:
+        Dict de filtres normalisés (clés absentes = pas de filtre)
+    """
+    filters = {}
+    if args.get('from'):
+        filters['from'] = _parse_datetime(args['from'], 'from')
+    if args.get('to'):
+        filters['to'] = _parse_datetime(args['to'], 'to')
+    if args.get('mediaType'):
+        if args['mediaType'] not in ('image', 'video'):
+            raise QueryError("mediaType doit être 'image' ou 'video'")
+        filters['media_type'] = args['mediaType']
+    if args.get('alertLevel'):
+        filters['max_alert_level'] = _parse_int(args['alertLevel'], 'alertLevel')
+    if args.get('minAlertLevel'):
+        filters['min_alert_level'] = _parse_int(args['minAlertLevel'], 'minAlertLevel')
+    if args.get('label'):
+        filters['label'] = args['label']
+    if args.get('cameraId'):
+        filters['camera_id'] = args['cameraId']
+    return filters
+
+
+def build_mongo_filter(filters: Dict) -> Dict:
+    """Traduire les filtres normalisés en filtre MongoDB"""
+    query = {}
+    if 'media_type' in filters:
+        query['media_type'] = filters['media_type']
+    if 'camera_id' in filters:
+        query['metadata.camera_id'] = filters['camera_id']
+    if 'label' in filters:
+        query['labels'] = filters['label']
+    if 'max_alert_level' in filters:
+        query['max_alert_level'] = filters['max_alert_level']
+    elif 'min_alert_level' in filters:
+        query['max_alert_level'] = {'$gte': filters['min_alert_level']}
+    if 'from' in filters or 'to' in filters:
+        query['timestamp'] = {}
+        if 'from' in filters:
+            query['timestamp']['$gte'] = filters['from']
+        if 'to' in filters:
+            query['timestamp']['$lt'] = filters['to']
+    return query
+
+
+def encode_cursor(document: Dict) -> str:
+    """Curseur opaque (base64) à partir du dernier document d'une page"""
+    raw = json.dumps({'t': document['timestamp'].isoformat(), 'id': str(document['_id'])})
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Dict:
+    """Retourne {'timestamp': datetime, '_id': ObjectId}"""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return {'timestamp': datetime.fromisoformat(raw['t']), '_id': ObjectId(raw['id'])}
+    except Exception:
+        raise QueryError('Curseur invalide')
+
+
+def apply_cursor(query: Dict, cursor: Optional[str]) -> Dict:
+    """Ajouter la condition keyset (strictement après le curseur, tri décroissant)"""
+    if not cursor:
+        return query
+    position = decode_cursor(cursor)
+    after = {'$or': [
+        {'timestamp': {'$lt': position['timestamp']}},
+        {'timestamp': position['timestamp'], '_id': {'$lt': position['_id']}}
+    ]}
+    return {'$and': [query, after]} if query else after
+
+
+def parse_page_size(args) -> int:
+    """Taille de page bornée (paramètre limit)"""
+    if not args.get('limit'):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(_parse_int(args['limit'], 'limit'), MAX_PAGE_SIZE))
+
+
+def serialize_document(document: Dict) -> Dict:
+    """Document MongoDB -> dict JSON (ObjectId et dates en chaînes)"""
+    serialized = {}
+    for key, value in document.items():
+        if isinstance(value, ObjectId):
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, dict):
+            value = serialize_document(value)
+        elif isinstance(value, list):
+            value = [serialize_document(v) if isinstance(v, dict) else v for v in value]
+        serialized['id' if key == '_id' else key] = value
+    return serialized
@@ -0,0 +1,154 @@
+"""
+Agrégats pré-calculés (rollups) des détections pour les statistiques
+
+Chaque écriture (image ou run vidéo) incrémente deux documents de rollup :
+un par heure et un par jour, pour la caméra concernée. Un document contient
+les compteurs de documents, de détections, et des sous-compteurs par label,
+niveau d'alerte et type de média. Les statistiques lisent donc un document
+par intervalle (O(buckets)) au lieu de re-parcourir toutes les détections.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+GRANULARITIES = ('hour', 'day')
+UNKNOWN_CAMERA = 'unknown'
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Début de l'intervalle (heure ou jour) contenant timestamp"""
+    if granularity == 'day':
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _field_key(value) -> str:
+    """Clé de sous-document sûre pour MongoDB (pas de '.' ni de '$' initial)"""
+    key = str(value).replace('.', '_')
+    return key[1:] if key.startswith('$') else key or 'unknown'
+
+
+def rollup_increments(document: Dict, detections: Optional[Iterable[Dict]] = None) -> Dict[str, int]:
+    """
+    Compteurs à ajouter aux rollups pour un document de détection
+
+    Args:
+        document: Document image ou en-tête vidéo (timestamp, media_type, metadata, ...)
+        detections: Détections encodées du document (images: document['detections']) ;
+            None = utiliser les compteurs de l'en-tête (label_counts, alert_level_counts)
+
+    Returns:
+        {'documents': 1, 'detections': n, 'labels.<label>': n, 'alert_levels.<niveau>': n, ...}
+    """
+    increments = defaultdict(int)
+    increments['documents'] = 1
+    increments[f"media_types.{_field_key(document.get('media_type', 'image'))}"] = 1
+    if document.get('has_danger_alert'):
+        increments['danger_documents'] = 1
+    if detections is None:
+        # En-tête vidéo dont les détections brutes ont pu expirer
+        increments['detections'] = document.get('detection_count', 0)
+        for label, count in (document.get('label_counts') or {}).items():
+            increments[f"labels.{_field_key(label)}"] += count
+        for level, count in (document.get('alert_level_counts') or {}).items():
+            increments[f"alert_levels.{_field_key(level)}"] += count
+    else:
+        for det in detections:
+            increments['detections'] += 1
+            increments[f"labels.{_field_key(det.get('label', 'unknown'))}"] += 1
+            increments[f"alert_levels.{_field_key(det.get('alertLevel', 1))}"] += 1
+    return dict(increments)
+
+
+def rollup_buckets(document: Dict) -> List[Tuple[str, datetime, str]]:
+    """Intervalles incrémentés par un document : (granularité, début, caméra) pour chaque granularité"""
+    camera_id = (document.get('metadata') or {}).get('camera_id') or UNKNOWN_CAMERA
+    return [(granularity, bucket_start(document['timestamp'], granularity), camera_id)
+            for granularity in GRANULARITIES]
+
+
+def rollup_updates(document: Dict, detections: Optional[Iterable[Dict]] = None) -> List[UpdateOne]:
+    """
+    Construire les upserts $inc pour un document de détection
+
+    Args:
+        document: Document image ou en-tête vidéo (timestamp, media_type, metadata, ...)
+        detections: Voir rollup_increments
+
+    Returns:
+        Liste d'opérations UpdateOne (une par granularité)
+    """
+    increments = rollup_increments(document, detections)
+    return [
+        UpdateOne(
+            {'_id': f"{granularity}|{period.isoformat()}|{camera_id}"},
+            {
+                '$setOnInsert': {'granularity': granularity, 'period': period, 'camera_id': camera_id},
+                '$inc': increments
+            },
+            upsert=True
+        )
+        for granularity, period, camera_id in rollup_buckets(document)
+    ]
+
+
+def rollup_from_counters(granularity: str, period: datetime, camera_id: str, counters: Dict[str, int]) -> Dict:
+    """
+    Document de rollup (format MongoDB, accepté par merge_rollups) depuis des compteurs à plat
+
+    Args:
+        counters: Clés de rollup_increments ('labels.<label>' -> sous-document labels)
+    """
+    rollup = {'granularity': granularity, 'period': period, 'camera_id': camera_id}
+    for key, value in counters.items():
+        field, _, sub_key = key.partition('.')
+        if sub_key:
+            rollup.setdefault(field, {})[sub_key] = value
+        else:
+            rollup[field] = value
+    return rollup
+
+
+def _add_counts(target: Dict, counts: Dict):
+    for key, value in (counts or {}).items():
+        target[key] = target.get(key, 0) + value
+
+
+def merge_rollups(rollups: Iterable[Dict], granularity: str) -> Dict:
+    """
+    Additionner des documents de rollup en statistiques prêtes pour l'API
+
+    Returns:
+        {'granularity', 'totals', 'byLabel', 'byAlertLevel', 'byMediaType', 'byCamera', 'series'}
+    """
+    totals = {'documents': 0, 'detections': 0, 'dangerDocuments': 0}
+    by_label, by_alert_level, by_media_type = {}, {}, {}
+    by_camera = {}
+    series = {}
+
+    for rollup in rollups:
+        documents = rollup.get('documents', 0)
+        detections = rollup.get('detections', 0)
+        totals['documents'] += documents
+        totals['detections'] += detections
+        totals['dangerDocuments'] += rollup.get('danger_documents', 0)
+        _add_counts(by_label, rollup.get('labels'))
+        _add_counts(by_alert_level, rollup.get('alert_levels'))
+        _add_counts(by_media_type, rollup.get('media_types'))
+        _add_counts(by_camera.setdefault(rollup['camera_id'], {}), {'documents': documents, 'detections': detections})
+
+        point = series.setdefault(rollup['period'], {'documents': 0, 'detections': 0})
+        point['documents'] += documents
+        point['detections'] += detections
+
+    return {
+        'granularity': granularity,
+        'totals': totals,
+        'byLabel': dict(sorted(by_label.items(), key=lambda item: -item[1])),
+        'byAlertLevel': dict(sorted(by_alert_level.items())),
+        'byMediaType': by_media_type,
+        'byCamera': by_camera,
+        'series': [{'period': period.isoformat(), **point} for period, point in sorted(series.items())]
+    }
@@ -0,0 +1,306 @@
+"""
+Schéma des détections et encodage vers des types natifs BSON/JSON
+
+Remplace le test de sérialisation champ par champ (json.dumps) par un encodage
+en une seule passe : les champs connus sont convertis directement vers leur
+type (ce qui absorbe les scalaires NumPy), les autres sont convertis
+récursivement, et les champs exclus (masques base64) sont ignorés par schéma.
+
+Contient aussi la construction des documents stockés (image, en-tête de run
+vidéo, détections aplaties, synthèse des tracks), partagée par les backends
+de stockage.
+"""
+import hashlib
+import json
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+# Champs connus d'une détection et leur type cible
+DETECTION_SCHEMA = {
+    'id': str,
+    'trackId': int,
+    'label': str,
+    'confidence': float,
+    'riskLevel': str,
+    'alertLevel': int,
+    'alertType': str,
+    'sizeMeters': float,
+    'sizeCm': float,
+    'position': str,
+    'hasSegmentation': bool,
+    'isAnomaly': bool,
+    'reconstructionError': float
+}
+
+# Champs de la bbox (pourcentages)
+BBOX_FIELDS = ('x', 'y', 'width', 'height')
+
+# Champs exclus du stockage
+IMAGE_EXCLUDED_KEYS = frozenset({'segmentationMask'})
+VIDEO_EXCLUDED_KEYS = frozenset({'segmentationMask', 'hasSegmentation'})
+
+# Champs propres au stockage, ignorés dans l'empreinte des résultats
+STORAGE_KEYS = frozenset({'run_id', 'timestamp', 'meta', '_id'})
+
+_NATIVE_TYPES = (str, int, float, bool, type(None))
+_SKIP = object()
+
+
+def to_native(value):
+    """
+    Convertir récursivement une valeur en types natifs (dict, list, str, int, float, bool, None)
+    Retourne _SKIP pour une valeur non représentable (ignorée par l'appelant)
+    """
+    if isinstance(value, _NATIVE_TYPES):
+        return value
+    if isinstance(value, dict):
+        converted = {}
+        for key, item in value.items():
+            item = to_native(item)
+            if item is not _SKIP:
+                converted[str(key)] = item
+        return converted
+    if isinstance(value, (list, tuple)):
+        return [item for item in map(to_native, value) if item is not _SKIP]
+    # Scalaires et tableaux NumPy (sans importer numpy)
+    if hasattr(value, 'item') and getattr(value, 'ndim', 0) == 0:
+        return value.item()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return _SKIP
+
+
+def _encode_bbox(bbox) -> Optional[Dict]:
+    if not isinstance(bbox, dict):
+        converted = to_native(bbox)
+        return None if converted is _SKIP else converted
+    return {key: float(bbox[key]) for key in BBOX_FIELDS if bbox.get(key) is not None}
+
+
+def encode_detection(det: Dict, excluded_keys: FrozenSet[str] = IMAGE_EXCLUDED_KEYS) -> Dict:
+    """
+    Encoder une détection en un dict prêt pour MongoDB, en une seule passe
+
+    Args:
+        det: Détection telle que produite par /api/detect ou /api/detect-video
+        excluded_keys: Champs à ignorer (ex: segmentationMask)
+
+    Returns:
+        Nouveau dict ne contenant que des types natifs
+    """
+    encoded = {}
+    for key, value in det.items():
+        if key in excluded_keys:
+            continue
+        if value is None:
+            encoded[key] = None
+            continue
+        target_type = DETECTION_SCHEMA.get(key)
+        if target_type is not None:
+            try:
+                encoded[key] = target_type(value)
+            except (TypeError, ValueError):
+                pass
+        elif key == 'bbox':
+            encoded[key] = _encode_bbox(value)
+        else:
+            value = to_native(value)
+            if value is not _SKIP:
+                encoded[key] = value
+    return encoded
+
+
+def result_hash(encoded_detections: List[Dict]) -> str:
+    """
+    Empreinte des résultats (détections encodées, hors champs de stockage)
+
+    Identique pour les détections sauvegardées automatiquement par /api/detect et
+    pour les mêmes détections renvoyées par le frontend à /api/export-mongodb.
+    """
+    canonical = [{k: v for k, v in det.items() if k not in STORAGE_KEYS} for det in encoded_detections]
+    raw = json.dumps(canonical, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def image_result_hash(detections: List[Dict]) -> str:
+    """Empreinte des résultats d'une image à partir des détections brutes"""
+    return result_hash([encode_detection(det, IMAGE_EXCLUDED_KEYS) for det in detections])
+
+
+def video_result_hash(frames: List[Dict]) -> str:
+    """Empreinte des résultats d'une vidéo à partir des frames brutes"""
+    detections, _ = flatten_video_frames(frames, None)
+    return result_hash(detections)
+
+
+def build_image_document(detections: List[Dict],
+                         image_filename: Optional[str] = None,
+                         image_size: Optional[Dict] = None,
+                         metadata: Optional[Dict] = None,
+                         media_hash: Optional[str] = None,
+                         detected_at: Optional[datetime] = None) -> Dict:
+    """
+    Document de stockage d'une image (sans _id, commun à tous les backends)
+
+    Args:
+        media_hash: Empreinte du média et des paramètres (content_hash), clé d'unicité
+        detected_at: Heure de la détection (défaut : maintenant), conservée lors d'une écriture différée
+
+    Returns:
+        Dict avec timestamp, détections encodées, compteurs et labels distincts
+    """
+    # Encoder les détections en types natifs (une passe, masques base64 exclus)
+    cleaned_detections = [encode_detection(det, IMAGE_EXCLUDED_KEYS) for det in detections]
+
+    document = {
+        'timestamp': detected_at or datetime.utcnow(),
+        'media_type': 'image',
+        'image_filename': image_filename,
+        'image_size': image_size,
+        'detections': cleaned_detections,
+        'detection_count': len(cleaned_detections),
+        'has_danger_alert': any(d.get('alertLevel', 0) == 3 for d in cleaned_detections),
+        'max_alert_level': max([d.get('alertLevel', 1) for d in cleaned_detections], default=1),
+        'labels': sorted({d['label'] for d in cleaned_detections if d.get('label')}),
+        'result_hash': result_hash(cleaned_detections),
+        'metadata': metadata or {}
+    }
+    if media_hash is not None:
+        document['content_hash'] = media_hash
+    return document
+
+
+def flatten_video_frames(frames: List[Dict], run_id,
+                         started_at: Optional[datetime] = None) -> Tuple[List[Dict], int]:
+    """
+    Aplatir les frames d'un run vidéo en une liste de détections (une par document)
+
+    Avec started_at, chaque détection reçoit un `timestamp` (début du run + temps de la
+    frame), nécessaire à la rétention TTL et au stockage en collection time-series.
+
+    Returns:
+        (détections encodées avec run_id / frame_number / frame_time, nombre de frames avec détections)
+    """
+    all_detections = []
+    frames_with_detections = 0
+
+    for frame_idx, frame in enumerate(frames):
+        frame_has_detection = False
+
+        for det in frame.get('detections', []):
+            # Encoder en types natifs (une passe, masques base64 exclus)
+            cleaned_det = encode_detection(det, VIDEO_EXCLUDED_KEYS)
+
+            if cleaned_det:
+                cleaned_det['run_id'] = run_id
+                cleaned_det['frame_number'] = frame.get('frame', frame_idx)
+                cleaned_det['frame_time'] = frame.get('time', 0)
+                if started_at is not None:
+                    cleaned_det['timestamp'] = started_at + timedelta(seconds=float(cleaned_det['frame_time'] or 0))
+                all_detections.append(cleaned_det)
+                frame_has_detection = True
+
+        if frame_has_detection:
+            frames_with_detections += 1
+
+    return all_detections, frames_with_detections
+
+
+def counted_detections(detections: List[Dict]) -> List[Dict]:
+    """
+    Détections à compter dans les statistiques
+
+    Un run enregistré en événements de track ('appeared', 'escalated', 'disappeared')
+    ne compte qu'une fois par track : seul l'événement 'disappeared', émis une fois par
+    track avec son label et son niveau d'alerte maximal, est retenu.
+    """
+    return [det for det in detections if det.get('event') in (None, 'disappeared')]
+
+
+def summarize_tracks(run_id, detections: List[Dict]) -> List[Dict]:
+    """Construire un document de synthèse par track (trackId) à partir des détections"""
+    tracks = {}
+    for det in detections:
+        track_id = det.get('trackId')
+        if track_id is None:
+            continue
+        summary = tracks.get(track_id)
+        confidence = det.get('confidence', 0) or 0
+        if summary is None:
+            summary = tracks[track_id] = {
+                'run_id': run_id,
+                'track_id': track_id,
+                'label': det.get('label'),
+                'first_frame': det['frame_number'],
+                'first_time': det['frame_time'],
+                'detection_count': 0,
+                'max_confidence': confidence,
+                'max_alert_level': det.get('alertLevel', 1),
+                'max_size_cm': det.get('sizeCm', 0) or 0,
+                'best_bbox': det.get('bbox'),
+                'best_frame': det['frame_number']
+            }
+        summary['last_frame'] = det['frame_number']
+        summary['last_time'] = det['frame_time']
+        if det.get('event') is None:
+            summary['detection_count'] += 1
+        elif det['event'] == 'disappeared':
+            # Événement de fin du track : nombre de frames où il a été observé
+            summary['detection_count'] += det.get('observations', 1) or 1
+        summary['max_alert_level'] = max(summary['max_alert_level'], det.get('alertLevel', 1))
+        summary['max_size_cm'] = max(summary['max_size_cm'], det.get('sizeCm', 0) or 0)
+        if confidence > summary['max_confidence']:
+            summary['max_confidence'] = confidence
+            summary['best_bbox'] = det.get('bbox')
+            summary['best_frame'] = det['frame_number']
+            summary['label'] = det.get('label')
+    return list(tracks.values())
+
+
+def build_video_header(run_id,
+                       total_frames: int,
+                       frames_with_detections: int,
+                       detections: List[Dict],
+                       tracks: List[Dict],
+                       video_filename: Optional[str] = None,
+                       video_info: Optional[Dict] = None,
+                       metadata: Optional[Dict] = None,
+                       started_at: Optional[datetime] = None,
+                       media_hash: Optional[str] = None) -> Dict:
+    """
+    Document d'en-tête d'un run vidéo (schéma normalisé, statut 'writing')
+
+    Les compteurs par label et par niveau d'alerte sont conservés dans l'en-tête :
+    ils restent disponibles après expiration des détections brutes (rétention TTL).
+    Les événements de track comptent une fois par track (voir counted_detections).
+    """
+    counted = counted_detections(detections)
+    header = {
+        '_id': run_id,
+        'timestamp': started_at or datetime.utcnow(),
+        'media_type': 'video',
+        'storage_layout': 'normalized',
+        'status': 'writing',
+        'video_filename': video_filename,
+        'video_info': video_info or {},
+        'total_frames': total_frames,
+        'frames_with_detections': frames_with_detections,
+        'detection_count': len(counted),
+        'track_count': len(tracks),
+        'has_danger_alert': any(d.get('alertLevel', 0) == 3 for d in counted),
+        'max_alert_level': max([d.get('alertLevel', 1) for d in counted], default=1),
+        'labels': sorted({d['label'] for d in counted if d.get('label')}),
+        'label_counts': count_by(counted, 'label'),
+        'alert_level_counts': count_by(counted, 'alertLevel'),
+        'result_hash': result_hash(detections),
+        'metadata': metadata or {}
+    }
+    if media_hash is not None:
+        header['content_hash'] = media_hash
+    return header
+
+
+def count_by(detections, key: str) -> Dict[str, int]:
+    """Nombre de détections par valeur d'un champ (clés en chaînes, stockables telles quelles)"""
+    return {str(value): count for value, count in Counter(d.get(key) for d in detections if d.get(key) is not None).items()}
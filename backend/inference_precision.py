@@ -0,0 +1,115 @@
+"""
+Politique de précision pour l'inférence PyTorch (YOLO, SAM, auto-encoder)
+
+Regroupe au même endroit :
+- l'autocast FP16/BF16 (si supporté par le device)
+- le format mémoire channels-last
+- torch.inference_mode
+
+Sélection par déploiement via variables d'environnement :
+    INFERENCE_PRECISION=fp32|fp16|bf16   (défaut: fp32)
+    INFERENCE_CHANNELS_LAST=1            (défaut: 0)
+"""
+import contextlib
+import os
+from typing import Dict
+
+import torch
+
+SUPPORTED_PRECISIONS = {
+    'fp32': torch.float32,
+    'fp16': torch.float16,
+    'bf16': torch.bfloat16
+}
+
+
+def cpu_supports_bf16() -> bool:
+    """Vrai si le CPU dispose d'instructions BF16 natives (AVX-512 BF16 / AMX)"""
+    checker = getattr(torch.backends.mkldnn, 'is_bf16_supported', None)
+    if checker is not None:
+        try:
+            return bool(checker())
+        except Exception:
+            return False
+    checker = getattr(torch.cpu, '_is_avx512_bf16_supported', None)
+    return bool(checker()) if checker is not None else False
+
+
+class PrecisionPolicy:
+    """
+    Politique de précision appliquée uniformément aux modèles PyTorch
+
+    La précision demandée est ramenée à FP32 sur les devices qui ne la
+    supportent pas (FP16 sur CPU, BF16 sur CPU sans instructions BF16).
+    """
+
+    def __init__(self, precision: str = 'fp32', channels_last: bool = False):
+        precision = precision.lower()
+        if precision not in SUPPORTED_PRECISIONS:
+            raise ValueError(f"Précision inconnue '{precision}'. Utilisez: {list(SUPPORTED_PRECISIONS)}")
+        self.precision = precision
+        self.channels_last = channels_last
+
+    @classmethod
+    def from_env(cls) -> 'PrecisionPolicy':
+        """Construire la politique depuis INFERENCE_PRECISION / INFERENCE_CHANNELS_LAST"""
+        return cls(
+            precision=os.getenv('INFERENCE_PRECISION', 'fp32'),
+            channels_last=os.getenv('INFERENCE_CHANNELS_LAST', '0') == '1'
+        )
+
+    def effective_precision(self, device: str) -> str:
+        """Précision réellement utilisée sur ce device"""
+        if self.precision == 'fp16' and device != 'cuda':
+            return 'fp32'
+        if self.precision == 'bf16':
+            if device == 'cuda' and not torch.cuda.is_bf16_supported():
+                return 'fp32'
+            if device != 'cuda' and not cpu_supports_bf16():
+                return 'fp32'
+        return self.precision
+
+    def context(self, device: str):
+        """
+        Contexte d'inférence : torch.inference_mode + autocast si précision réduite
+
+        Usage:
+            with precision_policy.context(device):
+                output = module(inputs)
+        """
+        stack = contextlib.ExitStack()
+        stack.enter_context(torch.inference_mode())
+        precision = self.effective_precision(device)
+        if precision != 'fp32':
+            device_type = 'cuda' if device == 'cuda' else 'cpu'
+            stack.enter_context(torch.autocast(device_type=device_type, dtype=SUPPORTED_PRECISIONS[precision]))
+        return stack
+
+    def prepare_module(self, module: torch.nn.Module) -> torch.nn.Module:
+        """Passer les poids en channels-last si demandé (à appeler une fois au chargement)"""
+        if self.channels_last and isinstance(module, torch.nn.Module):
+            module = module.to(memory_format=torch.channels_last)
+        return module
+
+    def prepare_input(self, tensor: torch.Tensor) -> torch.Tensor:
+        """Mettre un batch NCHW en channels-last si demandé"""
+        if self.channels_last and tensor.dim() == 4:
+            return tensor.contiguous(memory_format=torch.channels_last)
+        return tensor
+
+    def yolo_kwargs(self, device: str) -> Dict:
+        """Arguments supplémentaires pour les appels ultralytics (model(...), model.track(...))"""
+        # ultralytics gère lui-même la conversion FP16 des poids et des entrées
+        return {'half': True} if self.effective_precision(device) == 'fp16' else {}
+
+    def describe(self, device: str) -> Dict:
+        """Résumé de la politique (pour /api/health et les logs)"""
+        return {
+            'requested': self.precision,
+            'effective': self.effective_precision(device),
+            'channelsLast': self.channels_last
+        }
+
+
+# Instance globale
+precision_policy = PrecisionPolicy.from_env()
@@ -0,0 +1,178 @@
+"""
+Ordonnanceur d'inférence partagé entre flux caméra
+
+Chaque flux (thread de traitement de stream_ingest) soumet sa dernière frame et
+attend le résultat. Un thread unique regroupe les frames des différentes caméras
+en lots et exécute un seul forward batché sur le modèle partagé :
+- le lot part dès qu'il est plein (STREAM_BATCH_SIZE) ou quand la plus ancienne
+  frame en attente a atteint le délai maximal (STREAM_BATCH_MAX_WAIT_MS)
+- s'il y a plus de frames en attente que de places, les caméras ayant des tracks
+  actifs de niveau d'alerte élevé passent d'abord ; le score croît avec l'attente,
+  aucune caméra n'est affamée
+- chaque résultat est rendu au flux qui l'a soumis, qui applique son propre tracker
+
+Un flux n'a jamais plus d'une frame en attente (il attend son résultat) : la
+règle "dernière frame gagnante" de la lecture est conservée.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+try:
+    import metrics
+except ImportError:
+    from backend import metrics
+
+STREAM_BATCHING = os.getenv('STREAM_BATCHING', '1') == '1'
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '8'))
+STREAM_BATCH_MAX_WAIT_MS = float(os.getenv('STREAM_BATCH_MAX_WAIT_MS', '25'))
+# Poids de priorité par niveau d'alerte maximal des tracks actifs (niveaux 1, 2, 3)
+STREAM_PRIORITY_WEIGHTS = [float(w) for w in os.getenv('STREAM_PRIORITY_WEIGHTS', '1,2,4').split(',')]
+
+BATCH_SIZE = metrics.registry.histogram(
+    'fod_stream_batch_size', 'Frames par forward batché multi-caméras', (),
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+BATCH_WAIT = metrics.registry.histogram(
+    'fod_stream_batch_wait_seconds', "Attente d'une frame avant son forward batché", ()
+)
+
+
+def priority_weight(alert_level: int) -> float:
+    """Poids de priorité d'une caméra selon le niveau d'alerte maximal de ses tracks actifs"""
+    index = min(max(int(alert_level), 1), len(STREAM_PRIORITY_WEIGHTS)) - 1
+    return STREAM_PRIORITY_WEIGHTS[index]
+
+
+class _Request:
+    __slots__ = ('camera_id', 'item', 'weight', 'submitted_at', 'done', 'result', 'error')
+
+    def __init__(self, camera_id: str, item, weight: float):
+        self.camera_id = camera_id
+        self.item = item
+        self.weight = weight
+        self.submitted_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class InferenceScheduler:
+    """Regroupe les frames de plusieurs caméras en forwards batchés"""
+
+    def __init__(self, batch_fn: Callable[[List], List], max_batch: int = STREAM_BATCH_SIZE,
+                 max_wait_ms: float = STREAM_BATCH_MAX_WAIT_MS):
+        """
+        Args:
+            batch_fn: Fonction appliquée à une liste d'entrées, retourne une liste de résultats (même ordre)
+            max_batch: Taille maximale d'un lot
+            max_wait_ms: Attente maximale de la plus ancienne frame avant départ du lot
+        """
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = []
+        self._condition = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self.batches = 0
+        self.frames = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='inference-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._condition:
+            self._stop = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def infer(self, camera_id: str, item, weight: float = 1.0, timeout: Optional[float] = None):
+        """
+        Soumettre une entrée et attendre son résultat
+
+        Args:
+            camera_id: Flux d'origine
+            item: Entrée de batch_fn (frame RGB)
+            weight: Poids de priorité (voir priority_weight)
+            timeout: Attente maximale en secondes (None = illimitée)
+
+        Returns:
+            Résultat de batch_fn pour cette entrée ; relève l'exception du lot en cas d'échec
+        """
+        request = _Request(camera_id, item, weight)
+        with self._condition:
+            if self._stop:
+                raise RuntimeError("Ordonnanceur arrêté")
+            self._pending.append(request)
+            self._condition.notify()
+        if not request.done.wait(timeout):
+            raise TimeoutError(f"Pas de résultat pour {camera_id} après {timeout}s")
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _next_batch(self) -> List[_Request]:
+        with self._condition:
+            while not self._pending and not self._stop:
+                self._condition.wait()
+            if self._stop:
+                return []
+            deadline = min(r.submitted_at for r in self._pending) + self.max_wait
+            while len(self._pending) < self.max_batch and not self._stop:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            # Priorité pondérée par l'attente : une caméra calme finit toujours par passer
+            now = time.perf_counter()
+            ranked = sorted(self._pending, key=lambda r: r.weight * (now - r.submitted_at + self.max_wait), reverse=True)
+            batch = ranked[:self.max_batch]
+            self._pending = ranked[self.max_batch:]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if self._stop:
+                    break
+                continue
+            started = time.perf_counter()
+            for request in batch:
+                BATCH_WAIT.observe(started - request.submitted_at)
+            BATCH_SIZE.observe(len(batch))
+            try:
+                results = self.batch_fn([request.item for request in batch])
+                for request, result in zip(batch, results):
+                    request.result = result
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            self.batches += 1
+            self.frames += len(batch)
+            for request in batch:
+                request.done.set()
+        # Débloquer les flux encore en attente
+        with self._condition:
+            pending, self._pending = self._pending, []
+        for request in pending:
+            request.error = RuntimeError("Ordonnanceur arrêté")
+            request.done.set()
+
+    def stats(self) -> Dict:
+        with self._condition:
+            pending = len(self._pending)
+        return {
+            'batching': True,
+            'maxBatch': self.max_batch,
+            'maxWaitMs': self.max_wait * 1000,
+            'batches': self.batches,
+            'frames': self.frames,
+            'meanBatchSize': round(self.frames / self.batches, 2) if self.batches else None,
+            'pending': pending
+        }
@@ -0,0 +1,142 @@
+"""
+Propagation des boxes entre keyframes par flux optique (détection puis suivi)
+
+Le détecteur ne tourne que sur les keyframes (1 frame sur frameSkip). Sur les frames
+intermédiaires, les boxes de la dernière détection sont déplacées par flux optique
+épars (Lucas-Kanade pyramidal, OpenCV de base) :
+- à l'ancrage, des points sont choisis dans chaque box (coins, complétés par une grille
+  pour les petits objets peu texturés)
+- à chaque frame, tous les points de toutes les boxes sont suivis en un seul appel,
+  aller puis retour ; un point n'est gardé que si l'erreur aller-retour est faible
+- chaque box est translatée du déplacement médian de ses points valides
+
+La confiance d'une box est la part de ses points d'origine encore suivis. Quand une
+box passe sous KEYFRAME_MIN_CONFIDENCE, propagate() retourne None : l'appelant relance
+le détecteur sur cette frame, qui devient une keyframe.
+"""
+import os
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+VIDEO_KEYFRAME_PROPAGATION = os.getenv('VIDEO_KEYFRAME_PROPAGATION', '0') == '1'
+# Largeur de l'image (niveaux de gris) sur laquelle le flux est calculé
+KEYFRAME_FLOW_WIDTH = int(os.getenv('KEYFRAME_FLOW_WIDTH', '640'))
+KEYFRAME_MIN_CONFIDENCE = float(os.getenv('KEYFRAME_MIN_CONFIDENCE', '0.5'))
+KEYFRAME_POINTS_PER_BOX = int(os.getenv('KEYFRAME_POINTS_PER_BOX', '16'))
+# Erreur aller-retour maximale d'un point, en pixels de l'image de flux
+KEYFRAME_FB_ERROR_PX = float(os.getenv('KEYFRAME_FB_ERROR_PX', '1.0'))
+
+_LK_PARAMS = dict(winSize=(15, 15), maxLevel=3,
+                  criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+
+
+class BoxPropagator:
+    """Boxes de la dernière keyframe, suivies frame à frame par flux optique"""
+
+    def __init__(self, flow_width: int = KEYFRAME_FLOW_WIDTH, min_confidence: float = KEYFRAME_MIN_CONFIDENCE,
+                 points_per_box: int = KEYFRAME_POINTS_PER_BOX, fb_error_px: float = KEYFRAME_FB_ERROR_PX):
+        """
+        Args:
+            flow_width: Largeur de l'image réduite utilisée pour le flux optique
+            min_confidence: Part minimale des points d'origine encore suivis, par box
+            points_per_box: Nombre de points suivis par box
+            fb_error_px: Erreur aller-retour maximale d'un point (pixels de l'image réduite)
+        """
+        self.flow_width = flow_width
+        self.min_confidence = min_confidence
+        self.points_per_box = points_per_box
+        self.fb_error_px = fb_error_px
+        self._gray = None
+        self._detections = []
+        self._points = np.empty((0, 1, 2), dtype=np.float32)
+        self._owners = np.empty(0, dtype=np.int64)
+        self._initial_counts = np.empty(0)
+
+    @property
+    def active(self) -> bool:
+        return bool(self._detections)
+
+    def _prepare(self, frame_bgr: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+        height, width = gray.shape
+        if width > self.flow_width:
+            gray = cv2.resize(gray, (self.flow_width, round(height * self.flow_width / width)),
+                              interpolation=cv2.INTER_AREA)
+        return gray
+
+    def _box_points(self, gray: np.ndarray, bbox: Dict) -> np.ndarray:
+        """Points à suivre dans une box : coins de Shi-Tomasi, complétés par une grille régulière"""
+        height, width = gray.shape
+        x1 = int(np.clip(bbox['x'] * width / 100, 0, width - 1))
+        y1 = int(np.clip(bbox['y'] * height / 100, 0, height - 1))
+        x2 = int(np.clip((bbox['x'] + bbox['width']) * width / 100, x1 + 1, width))
+        y2 = int(np.clip((bbox['y'] + bbox['height']) * height / 100, y1 + 1, height))
+        corners = cv2.goodFeaturesToTrack(gray[y1:y2, x1:x2], self.points_per_box, 0.01, 2)
+        points = corners.reshape(-1, 2) + (x1, y1) if corners is not None else np.empty((0, 2))
+        missing = self.points_per_box - len(points)
+        if missing > 0:
+            side = int(np.ceil(np.sqrt(missing)))
+            grid_x, grid_y = np.meshgrid(np.linspace(x1, x2 - 1, side + 2)[1:-1], np.linspace(y1, y2 - 1, side + 2)[1:-1])
+            grid = np.column_stack([grid_x.ravel(), grid_y.ravel()])[:missing]
+            points = np.vstack([points, grid])
+        return points.astype(np.float32)
+
+    def anchor(self, frame_bgr: np.ndarray, detections: List[Dict]):
+        """
+        Repartir des détections d'une keyframe
+
+        Args:
+            frame_bgr: Keyframe (BGR)
+            detections: Détections de la keyframe (bbox en pourcentages)
+        """
+        self._gray = self._prepare(frame_bgr)
+        self._detections = [det for det in detections if det.get('bbox')]
+        if not self._detections:
+            self._points = np.empty((0, 1, 2), dtype=np.float32)
+            self._owners = np.empty(0, dtype=np.int64)
+            self._initial_counts = np.empty(0)
+            return
+        per_box = [self._box_points(self._gray, det['bbox']) for det in self._detections]
+        self._points = np.vstack(per_box).reshape(-1, 1, 2)
+        self._owners = np.repeat(np.arange(len(per_box)), [len(points) for points in per_box])
+        self._initial_counts = np.bincount(self._owners, minlength=len(per_box)).astype(float)
+
+    def propagate(self, frame_bgr: np.ndarray) -> Optional[List[Dict]]:
+        """
+        Déplacer les boxes vers une frame intermédiaire
+
+        Returns:
+            Détections déplacées (copies, 'propagated': True et 'trackingConfidence'),
+            ou None si une box a perdu le suivi (relancer le détecteur sur cette frame)
+        """
+        if not self._detections:
+            return []
+        gray = self._prepare(frame_bgr)
+        forward, status, _ = cv2.calcOpticalFlowPyrLK(self._gray, gray, self._points, None, **_LK_PARAMS)
+        backward, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self._gray, forward, None, **_LK_PARAMS)
+        fb_error = np.linalg.norm((backward - self._points).reshape(-1, 2), axis=1)
+        valid = (status.ravel() == 1) & (back_status.ravel() == 1) & (fb_error < self.fb_error_px)
+
+        box_count = len(self._detections)
+        confidence = np.bincount(self._owners[valid], minlength=box_count) / self._initial_counts
+        if confidence.min() < self.min_confidence:
+            return None
+
+        displacement = (forward - self._points).reshape(-1, 2)
+        height, width = gray.shape
+        propagated = []
+        for index, det in enumerate(self._detections):
+            dx, dy = np.median(displacement[valid & (self._owners == index)], axis=0)
+            bbox = dict(det['bbox'])
+            bbox['x'] += dx * 100 / width
+            bbox['y'] += dy * 100 / height
+            propagated.append({**det, 'bbox': bbox, 'propagated': True,
+                               'trackingConfidence': round(float(confidence[index]), 3)})
+
+        self._gray = gray
+        self._points = forward[valid]
+        self._owners = self._owners[valid]
+        self._detections = propagated
+        return propagated
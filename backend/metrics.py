@@ -0,0 +1,248 @@
+"""
+Instrumentation légère du pipeline de détection (format texte Prometheus)
+
+- histogrammes de durée par étape (décodage, prétraitement, forward YOLO/ONNX,
+  SAM set_image/predict, encodage des masques, post-traitement, sérialisation,
+  écritures en base) et par requête HTTP
+- compteurs (détections, réutilisations par empreinte, frames vidéo)
+- jauges évaluées à la lecture (profondeur de la file d'écriture, cache...)
+
+Sans dépendance externe : le registre produit directement le texte exposé par
+GET /metrics. Une observation coûte un perf_counter() et une addition sous verrou.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+
+# Bornes en secondes : de la milliseconde (décodage, sérialisation) à la minute (vidéo complète)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    """Base commune : nom, aide, noms de labels et valeurs par combinaison de labels"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def header(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} {self.kind}'
+
+
+class Counter(_Metric):
+    """Compteur monotone"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}'
+
+
+class Gauge(_Metric):
+    """
+    Jauge : valeur fixée par set(), ou calculée à chaque lecture par une fonction
+
+    La fonction retourne soit un nombre, soit un dict {tuple de valeurs de labels: nombre}.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, label_names: Iterable[str] = (),
+                 callback: Optional[Callable] = None):
+        super().__init__(name, help_text, label_names)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def samples(self):
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception:
+                return
+            items = value.items() if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for key, value in items:
+            if value is None:
+                continue
+            yield f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}'
+
+
+class Histogram(_Metric):
+    """Histogramme cumulatif (buckets + somme + nombre d'observations)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, label_names: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [compteurs par bucket (non cumulés, dernier = +Inf), somme, nombre]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f'{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}'
+            labels = _format_labels(self.label_names, key)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+class MetricsRegistry:
+    """Ensemble des métriques exposées par /metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, label_names: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, label_names))
+
+    def gauge(self, name: str, help_text: str, label_names: Iterable[str] = (),
+              callback: Optional[Callable] = None) -> Gauge:
+        return self._register(Gauge(name, help_text, label_names, callback))
+
+    def histogram(self, name: str, help_text: str, label_names: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def render(self) -> str:
+        """Texte d'exposition Prometheus (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+# Registre global et métriques du pipeline
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'fod_stage_duration_seconds', "Durée d'une étape du pipeline de détection", ('stage', 'media_type')
+)
+REQUEST_SECONDS = registry.histogram(
+    'fod_http_request_duration_seconds', 'Durée des requêtes HTTP', ('endpoint', 'method', 'status')
+)
+DETECTIONS = registry.counter(
+    'fod_detections_total', "Objets détectés, par type de média et niveau d'alerte", ('media_type', 'alert_level')
+)
+DEDUP_HITS = registry.counter(
+    'fod_dedup_hits_total', 'Analyses réutilisées grâce à l\'empreinte de contenu', ('media_type', 'source')
+)
+VIDEO_FRAMES = registry.counter(
+    'fod_video_frames_total', 'Frames vidéo lues, par traitement', ('result',)
+)
+
+
+class stage_timer:
+    """
+    Chronométrer une étape : `with stage_timer('yolo_forward', 'image') as timer: ...`
+
+    La durée (secondes) reste disponible dans `timer.elapsed` après le bloc.
+    """
+
+    __slots__ = ('stage', 'media_type', 'start', 'elapsed')
+
+    def __init__(self, stage: str, media_type: str = 'image'):
+        self.stage = stage
+        self.media_type = media_type
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.elapsed = time.perf_counter() - self.start
+        if METRICS_ENABLED:
+            STAGE_SECONDS.observe(self.elapsed, stage=self.stage, media_type=self.media_type)
+        return False
+
+
+def observe_stage(stage: str, seconds: float, media_type: str = 'image'):
+    """Enregistrer une durée mesurée à la main (étape découpée en plusieurs morceaux)"""
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(seconds, stage=stage, media_type=media_type)
+
+
+def count_detections(detections, media_type: str):
+    """Incrémenter fod_detections_total pour une liste de détections"""
+    if not METRICS_ENABLED:
+        return
+    by_level = {}
+    for det in detections:
+        level = det.get('alertLevel', 1)
+        by_level[level] = by_level.get(level, 0) + 1
+    for level, count in by_level.items():
+        DETECTIONS.inc(count, media_type=media_type, alert_level=level)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""
+Migration des détections existantes vers le stockage avec rétention
+
+Étapes (toutes idempotentes, exécutables plusieurs fois) :
+  --legacy-videos : convertit les vidéos à frames imbriquées (ancien format) au schéma normalisé
+  --backfill      : ajoute `timestamp` aux détections vidéo brutes et les compteurs
+                    label_counts / alert_level_counts aux en-têtes (conservés après expiration)
+  --timeseries    : convertit la collection des détections brutes en collection time-series
+                    (l'ancienne est renommée <nom>_legacy puis recopiée par lots)
+
+Utilisation:
+    python migrate_detection_storage.py --legacy-videos --backfill --dry-run
+    python migrate_detection_storage.py --legacy-videos --backfill --timeseries
+"""
+import argparse
+import sys
+
+from mongodb_service import mongodb_service
+import detection_schema
+
+
+def migrate_legacy_videos(service, dry_run: bool) -> int:
+    """Vidéos à frames imbriquées -> en-tête + video_detections + video_tracks"""
+    query = {'media_type': 'video', 'storage_layout': {'$exists': False}}
+    if dry_run:
+        return service.collection.count_documents(query)
+
+    migrated = 0
+    for document in service.collection.find(query).batch_size(10):
+        run_id = document['_id']
+        metadata = document.get('metadata') or {}
+        detections, frames_with_detections = detection_schema.flatten_video_frames(
+            document.get('frames', []), run_id, document['timestamp']
+        )
+        if service.raw_detections_timeseries:
+            meta = {'camera_id': metadata.get('camera_id'), 'media_type': 'video'}
+            for det in detections:
+                det['meta'] = meta
+        tracks = detection_schema.summarize_tracks(run_id, detections)
+
+        # Repartir de zéro si une migration précédente de ce run a été interrompue
+        service.video_detections.delete_many({'run_id': run_id})
+        service.video_tracks.delete_many({'run_id': run_id})
+        service._insert_in_batches(service.video_detections, detections)
+        service._insert_in_batches(service.video_tracks, tracks)
+
+        service.collection.update_one({'_id': run_id}, {
+            '$set': {
+                'storage_layout': 'normalized',
+                'status': 'complete',
+                'frames_with_detections': frames_with_detections,
+                'detection_count': len(detections),
+                'track_count': len(tracks),
+                'labels': sorted({d['label'] for d in detections if d.get('label')}),
+                'label_counts': detection_schema.count_by(detections, 'label'),
+                'alert_level_counts': detection_schema.count_by(detections, 'alertLevel')
+            },
+            '$unset': {'frames': ''}
+        })
+        migrated += 1
+    return migrated
+
+
+def backfill(service, dry_run: bool) -> int:
+    """Compteurs d'en-tête et timestamps des détections brutes pour les runs normalisés"""
+    query = {'storage_layout': 'normalized', 'status': 'complete', 'label_counts': {'$exists': False}}
+    if dry_run:
+        return service.collection.count_documents(query)
+
+    updated = 0
+    for header in service.collection.find(query, {'timestamp': 1}).batch_size(100):
+        run_id = header['_id']
+        # timestamp = début du run + temps de la frame (pipeline d'update côté serveur)
+        if not service.raw_detections_timeseries:
+            service.video_detections.update_many(
+                {'run_id': run_id, 'timestamp': {'$exists': False}},
+                [{'$set': {'timestamp': {'$add': [header['timestamp'], {'$multiply': [{'$ifNull': ['$frame_time', 0]}, 1000]}]}}}]
+            )
+        label_counts, alert_level_counts = {}, {}
+        for row in service.video_detections.aggregate([
+            {'$match': {'run_id': run_id}},
+            {'$group': {'_id': {'label': '$label', 'alertLevel': '$alertLevel'}, 'count': {'$sum': 1}}}
+        ]):
+            label, level = row['_id'].get('label'), row['_id'].get('alertLevel')
+            if label is not None:
+                label_counts[str(label)] = label_counts.get(str(label), 0) + row['count']
+            if level is not None:
+                alert_level_counts[str(level)] = alert_level_counts.get(str(level), 0) + row['count']
+        service.collection.update_one({'_id': run_id}, {'$set': {
+            'label_counts': label_counts,
+            'alert_level_counts': alert_level_counts
+        }})
+        updated += 1
+    return updated
+
+
+def convert_to_timeseries(service, batch_size: int, dry_run: bool) -> int:
+    """Recopier la collection classique des détections brutes dans une collection time-series"""
+    name = service.video_detections_collection_name
+    legacy_name = f"{name}_legacy"
+    if service.raw_detections_timeseries:
+        print(f"   {name} est déjà une collection time-series")
+        if legacy_name not in service.db.list_collection_names():
+            return 0
+        print(f"   Reprise de la copie depuis {legacy_name}")
+    elif dry_run:
+        return service.video_detections.count_documents({})
+    else:
+        # Renommer d'abord : une collection time-series ne peut pas être renommée ensuite
+        service.video_detections.rename(legacy_name)
+        service.use_timeseries = True
+        service._bind_collections()
+
+    legacy = service.db[legacy_name]
+    if dry_run:
+        return legacy.count_documents({})
+
+    # Copie run par run : les détections d'un run déjà (partiellement) copié sont
+    # supprimées avant recopie, ce qui permet de reprendre une migration interrompue
+    current_run, camera_id = None, None
+    copied = skipped = 0
+    batch = []
+    for det in legacy.find({}, {'_id': 0}).sort('run_id', 1).batch_size(batch_size):
+        if 'timestamp' not in det:
+            skipped += 1
+            continue
+        if det['run_id'] != current_run:
+            current_run = det['run_id']
+            service.video_detections.delete_many({'run_id': current_run})
+            # Caméra du run, lue dans l'en-tête (meta de la collection time-series)
+            header = service.collection.find_one({'_id': current_run}, {'metadata.camera_id': 1}) or {}
+            camera_id = (header.get('metadata') or {}).get('camera_id')
+        det['meta'] = {'camera_id': camera_id, 'media_type': 'video'}
+        batch.append(det)
+        if len(batch) >= batch_size:
+            copied += service._insert_in_batches(service.video_detections, batch)
+            batch = []
+    if batch:
+        copied += service._insert_in_batches(service.video_detections, batch)
+
+    if skipped:
+        print(f"   ⚠️ {skipped} détection(s) sans timestamp ignorée(s) : lancer d'abord --backfill")
+    print(f"   L'ancienne collection est conservée: {legacy_name} (à supprimer après vérification)")
+    return copied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migration du stockage des détections (rétention / time-series)")
+    parser.add_argument('--legacy-videos', action='store_true', help="Normaliser les vidéos à frames imbriquées")
+    parser.add_argument('--backfill', action='store_true', help="Timestamps des détections brutes et compteurs d'en-tête")
+    parser.add_argument('--timeseries', action='store_true', help="Convertir les détections brutes en collection time-series")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true', help="Compter les documents concernés sans rien modifier")
+    args = parser.parse_args()
+
+    if not (args.legacy_videos or args.backfill or args.timeseries):
+        parser.error("choisir au moins une étape: --legacy-videos, --backfill, --timeseries")
+    if mongodb_service.collection is None:
+        print("❌ MongoDB non connecté")
+        sys.exit(1)
+
+    verb = "à migrer" if args.dry_run else "migré(s)"
+    if args.legacy_videos:
+        print(f"🎬 Vidéos ancien format {verb}: {migrate_legacy_videos(mongodb_service, args.dry_run)}")
+    if args.backfill:
+        print(f"🧮 En-têtes vidéo {verb}: {backfill(mongodb_service, args.dry_run)}")
+    if args.timeseries:
+        print(f"🕒 Détections brutes {verb} (time-series): {convert_to_timeseries(mongodb_service, args.batch_size, args.dry_run)}")
+    print("✅ Terminé")
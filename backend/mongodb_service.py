@@ -2,17 +2,45 @@
 Service MongoDB pour stocker les détections FOD
 """
 from pymongo import MongoClient
-from datetime import datetime
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from bson import ObjectId
+from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
+try:
+    import detection_schema
+    from storage_backends import StorageBackend
+    from structured_logging import get_logger
+except ImportError:
+    from backend import detection_schema
+    from backend.storage_backends import StorageBackend
+    from backend.structured_logging import get_logger
+
+logger = get_logger('storage.mongodb')
+
+try:
+    import detection_query
+    import detection_rollups
+    from detection_export import detection_row
+except ImportError:
+    from backend import detection_query, detection_rollups
+    from backend.detection_export import detection_row
+
 # Charger les variables d'environnement
 load_dotenv()
 
-class MongoDBService:
+# Code d'erreur MongoDB pour une clé dupliquée (rejeu d'un document déjà écrit)
+DUPLICATE_KEY_ERROR = 11000
+
+class MongoDBService(StorageBackend):
     """Service pour gérer les opérations MongoDB"""
     
+    name = 'mongodb'
+    
     def __init__(self):
         # Configuration MongoDB
         # Par défaut: MongoDB Docker (localhost:27017), sinon utiliser les variables d'environnement
@@ -43,12 +71,58 @@ class MongoDBService:
         
         self.database_name = os.getenv('MONGODB_DATABASE', 'fod_detection')
         self.collection_name = os.getenv('MONGODB_COLLECTION', 'detections')
+        # Schéma vidéo normalisé : en-tête dans `collection`, détections et tracks à part
+        self.video_detections_collection_name = os.getenv('MONGODB_VIDEO_DETECTIONS_COLLECTION', 'video_detections')
+        self.video_tracks_collection_name = os.getenv('MONGODB_VIDEO_TRACKS_COLLECTION', 'video_tracks')
+        self.rollups_collection_name = os.getenv('MONGODB_ROLLUPS_COLLECTION', 'detection_rollups')
+        # Détections vidéo brutes : collection time-series optionnelle et rétention TTL
+        # (les en-têtes, synthèses de tracks et rollups sont conservés sans limite)
+        self.use_timeseries = os.getenv('MONGODB_TIMESERIES', '0') == '1'
+        self.raw_retention_days = float(os.getenv('MONGODB_RAW_RETENTION_DAYS', '0'))
+        self.raw_detections_timeseries = False
+        # Taille des lots insert_many (borne la taille des messages envoyés au serveur)
+        self.insert_batch_size = int(os.getenv('MONGODB_INSERT_BATCH_SIZE', '1000'))
+        # Au-delà de ce délai, un en-tête vidéo encore 'writing' est considéré comme abandonné
+        self.video_write_timeout = float(os.getenv('MONGODB_VIDEO_WRITE_TIMEOUT_SECONDS', '600'))
+        
+        # Pool de connexions et options client (un seul MongoClient réutilisé)
+        write_concern = os.getenv('MONGODB_WRITE_CONCERN', '1')
+        self.client_options = {
+            'serverSelectionTimeoutMS': int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+            'connectTimeoutMS': int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', '5000')),
+            'maxPoolSize': int(os.getenv('MONGODB_MAX_POOL_SIZE', '50')),
+            'minPoolSize': int(os.getenv('MONGODB_MIN_POOL_SIZE', '0')),
+            'maxIdleTimeMS': int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', '60000')),
+            'w': int(write_concern) if write_concern.isdigit() else write_concern,
+            'journal': os.getenv('MONGODB_JOURNAL', '0') == '1'
+        }
+        compressors = os.getenv('MONGODB_COMPRESSORS', '')
+        if compressors:
+            self.client_options['compressors'] = compressors
+        
+        # État de santé mis en cache, rafraîchi par un heartbeat en arrière-plan
+        self.heartbeat_interval = float(os.getenv('MONGODB_HEARTBEAT_INTERVAL', '10'))
+        self._healthy = False
+        self._last_health_check = 0.0
+        self._heartbeat_thread = None
+        self._heartbeat_stop = threading.Event()
+        self._connect_lock = threading.Lock()
+        # Reconstruction des rollups sans bloquer les écritures (voir rebuild_rollups) :
+        # documents insérés dont les rollups restent à appliquer, et journal des $inc
+        # appliqués pendant une reconstruction ({document_id: [UpdateOne]}, None hors reconstruction)
+        self._rollups_lock = threading.Lock()
+        self._rollups_pending = set()
+        self._rollups_journal = None
         
         self.client = None
         self.db = None
         self.collection = None
+        self.video_detections = None
+        self.video_tracks = None
+        self.rollups = None
         
         self._connect()
+        self._start_heartbeat()
     
     def _connect(self):
         """Établir la connexion à MongoDB"""
@@ -56,34 +130,13 @@ class MongoDBService:
         try:
             print(f"🔌 Tentative de connexion MongoDB: {self.mongo_uri.split('@')[-1] if '@' in self.mongo_uri else self.mongo_uri}")
             
-            # Timeout de connexion pour Docker
             # Ajouter authSource si authentification présente
-            client_kwargs = {
-                'serverSelectionTimeoutMS': 5000,  # 5 secondes
-                'connectTimeoutMS': 5000
-            }
-            if '@' in self.mongo_uri:
-                # Si authentification présente, spécifier authSource
-                client_kwargs['authSource'] = 'admin'
-            
-            self.client = MongoClient(
-                self.mongo_uri,
-                **client_kwargs
-            )
+            self._create_client(self.mongo_uri, with_auth='@' in self.mongo_uri)
             
             # Tester la connexion
-            self.client.server_info()
-            
-            self.db = self.client[self.database_name]
-            self.collection = self.db[self.collection_name]
+            self.client.admin.command('ping')
             
-            # Créer un index sur timestamp pour les requêtes rapides
-            try:
-                self.collection.create_index([("timestamp", -1)])
-                self.collection.create_index([("media_type", 1)])
-                self.collection.create_index([("detections.riskLevel", 1)])
-            except Exception as idx_error:
-                print(f"⚠️ Erreur lors de la création des index (peut être ignoré): {idx_error}")
+            self._bind_collections()
             
             print(f"✅ MongoDB connecté: {self.database_name}.{self.collection_name}")
             print(f"   URI: {self.mongo_uri.split('@')[-1] if '@' in self.mongo_uri else self.mongo_uri}")
@@ -103,15 +156,10 @@ class MongoDBService:
                     else:
                         fallback_uri = 'mongodb://localhost:27017/'
                     
-                    self.client = MongoClient(
-                        fallback_uri,
-                        serverSelectionTimeoutMS=5000,
-                        connectTimeoutMS=5000
-                    )
-                    self.client.server_info()
+                    self._create_client(fallback_uri, with_auth=False)
+                    self.client.admin.command('ping')
                     
-                    self.db = self.client[self.database_name]
-                    self.collection = self.db[self.collection_name]
+                    self._bind_collections()
                     
                     print(f"✅ MongoDB connecté sans authentification: {self.database_name}.{self.collection_name}")
                     print(f"   URI: {fallback_uri}")
@@ -126,32 +174,264 @@ class MongoDBService:
             print("   - Local: mongod --dbpath C:\\data\\db")
             print("   - Vérifiez les logs: docker logs fod_mongodb")
             print("⚠️ Les détections ne seront pas sauvegardées dans MongoDB")
-            self.client = None
+            # Le client (et son pool) est conservé : le heartbeat le réutilisera pour se reconnecter
+            self._healthy = False
             self.db = None
             self.collection = None
+            self.video_detections = None
+            self.video_tracks = None
+            self.rollups = None
+    
+    def _create_client(self, uri: str, with_auth: bool):
+        """Créer le MongoClient (en fermant le précédent pour ne pas accumuler de pools)"""
+        if self.client is not None:
+            try:
+                self.client.close()
+            except Exception:
+                pass
+        client_kwargs = dict(self.client_options)
+        if with_auth:
+            # Si authentification présente, spécifier authSource
+            client_kwargs['authSource'] = 'admin'
+        self.client = MongoClient(uri, **client_kwargs)
+        self.client_uri = uri
+    
+    def _start_heartbeat(self):
+        """Démarrer le thread qui rafraîchit l'état de santé en arrière-plan"""
+        if self.heartbeat_interval <= 0 or self._heartbeat_thread is not None:
+            return
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name='mongodb-heartbeat', daemon=True)
+        self._heartbeat_thread.start()
+    
+    def _heartbeat_loop(self):
+        while not self._heartbeat_stop.wait(self.heartbeat_interval):
+            self._check_health()
+    
+    def _check_health(self) -> bool:
+        """Ping du serveur avec le client existant ; rattache les collections si le serveur revient"""
+        if self.client is None:
+            self._healthy = False
+            return False
+        try:
+            self.client.admin.command('ping')
+            if self.collection is None:
+                with self._connect_lock:
+                    if self.collection is None:
+                        self._bind_collections()
+                        print(f"✅ MongoDB de nouveau joignable: {self.database_name}.{self.collection_name}")
+            self._healthy = True
+        except Exception:
+            self._healthy = False
+        self._last_health_check = time.time()
+        return self._healthy
+    
+    def _bind_collections(self):
+        """Associer les collections et créer les index"""
+        self._healthy = True
+        self._last_health_check = time.time()
+        self.db = self.client[self.database_name]
+        self.collection = self.db[self.collection_name]
+        self.video_detections = self.db[self.video_detections_collection_name]
+        self.video_tracks = self.db[self.video_tracks_collection_name]
+        self.rollups = self.db[self.rollups_collection_name]
+        
+        try:
+            self._configure_raw_detections()
+        except Exception as layout_error:
+            print(f"⚠️ Configuration time-series / rétention échouée: {layout_error}")
+        
+        # Créer les index pour les requêtes rapides
+        try:
+            self.collection.create_index([("timestamp", -1)])
+            self.collection.create_index([("media_type", 1)])
+            self.collection.create_index([("detections.riskLevel", 1)])
+            # Index composés pour /api/detections : égalité d'abord, puis tri (timestamp, _id)
+            self.collection.create_index([("timestamp", -1), ("_id", -1)])
+            self.collection.create_index([("media_type", 1), ("timestamp", -1), ("_id", -1)])
+            self.collection.create_index([("metadata.camera_id", 1), ("timestamp", -1), ("_id", -1)])
+            self.collection.create_index([("labels", 1), ("timestamp", -1), ("_id", -1)])
+            self.collection.create_index([("max_alert_level", 1), ("timestamp", -1), ("_id", -1)])
+            # Sauvegardes idempotentes : une seule analyse par média (empreinte de contenu)
+            self.collection.create_index(
+                [("content_hash", 1)], unique=True, name='content_hash_unique',
+                partialFilterExpression={'content_hash': {'$type': 'string'}}
+            )
+            self.collection.create_index([("result_hash", 1), ("media_type", 1)])
+            self.video_detections.create_index([("run_id", 1), ("frame_number", 1)])
+            self.video_detections.create_index([("label", 1)])
+            self.video_detections.create_index([("alertLevel", 1)])
+            self.video_tracks.create_index([("run_id", 1), ("track_id", 1)])
+            self._create_rollup_indexes(self.rollups)
+        except Exception as idx_error:
+            print(f"⚠️ Erreur lors de la création des index (peut être ignoré): {idx_error}")
+    
+    def _configure_raw_detections(self):
+        """
+        Layout (time-series ou classique) et rétention TTL de la collection des détections brutes
+        
+        - time-series : créée si absente (timeField 'timestamp', metaField 'meta'),
+          l'expiration est portée par l'option expireAfterSeconds de la collection
+        - classique : index TTL 'raw_ttl' sur timestamp
+        Une collection classique existante n'est jamais convertie ici (voir migrate_detection_storage.py).
+        """
+        name = self.video_detections_collection_name
+        expire = int(self.raw_retention_days * 86400) if self.raw_retention_days > 0 else None
+        info = next(iter(self.db.list_collections(filter={'name': name})), None)
+        
+        if self.use_timeseries and info is None:
+            options = {'timeseries': {'timeField': 'timestamp', 'metaField': 'meta', 'granularity': 'seconds'}}
+            if expire:
+                options['expireAfterSeconds'] = expire
+            self.db.create_collection(name, **options)
+            info = {'type': 'timeseries', 'options': {'expireAfterSeconds': expire}}
+            print(f"✅ Collection time-series créée: {name}")
+        elif self.use_timeseries and info.get('type') != 'timeseries':
+            print(f"⚠️ {name} est une collection classique : lancer 'python migrate_detection_storage.py --timeseries' pour la convertir")
+        
+        self.raw_detections_timeseries = info is not None and info.get('type') == 'timeseries'
+        
+        if self.raw_detections_timeseries:
+            if info.get('options', {}).get('expireAfterSeconds') != expire:
+                self.db.command('collMod', name, expireAfterSeconds=expire if expire else 'off')
+        elif expire:
+            try:
+                self.video_detections.create_index([("timestamp", 1)], expireAfterSeconds=expire, name='raw_ttl')
+            except OperationFailure:
+                # Index existant avec une autre durée : la modifier sans le recréer
+                self.db.command('collMod', name, index={'name': 'raw_ttl', 'expireAfterSeconds': expire})
+        elif 'raw_ttl' in self.video_detections.index_information():
+            self.video_detections.drop_index('raw_ttl')
+        
+        if expire:
+            print(f"🗓️ Rétention des détections brutes: {self.raw_retention_days:g} jour(s)")
+    
+    def _insert_in_batches(self, collection, documents: List[Dict]) -> int:
+        """Insérer des documents par lots bornés (insert_many non ordonné)"""
+        inserted = 0
+        for start in range(0, len(documents), self.insert_batch_size):
+            batch = documents[start:start + self.insert_batch_size]
+            result = collection.insert_many(batch, ordered=False)
+            inserted += len(result.inserted_ids)
+        return inserted
+    
+    @staticmethod
+    def _create_rollup_indexes(collection):
+        collection.create_index([("granularity", 1), ("period", 1)])
+        collection.create_index([("granularity", 1), ("camera_id", 1), ("period", 1)])
+    
+    def _rollups_begin(self, document_ids):
+        """Déclarer des documents en cours d'écriture (ignorés par une reconstruction jusqu'à leurs rollups)"""
+        with self._rollups_lock:
+            self._rollups_pending.update(document_ids)
+    
+    def _rollups_settle(self, document_ids):
+        """Fin d'écriture (rollups appliqués, doublon ignoré ou échec)"""
+        with self._rollups_lock:
+            self._rollups_pending.difference_update(document_ids)
+    
+    def _write_rollups(self, updates):
+        try:
+            self.rollups.bulk_write(updates, ordered=False)
+        except Exception as e:
+            logger.warning("Mise à jour des statistiques échouée (reconstruire avec rebuild_rollups): %s", e)
+    
+    def _apply_rollups(self, document: Dict, detections: Optional[List[Dict]]):
+        """Incrémenter les rollups (heure/jour) d'un document écrit ; une erreur n'annule pas l'écriture"""
+        updates = detection_rollups.rollup_updates(document, detections)
+        with self._rollups_lock:
+            self._rollups_pending.discard(document['_id'])
+            rebuilding = self._rollups_journal is not None
+            if rebuilding:
+                # Rejoué dans les rollups reconstruits ; écrit sous le verrou pour ne pas
+                # atteindre la nouvelle collection après la bascule
+                self._rollups_journal[document['_id']] = updates
+                self._write_rollups(updates)
+        if not rebuilding:
+            self._write_rollups(updates)
     
     def reconnect(self):
-        """Tenter de reconnecter à MongoDB"""
+        """Tenter de reconnecter à MongoDB (en réutilisant le client existant si possible)"""
         print("🔄 Tentative de reconnexion à MongoDB...")
-        self._connect()
+        if self._check_health():
+            return True
+        with self._connect_lock:
+            self._connect()
         return self.collection is not None
     
     def is_connected(self):
-        """Vérifier si MongoDB est connecté"""
-        if self.collection is None:
-            return False
-        try:
-            # Tester la connexion
-            self.client.server_info()
-            return True
-        except:
-            return False
+        """Vérifier si MongoDB est connecté (état mis en cache par le heartbeat, sans aller-retour réseau)"""
+        return self.collection is not None and self._healthy
+    
+    def health(self) -> Dict:
+        """État de santé mis en cache (pour /api/health)"""
+        return {
+            'connected': self.is_connected(),
+            'backend': self.name,
+            'lastCheck': datetime.utcfromtimestamp(self._last_health_check).isoformat() if self._last_health_check else None,
+            'maxPoolSize': self.client_options['maxPoolSize']
+        }
+    
+    def build_image_document(self,
+                             detections: List[Dict],
+                             image_filename: Optional[str] = None,
+                             image_size: Optional[Dict] = None,
+                             metadata: Optional[Dict] = None,
+                             document_id: Optional[str] = None,
+                             media_hash: Optional[str] = None,
+                             detected_at: Optional[datetime] = None) -> Dict:
+        """
+        Construire le document MongoDB d'une image (sans l'insérer)
+        
+        Args:
+            document_id: ID pré-attribué (écriture différée / rejeu idempotent)
+            media_hash: Empreinte du média (index unique content_hash)
+            detected_at: Heure de la détection (défaut : maintenant)
+        """
+        document = detection_schema.build_image_document(detections, image_filename, image_size, metadata, media_hash,
+                                                         detected_at)
+        if document_id is not None:
+            document['_id'] = ObjectId(document_id)
+        return document
+    
+    def insert_image_documents(self, documents: List[Dict]) -> int:
+        """
+        Insérer des documents image en lots non ordonnés
+        Les doublons d'_id (rejeu d'un lot déjà écrit) et d'empreinte (média déjà analysé) sont ignorés
+        
+        Returns:
+            Nombre de documents effectivement insérés
+        """
+        inserted = 0
+        for start in range(0, len(documents), self.insert_batch_size):
+            batch = documents[start:start + self.insert_batch_size]
+            document_ids = [document.setdefault('_id', ObjectId()) for document in batch]
+            duplicates = set()
+            self._rollups_begin(document_ids)
+            try:
+                try:
+                    self.collection.insert_many(batch, ordered=False)
+                except BulkWriteError as e:
+                    errors = e.details.get('writeErrors', [])
+                    if any(err.get('code') != DUPLICATE_KEY_ERROR for err in errors):
+                        raise
+                    duplicates = {err['index'] for err in errors}
+                # Statistiques : uniquement les documents réellement insérés (pas les rejeux)
+                for index, document in enumerate(batch):
+                    if index not in duplicates:
+                        self._apply_rollups(document, document['detections'])
+            finally:
+                self._rollups_settle(document_ids)
+            inserted += len(batch) - len(duplicates)
+        return inserted
     
     def save_image_detection(self, 
                             detections: List[Dict],
                             image_filename: Optional[str] = None,
                             image_size: Optional[Dict] = None,
-                            metadata: Optional[Dict] = None) -> Optional[str]:
+                            metadata: Optional[Dict] = None,
+                            document_id: Optional[str] = None,
+                            media_hash: Optional[str] = None,
+                            detected_at: Optional[datetime] = None) -> Optional[str]:
         """
         Sauvegarder les détections d'une image dans MongoDB
         
@@ -160,156 +440,215 @@ class MongoDBService:
             image_filename: Nom du fichier image
             image_size: Taille de l'image {'width': int, 'height': int}
             metadata: Métadonnées supplémentaires
+            document_id: ID pré-attribué (optionnel)
+            media_hash: Empreinte du média (optionnel) ; si elle existe déjà, rien n'est écrit
+            detected_at: Heure de la détection (défaut : maintenant)
         
         Returns:
-            ID du document créé ou None si erreur
+            ID du document créé (ou du document existant de même empreinte) ou None si erreur
         """
         if self.collection is None:
-            print("⚠️ MongoDB non connecté - détections non sauvegardées")
-            print("   Vérifiez la connexion MongoDB dans les logs de démarrage")
+            logger.warning("MongoDB non connecté - détections non sauvegardées")
             return None
         
         try:
-            # Nettoyer les détections (enlever les objets non sérialisables)
-            cleaned_detections = []
-            for det in detections:
-                cleaned_det = {}
-                for key, value in det.items():
-                    # Ignorer les champs non sérialisables
-                    if key not in ['segmentationMask']:  # Ignorer les masques base64 trop volumineux
-                        try:
-                            # Tester la sérialisation
-                            import json
-                            json.dumps(value)
-                            cleaned_det[key] = value
-                        except (TypeError, ValueError):
-                            # Ignorer les valeurs non sérialisables
-                            pass
-                cleaned_detections.append(cleaned_det)
-            
-            document = {
-                'timestamp': datetime.utcnow(),
-                'media_type': 'image',
-                'image_filename': image_filename,
-                'image_size': image_size,
-                'detections': cleaned_detections,
-                'detection_count': len(cleaned_detections),
-                'has_danger_alert': any(d.get('alertLevel', 0) == 3 for d in cleaned_detections),
-                'max_alert_level': max([d.get('alertLevel', 1) for d in cleaned_detections], default=1),
-                'metadata': metadata or {}
-            }
-            
-            result = self.collection.insert_one(document)
-            print(f"✅ {len(cleaned_detections)} détections sauvegardées dans MongoDB (ID: {result.inserted_id})")
+            document = self.build_image_document(detections, image_filename, image_size, metadata, document_id, media_hash,
+                                                 detected_at)
+            document.setdefault('_id', ObjectId())
+            self._rollups_begin([document['_id']])
+            try:
+                try:
+                    result = self.collection.insert_one(document)
+                except DuplicateKeyError:
+                    existing = self.find_by_content_hash(media_hash) if media_hash is not None else None
+                    if existing is None:
+                        raise
+                    logger.debug("Média déjà enregistré dans MongoDB (ID: %s)", existing['_id'])
+                    return str(existing['_id'])
+                self._apply_rollups(document, document['detections'])
+            finally:
+                self._rollups_settle([document['_id']])
+            logger.debug("%d détections sauvegardées dans MongoDB (ID: %s)", document['detection_count'], result.inserted_id)
             return str(result.inserted_id)
         
         except Exception as e:
-            print(f"❌ Erreur lors de la sauvegarde MongoDB: {e}")
-            print(f"   Type d'erreur: {type(e).__name__}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Erreur lors de la sauvegarde MongoDB (%s): %s", type(e).__name__, e)
             return None
     
+    def write_video_detection(self,
+                              frames: List[Dict],
+                              video_filename: Optional[str] = None,
+                              video_info: Optional[Dict] = None,
+                              metadata: Optional[Dict] = None,
+                              run_id: Optional[str] = None,
+                              media_hash: Optional[str] = None,
+                              detected_at: Optional[datetime] = None) -> str:
+        """
+        Écrire un run vidéo (schéma normalisé) ; lève une exception en cas d'échec
+        
+        - un document d'en-tête (run vidéo) dans `collection`
+        - un document par détection dans `video_detections` (run_id, frame_number, ...)
+        - un document de synthèse par track dans `video_tracks`
+        
+        Les détections et tracks sont insérées par lots bornés (insert_many), ce qui
+        évite la limite de 16 Mo par document sur les longues vidéos. Avec un run_id
+        pré-attribué, l'écriture est idempotente : un run complet n'est pas réécrit,
+        un run partiel est supprimé puis réécrit. Avec media_hash, un run complet de
+        même empreinte est réutilisé tel quel. detected_at (heure de l'analyse, conservée
+        par l'écriture différée et le rejeu) date l'en-tête et les détections.
+        
+        Returns:
+            ID du document d'en-tête
+        """
+        run_id = ObjectId(run_id) if run_id is not None else ObjectId()
+        
+        if media_hash is not None:
+            duplicate = self.find_by_content_hash(media_hash)
+            if duplicate is not None and duplicate['_id'] != run_id:
+                logger.debug("Vidéo déjà enregistrée dans MongoDB (ID: %s)", duplicate['_id'])
+                return str(duplicate['_id'])
+        
+        existing = self.collection.find_one({'_id': run_id}, {'status': 1})
+        if existing is not None:
+            if existing.get('status') == 'complete':
+                return str(run_id)
+            # Run partiel (écriture interrompue) : repartir de zéro
+            self.video_detections.delete_many({'run_id': run_id})
+            self.video_tracks.delete_many({'run_id': run_id})
+            self.collection.delete_one({'_id': run_id})
+        if media_hash is not None:
+            # En-tête partiel d'un autre run abandonné (écriture interrompue depuis plus de
+            # video_write_timeout) : libérer l'empreinte. Une écriture plus récente est
+            # peut-être encore en cours : l'index unique départage alors les deux runs.
+            stale_before = datetime.utcnow() - timedelta(seconds=self.video_write_timeout)
+            self.collection.update_many(
+                {
+                    'content_hash': media_hash,
+                    'status': {'$ne': 'complete'},
+                    '$or': [{'write_started_at': {'$lt': stale_before}}, {'write_started_at': {'$exists': False}}]
+                },
+                {'$unset': {'content_hash': ''}}
+            )
+        
+        started_at = detected_at or datetime.utcnow()
+        all_detections, frames_with_detections = detection_schema.flatten_video_frames(frames, run_id, started_at)
+        if self.raw_detections_timeseries:
+            meta = {'camera_id': (metadata or {}).get('camera_id'), 'media_type': 'video'}
+            for det in all_detections:
+                det['meta'] = meta
+        
+        tracks = detection_schema.summarize_tracks(run_id, all_detections)
+        
+        # En-tête d'abord (statut 'writing'), puis les détections, puis finalisation
+        # Nombre réel de frames de la vidéo (en mode événements, seules les frames avec événement sont transmises)
+        total_frames = (video_info or {}).get('totalFrames') or len(frames)
+        header = detection_schema.build_video_header(
+            run_id, total_frames, frames_with_detections, all_detections, tracks,
+            video_filename, video_info, metadata, started_at, media_hash
+        )
+        # Heure réelle de l'écriture (started_at peut être ancien après un rejeu)
+        header['write_started_at'] = datetime.utcnow()
+        self._rollups_begin([run_id])
+        try:
+            try:
+                self.collection.insert_one(header)
+            except DuplicateKeyError:
+                # Même vidéo sauvegardée en parallèle par une autre requête : son run l'emporte,
+                # y compris s'il est encore en cours d'écriture
+                duplicate = (self.collection.find_one({'content_hash': media_hash}, {'_id': 1})
+                             if media_hash is not None else None)
+                if duplicate is None:
+                    raise
+                return str(duplicate['_id'])
+            
+            inserted_detections = self._insert_in_batches(self.video_detections, all_detections)
+            inserted_tracks = self._insert_in_batches(self.video_tracks, tracks)
+            
+            self.collection.update_one({'_id': run_id}, {'$set': {'status': 'complete'}, '$unset': {'write_started_at': ''}})
+            # Compteurs de l'en-tête (événements de track comptés une fois par track)
+            self._apply_rollups(header, None)
+        finally:
+            self._rollups_settle([run_id])
+        
+        logger.info("Vidéo sauvegardée dans MongoDB", extra={
+            'run_id': str(run_id),
+            'media_filename': video_filename,
+            'frames': len(frames),
+            'frames_with_detections': frames_with_detections,
+            'detections': inserted_detections,
+            'tracks': inserted_tracks
+        })
+        
+        return str(run_id)
+    
     def save_video_detection(self,
                             frames: List[Dict],
                             video_filename: Optional[str] = None,
                             video_info: Optional[Dict] = None,
-                            metadata: Optional[Dict] = None) -> Optional[str]:
+                            metadata: Optional[Dict] = None,
+                            run_id: Optional[str] = None,
+                            media_hash: Optional[str] = None,
+                            detected_at: Optional[datetime] = None) -> Optional[str]:
         """
-        Sauvegarder les détections d'une vidéo dans MongoDB
-        TOUTES les détections de toutes les frames sont sauvegardées
+        Sauvegarder les détections d'une vidéo dans MongoDB (voir write_video_detection)
         
         Args:
             frames: Liste des frames avec détections
             video_filename: Nom du fichier vidéo
             video_info: Infos vidéo {'fps': float, 'duration': float, 'totalFrames': int}
             metadata: Métadonnées supplémentaires
+            run_id: ID pré-attribué (optionnel)
+            media_hash: Empreinte du média (optionnel)
+            detected_at: Heure de l'analyse (défaut : maintenant)
         
         Returns:
-            ID du document créé ou None si erreur
+            ID du document d'en-tête ou None si erreur
         """
         if self.collection is None:
-            print("⚠️ MongoDB non connecté - détections non sauvegardées")
-            print("   Vérifiez la connexion MongoDB dans les logs de démarrage")
+            logger.warning("MongoDB non connecté - détections non sauvegardées")
             return None
         
         try:
-            # Compter TOUTES les détections de TOUTES les frames
-            all_detections = []
-            frames_with_detections = 0
-            
-            # Nettoyer les frames (enlever les données non sérialisables)
-            cleaned_frames = []
-            
-            for frame_idx, frame in enumerate(frames):
-                frame_detections = frame.get('detections', [])
-                
-                # Nettoyer les détections de cette frame
-                cleaned_frame_detections = []
-                for det in frame_detections:
-                    cleaned_det = {}
-                    for key, value in det.items():
-                        # Ignorer les champs non sérialisables (masques base64 trop volumineux)
-                        if key not in ['segmentationMask', 'hasSegmentation']:
-                            try:
-                                # Tester la sérialisation
-                                import json
-                                json.dumps(value)
-                                cleaned_det[key] = value
-                            except (TypeError, ValueError):
-                                # Ignorer les valeurs non sérialisables
-                                pass
-                    
-                    if cleaned_det:
-                        cleaned_det['frame_number'] = frame.get('frame', frame_idx)
-                        cleaned_det['frame_time'] = frame.get('time', 0)
-                        cleaned_frame_detections.append(cleaned_det)
-                        all_detections.append(cleaned_det)
-                
-                if cleaned_frame_detections:
-                    frames_with_detections += 1
-                
-                # Créer une frame nettoyée
-                cleaned_frame = {
-                    'frame': frame.get('frame', frame_idx),
-                    'time': frame.get('time', 0),
-                    'detections': cleaned_frame_detections,
-                    'count': len(cleaned_frame_detections)
-                }
-                cleaned_frames.append(cleaned_frame)
-            
-            print(f"📹 Préparation sauvegarde vidéo: {len(frames)} frames, {frames_with_detections} frames avec détections, {len(all_detections)} détections totales")
-            
-            document = {
-                'timestamp': datetime.utcnow(),
-                'media_type': 'video',
-                'video_filename': video_filename,
-                'video_info': video_info or {},
-                'frames': cleaned_frames,  # Frames nettoyées
-                'total_frames': len(cleaned_frames),
-                'frames_with_detections': frames_with_detections,
-                'detections': all_detections,  # TOUTES les détections de toutes les frames
-                'detection_count': len(all_detections),
-                'has_danger_alert': any(d.get('alertLevel', 0) == 3 for d in all_detections),
-                'max_alert_level': max([d.get('alertLevel', 1) for d in all_detections], default=1),
-                'metadata': metadata or {}
-            }
-            
-            result = self.collection.insert_one(document)
-            print(f"✅ Vidéo sauvegardée dans MongoDB:")
-            print(f"   📁 Fichier: {video_filename}")
-            print(f"   🎬 Frames: {len(cleaned_frames)} totales, {frames_with_detections} avec détections")
-            print(f"   📦 Détections: {len(all_detections)} objets détectés")
-            print(f"   🆔 ID MongoDB: {result.inserted_id}")
-            
-            return str(result.inserted_id)
+            return self.write_video_detection(frames, video_filename, video_info, metadata, run_id, media_hash, detected_at)
         
         except Exception as e:
-            print(f"❌ Erreur lors de la sauvegarde MongoDB: {e}")
-            print(f"   Type d'erreur: {type(e).__name__}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Erreur lors de la sauvegarde MongoDB (%s): %s", type(e).__name__, e)
+            return None
+    
+    def find_by_content_hash(self, media_hash: str) -> Optional[Dict]:
+        """Document image ou en-tête vidéo complet portant cette empreinte de média"""
+        if self.collection is None:
             return None
+        return self.collection.find_one({'content_hash': media_hash, 'status': {'$ne': 'writing'}})
+    
+    def find_by_result_hash(self, result_hash: str, media_type: str = 'image',
+                            filename: Optional[str] = None) -> Optional[Dict]:
+        """Document de même type et même fichier aux détections identiques"""
+        if self.collection is None:
+            return None
+        return self.collection.find_one(
+            {'result_hash': result_hash, 'media_type': media_type, f'{media_type}_filename': filename,
+             'status': {'$ne': 'writing'}},
+            {'_id': 1, 'content_hash': 1}
+        )
+    
+    def release_content_hash(self, document_id: str):
+        """Retirer l'empreinte d'un run (détections brutes expirées) pour permettre une nouvelle analyse"""
+        self.collection.update_one({'_id': ObjectId(document_id)}, {'$unset': {'content_hash': ''}})
+    
+    def get_video_detections(self, run_id, limit: int = 0) -> List[Dict]:
+        """Récupérer les détections d'un run vidéo (schéma normalisé), triées par frame"""
+        if self.video_detections is None:
+            return []
+        
+        try:
+            cursor = self.video_detections.find({'run_id': ObjectId(run_id)}).sort('frame_number', 1)
+            if limit:
+                cursor = cursor.limit(limit)
+            return list(cursor)
+        except Exception as e:
+            logger.exception("Erreur lors de la récupération: %s", e)
+            return []
     
     def get_recent_detections(self, limit: int = 100):
         """Récupérer les détections récentes"""
@@ -319,53 +658,168 @@ class MongoDBService:
         try:
             return list(self.collection.find().sort('timestamp', -1).limit(limit))
         except Exception as e:
-            print(f"❌ Erreur lors de la récupération: {e}")
+            logger.exception("Erreur lors de la récupération: %s", e)
             return []
     
-    def export_to_csv(self, detections: List[Dict]) -> str:
+    def query_detections(self,
+                         filters: Dict,
+                         limit: int = detection_query.DEFAULT_PAGE_SIZE,
+                         cursor: Optional[str] = None,
+                         include_detections: bool = False) -> Dict:
         """
-        Exporter les détections en format CSV
+        Requête paginée (keyset) sur les documents de détection
         
         Args:
-            detections: Liste des détections
+            filters: Filtres normalisés (voir detection_query.parse_filters)
+            limit: Taille de page
+            cursor: Curseur opaque renvoyé par la page précédente
+            include_detections: Inclure les détections des images (jamais les frames)
+        
+        Returns:
+            {'items': [...], 'nextCursor': str ou None}
+        """
+        if self.collection is None:
+            return {'items': [], 'nextCursor': None}
+        
+        query = detection_query.apply_cursor(detection_query.build_mongo_filter(filters), cursor)
+        projection = dict(detection_query.SUMMARY_PROJECTION)
+        if include_detections:
+            projection['detections'] = 1
+        
+        # Une page de plus d'un document pour savoir s'il reste des résultats
+        documents = list(
+            self.collection.find(query, projection)
+            .sort([('timestamp', -1), ('_id', -1)])
+            .limit(limit + 1)
+        )
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = detection_query.encode_cursor(documents[-1])
+        return {'items': documents, 'nextCursor': next_cursor}
+    
+    def get_statistics(self, granularity: str = 'day', filters: Optional[Dict] = None) -> Dict:
+        """
+        Statistiques lues dans les rollups (un document par intervalle et par caméra)
+        
+        Args:
+            granularity: 'hour' ou 'day'
+            filters: Filtres normalisés ; seuls 'from', 'to' et 'camera_id' s'appliquent
         
         Returns:
-            Contenu CSV en string
+            Totaux, compteurs par label / niveau d'alerte / type / caméra et série temporelle
         """
-        import csv
-        import io
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # En-têtes
-        writer.writerow([
-            'ID', 'Label', 'Confidence', 'Risk Level', 'Alert Level', 
-            'Size (cm)', 'Size (m)', 'Position', 'BBox X (%)', 'BBox Y (%)', 
-            'BBox Width (%)', 'BBox Height (%)'
-        ])
-        
-        # Données
-        for det in detections:
-            writer.writerow([
-                det.get('id', ''),
-                det.get('label', ''),
-                f"{det.get('confidence', 0):.3f}",
-                det.get('riskLevel', ''),
-                det.get('alertLevel', ''),
-                det.get('sizeCm', ''),
-                det.get('sizeMeters', ''),
-                det.get('position', ''),
-                f"{det.get('bbox', {}).get('x', 0):.2f}",
-                f"{det.get('bbox', {}).get('y', 0):.2f}",
-                f"{det.get('bbox', {}).get('width', 0):.2f}",
-                f"{det.get('bbox', {}).get('height', 0):.2f}"
-            ])
-        
-        return output.getvalue()
+        if granularity not in detection_rollups.GRANULARITIES:
+            raise ValueError(f"Granularité inconnue: {granularity}")
+        filters = filters or {}
+        query = {'granularity': granularity}
+        if 'camera_id' in filters:
+            query['camera_id'] = filters['camera_id']
+        if 'from' in filters or 'to' in filters:
+            query['period'] = {}
+            if 'from' in filters:
+                query['period']['$gte'] = detection_rollups.bucket_start(filters['from'], granularity)
+            if 'to' in filters:
+                query['period']['$lt'] = filters['to']
+        
+        if self.rollups is None:
+            return detection_rollups.merge_rollups([], granularity)
+        return detection_rollups.merge_rollups(self.rollups.find(query, {'_id': 0}), granularity)
+    
+    def rebuild_rollups(self) -> int:
+        """
+        Reconstruire les rollups depuis les documents existants (données antérieures, dérive)
+        Parcours par curseur à taille de lot bornée : mémoire constante
+        
+        Les écritures ne sont pas bloquées. Les rollups sont construits dans une collection
+        temporaire ; les $inc des documents écrits pendant le parcours sont journalisés,
+        rejoués dans la collection temporaire (et ces documents ignorés par le parcours),
+        puis la collection temporaire remplace l'ancienne en un seul renommage. Les
+        lectures de /api/stats ne voient jamais de collection vide ou partielle.
+        Appelé en arrière-plan par start_rollup_rebuild.
+        
+        Returns:
+            Nombre de documents agrégés
+        """
+        with self._rollups_lock:
+            if self._rollups_journal is not None:
+                raise RuntimeError("Reconstruction des rollups déjà en cours")
+            self._rollups_journal = {}
+        try:
+            rebuilt = self.db[f"{self.rollups_collection_name}_rebuild"]
+            rebuilt.drop()
+            self._create_rollup_indexes(rebuilt)
+            processed = 0
+            cursor = self.collection.find({'status': {'$ne': 'writing'}}).batch_size(self.insert_batch_size)
+            for document in cursor:
+                with self._rollups_lock:
+                    # Rollups journalisés ou encore à venir : comptés par le rejeu du journal
+                    skip = document['_id'] in self._rollups_journal or document['_id'] in self._rollups_pending
+                if skip:
+                    continue
+                if 'label_counts' in document:
+                    # Compteurs de l'en-tête : valables même si les détections brutes ont expiré
+                    detections = None
+                elif document.get('storage_layout') == 'normalized':
+                    detections = self.video_detections.find(
+                        {'run_id': document['_id']}, {'label': 1, 'alertLevel': 1}
+                    ).batch_size(self.insert_batch_size)
+                elif document.get('media_type') == 'video':
+                    # Ancien format : détections imbriquées dans les frames
+                    detections = [det for frame in document.get('frames', []) for det in frame.get('detections', [])]
+                else:
+                    detections = document.get('detections', [])
+                rebuilt.bulk_write(detection_rollups.rollup_updates(document, detections), ordered=False)
+                processed += 1
+            with self._rollups_lock:
+                for updates in self._rollups_journal.values():
+                    rebuilt.bulk_write(updates, ordered=False)
+                processed += len(self._rollups_journal)
+                rebuilt.rename(self.rollups_collection_name, dropTarget=True)
+        finally:
+            with self._rollups_lock:
+                self._rollups_journal = None
+        logger.info("Rollups reconstruits", extra={'documents': processed})
+        return processed
+    
+    def iter_detection_rows(self, filters: Dict, batch_size: int = 1000):
+        """
+        Générateur des détections correspondant aux filtres (une ligne d'export par détection)
+        
+        Les curseurs MongoDB sont lus par lots de batch_size : aucun résultat n'est
+        matérialisé en entier (exports volumineux en mémoire constante).
+        """
+        label = filters.get('label')
+        query = detection_query.build_mongo_filter(filters)
+        cursor = self.collection.find(query, {'detections.segmentationMask': 0}) \
+            .sort([('timestamp', -1), ('_id', -1)]) \
+            .batch_size(batch_size)
+        
+        for document in cursor:
+            if document.get('storage_layout') == 'normalized':
+                det_query = {'run_id': document['_id']}
+                if label:
+                    det_query['label'] = label
+                detections = self.video_detections.find(det_query, {'run_id': 0}) \
+                    .sort('frame_number', 1) \
+                    .batch_size(batch_size)
+            elif document.get('media_type') == 'video':
+                # Ancien format : détections imbriquées dans les frames
+                detections = (
+                    dict(det, frame_number=frame.get('frame'), frame_time=frame.get('time'))
+                    for frame in document.get('frames', []) for det in frame.get('detections', [])
+                )
+            else:
+                detections = document.get('detections', [])
+            
+            for det in detections:
+                if label and det.get('label') != label:
+                    continue
+                yield detection_row(document, det)
     
     def close(self):
         """Fermer la connexion MongoDB"""
+        self._heartbeat_stop.set()
         if self.client:
             self.client.close()
             print("✅ Connexion MongoDB fermée")
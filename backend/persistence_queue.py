@@ -0,0 +1,288 @@
+"""
+File d'écriture différée (write-behind) vers MongoDB
+
+Les endpoints de détection déposent leurs résultats dans une file bornée en
+mémoire et répondent immédiatement avec un ID pré-attribué. Un thread
+d'écriture vide la file par lots (insert_many non ordonné), réessaie avec
+backoff exponentiel, et déverse les lots sur disque (fichier JSONL en ajout
+seul) quand MongoDB est injoignable. Le fichier de déversement est rejoué
+automatiquement à la reconnexion. Quand la file est pleine, les sauvegardes
+passent par un tampon de débordement borné que le thread d'écriture déverse
+sur disque : une requête ne fait jamais d'entrée/sortie fichier.
+
+La latence des requêtes devient ainsi indépendante de la base de données.
+"""
+import collections
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+from bson import ObjectId
+
+try:
+    from metrics import stage_timer
+    from structured_logging import get_logger
+except ImportError:
+    from backend.metrics import stage_timer
+    from backend.structured_logging import get_logger
+
+logger = get_logger('persistence')
+
+PERSISTENCE_WRITE_BEHIND = os.getenv('PERSISTENCE_WRITE_BEHIND', '1') == '1'
+PERSISTENCE_QUEUE_SIZE = int(os.getenv('PERSISTENCE_QUEUE_SIZE', '1000'))
+# Sauvegardes en attente de déversement quand la file est pleine (au-delà : perdues)
+PERSISTENCE_OVERFLOW_SIZE = int(os.getenv('PERSISTENCE_OVERFLOW_SIZE', '1000'))
+PERSISTENCE_BATCH_SIZE = int(os.getenv('PERSISTENCE_BATCH_SIZE', '100'))
+PERSISTENCE_MAX_RETRIES = int(os.getenv('PERSISTENCE_MAX_RETRIES', '3'))
+PERSISTENCE_BACKOFF_SECONDS = float(os.getenv('PERSISTENCE_BACKOFF_SECONDS', '0.5'))
+PERSISTENCE_RECONNECT_INTERVAL = float(os.getenv('PERSISTENCE_RECONNECT_INTERVAL', '10'))
+PERSISTENCE_SPILL_PATH = Path(os.getenv(
+    'PERSISTENCE_SPILL_PATH',
+    str(Path(__file__).parent / 'persistence_spill.jsonl')
+))
+
+
+def _json_default(value):
+    """Encodeur JSON pour le fichier de déversement (scalaires NumPy, dates, ObjectId)"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+class PersistenceQueue:
+    """File bornée + thread d'écriture par lots vers MongoDBService"""
+
+    def __init__(self, service,
+                 maxsize: int = PERSISTENCE_QUEUE_SIZE,
+                 batch_size: int = PERSISTENCE_BATCH_SIZE,
+                 max_retries: int = PERSISTENCE_MAX_RETRIES,
+                 backoff_seconds: float = PERSISTENCE_BACKOFF_SECONDS,
+                 spill_path: Path = PERSISTENCE_SPILL_PATH,
+                 overflow_size: int = PERSISTENCE_OVERFLOW_SIZE):
+        self.service = service
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflow_size = overflow_size
+        self._overflow = collections.deque()
+        self._overflow_lock = threading.Lock()
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.spill_path = Path(spill_path)
+        self._spill_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_reconnect_attempt = 0.0
+        self.stats_counters = {
+            'enqueued': 0,
+            'written': 0,
+            'failed_batches': 0,
+            'retries': 0,
+            'spilled': 0,
+            'replayed': 0,
+            'dropped_to_spill_queue_full': 0,
+            'dropped_overflow_full': 0,
+            'last_error': None
+        }
+
+    # ------------------------------------------------------------------
+    # API côté requêtes (non bloquante)
+    # ------------------------------------------------------------------
+    def start(self):
+        """Démarrer le thread d'écriture"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='mongodb-writer', daemon=True)
+        self._thread.start()
+
+    def submit_image(self, **payload) -> str:
+        """Mettre en file la sauvegarde d'une image ; retourne l'ID pré-attribué"""
+        return self._submit('image', payload)
+
+    def submit_video(self, **payload) -> str:
+        """Mettre en file la sauvegarde d'une vidéo ; retourne l'ID pré-attribué"""
+        return self._submit('video', payload)
+
+    def _submit(self, kind: str, payload: Dict) -> str:
+        # Heure de la détection : un job déversé puis rejoué reste daté de sa requête
+        payload['detected_at'] = datetime.utcnow()
+        job = {'kind': kind, 'id': str(ObjectId()), 'payload': payload}
+        try:
+            self.queue.put_nowait(job)
+            self._count('enqueued')
+        except queue.Full:
+            # Ne jamais bloquer la requête : le thread d'écriture déversera le job sur disque
+            with self._overflow_lock:
+                accepted = len(self._overflow) < self.overflow_size
+                if accepted:
+                    self._overflow.append(job)
+            if accepted:
+                self._count('dropped_to_spill_queue_full')
+            else:
+                self._count('dropped_overflow_full')
+                logger.error("File d'écriture et tampon de débordement pleins : sauvegarde perdue",
+                             extra={'job_id': job['id'], 'kind': kind})
+        return job['id']
+
+    def stats(self) -> Dict:
+        """Métriques de la file (profondeur, compteurs, déversement en attente)"""
+        with self._stats_lock:
+            stats = dict(self.stats_counters)
+        stats['queue_depth'] = self.queue.qsize()
+        stats['queue_capacity'] = self.queue.maxsize
+        stats['overflow_depth'] = len(self._overflow)
+        stats['spill_pending'] = self.spill_path.exists() and self.spill_path.stat().st_size > 0
+        stats['writer_alive'] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+    def stop(self, timeout: float = 10.0):
+        """Arrêter le thread après avoir vidé la file (ou déversé ce qui reste)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._drain_overflow()
+        remaining = []
+        while True:
+            try:
+                remaining.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if remaining:
+            self._spill(remaining)
+
+    # ------------------------------------------------------------------
+    # Thread d'écriture
+    # ------------------------------------------------------------------
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats_counters[key] += amount
+
+    def _drain_overflow(self):
+        """Déverser sur disque les jobs refusés par la file pleine"""
+        with self._overflow_lock:
+            jobs = list(self._overflow)
+            self._overflow.clear()
+        if jobs:
+            self._spill(jobs)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._drain_overflow()
+            try:
+                job = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                self._maybe_replay_spill()
+                continue
+
+            jobs = [job]
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if not self._write_with_retry(jobs):
+                self._spill(jobs)
+
+    def _ensure_connected(self) -> bool:
+        """Tenter une reconnexion au plus toutes les PERSISTENCE_RECONNECT_INTERVAL secondes"""
+        if self.service.is_connected():
+            return True
+        now = time.time()
+        if now - self._last_reconnect_attempt < PERSISTENCE_RECONNECT_INTERVAL:
+            return False
+        self._last_reconnect_attempt = now
+        return self.service.reconnect()
+
+    @staticmethod
+    def _payload(job: Dict) -> Dict:
+        """Arguments d'écriture d'un job (detected_at relu en datetime après un déversement JSONL)"""
+        payload = dict(job['payload'])
+        if isinstance(payload.get('detected_at'), str):
+            payload['detected_at'] = datetime.fromisoformat(payload['detected_at'])
+        return payload
+
+    def _write(self, jobs: List[Dict]):
+        """Écrire un lot : images en un insert_many, vidéos via le schéma normalisé"""
+        image_documents = [
+            self.service.build_image_document(document_id=job['id'], **self._payload(job))
+            for job in jobs if job['kind'] == 'image'
+        ]
+        if image_documents:
+            with stage_timer('storage_write', 'image'):
+                self.service.insert_image_documents(image_documents)
+        for job in jobs:
+            if job['kind'] == 'video':
+                with stage_timer('storage_write', 'video'):
+                    self.service.write_video_detection(run_id=job['id'], **self._payload(job))
+
+    def _write_with_retry(self, jobs: List[Dict]) -> bool:
+        delay = self.backoff_seconds
+        for attempt in range(self.max_retries + 1):
+            if self._ensure_connected():
+                try:
+                    self._write(jobs)
+                    self._count('written', len(jobs))
+                    return True
+                except Exception as e:
+                    with self._stats_lock:
+                        self.stats_counters['last_error'] = f"{type(e).__name__}: {e}"
+            if attempt < self.max_retries:
+                self._count('retries')
+                time.sleep(delay)
+                delay = min(delay * 2, 10.0)
+        self._count('failed_batches')
+        return False
+
+    # ------------------------------------------------------------------
+    # Déversement sur disque et rejeu
+    # ------------------------------------------------------------------
+    def _spill(self, jobs: List[Dict]):
+        """Ajouter les jobs au fichier de déversement (une ligne JSON par job)"""
+        try:
+            with self._spill_lock:
+                with open(self.spill_path, 'a', encoding='utf-8') as f:
+                    for job in jobs:
+                        f.write(json.dumps(job, default=_json_default) + '\n')
+            self._count('spilled', len(jobs))
+            logger.warning("Sauvegardes déversées sur disque (MongoDB injoignable)",
+                           extra={'jobs': len(jobs), 'spill_file': self.spill_path.name})
+        except Exception as e:
+            logger.error("Impossible d'écrire le fichier de déversement: %s", e)
+
+    def _maybe_replay_spill(self):
+        """Rejouer le fichier de déversement quand MongoDB est de nouveau joignable"""
+        if not self.spill_path.exists() or self.spill_path.stat().st_size == 0:
+            return
+        if not self._ensure_connected():
+            return
+
+        replay_path = self.spill_path.with_suffix('.replaying')
+        with self._spill_lock:
+            # Un rejeu précédent interrompu est repris en priorité
+            if not replay_path.exists():
+                self.spill_path.rename(replay_path)
+
+        with open(replay_path, 'r', encoding='utf-8') as f:
+            jobs = [json.loads(line) for line in f if line.strip()]
+
+        logger.info("Rejeu des sauvegardes déversées", extra={'jobs': len(jobs)})
+        for start in range(0, len(jobs), self.batch_size):
+            batch = jobs[start:start + self.batch_size]
+            if not self._write_with_retry(batch):
+                # Remettre le reste dans le fichier de déversement et réessayer plus tard
+                self._spill(jobs[start:])
+                break
+            self._count('replayed', len(batch))
+        replay_path.unlink()
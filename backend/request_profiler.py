@@ -0,0 +1,239 @@
+"""
+Profilage à la demande d'une requête de détection
+
+Une requête portant l'en-tête X-Profile (ou ?profile=1) est exécutée sous cProfile
+et torch.profiler (statistiques par opérateur : convolutions, NMS, copies...). Le
+rapport est enregistré sur disque et son identifiant renvoyé dans l'en-tête
+X-Profile-Id ; il se consulte ensuite via GET /api/profiles/<id>.
+
+Sans l'en-tête, rien n'est activé : le coût se limite à la lecture de l'en-tête.
+Désactivé par défaut (PROFILING_ENABLED=0) : un profil expose le code interne. Avec
+PROFILING_TOKEN, la demande de profil et la lecture des rapports exigent ce jeton.
+Un seul profil à la fois (cProfile et torch.profiler sont globaux au processus) ;
+une requête qui en demande un pendant qu'un autre est en cours est exécutée normalement.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', '0') == '1'
+# Si défini, l'en-tête X-Profile doit porter ce jeton, aussi pour lire les rapports (/api/profiles)
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+PROFILE_DIR = Path(os.getenv('PROFILE_DIR', str(Path(__file__).parent / 'profiles')))
+PROFILE_MAX_REPORTS = int(os.getenv('PROFILE_MAX_REPORTS', '50'))
+PROFILE_TOP_FUNCTIONS = int(os.getenv('PROFILE_TOP_FUNCTIONS', '40'))
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+PROFILE_STATUS_HEADER = 'X-Profile-Status'
+
+_PROFILE_ID_PATTERN = re.compile(r"^\d{8}T\d{12}-[0-9a-f]{6}$")
+_active_lock = threading.Lock()
+
+
+def profiling_requested(header_value: Optional[str], query_value: Optional[str] = None) -> bool:
+    """
+    La requête demande-t-elle un profil ?
+
+    Args:
+        header_value: Valeur de l'en-tête X-Profile
+        query_value: Valeur du paramètre ?profile=
+
+    Returns:
+        True si le profilage est activé et la valeur acceptée (jeton si PROFILING_TOKEN est défini)
+    """
+    value = header_value or query_value
+    if not value or not PROFILING_ENABLED:
+        return False
+    if PROFILING_TOKEN:
+        return value == PROFILING_TOKEN
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def profiles_readable(header_value: Optional[str], query_value: Optional[str] = None) -> bool:
+    """
+    Les rapports (/api/profiles) peuvent-ils être lus ?
+
+    Args:
+        header_value: Valeur de l'en-tête X-Profile
+        query_value: Valeur du paramètre ?profile=
+
+    Returns:
+        True si le profilage est activé et, si PROFILING_TOKEN est défini, que le jeton est fourni
+    """
+    if not PROFILING_ENABLED:
+        return False
+    return not PROFILING_TOKEN or (header_value or query_value) == PROFILING_TOKEN
+
+
+def _short_path(filename: str) -> str:
+    """Chemin raccourci aux deux derniers éléments (site-packages/... illisible sinon)"""
+    parts = Path(filename).parts
+    return '/'.join(parts[-2:]) if len(parts) > 1 else filename
+
+
+def _torch_operators(torch_profile, limit: int) -> List[Dict]:
+    """Opérateurs torch triés par temps CPU propre (µs -> ms)"""
+    rows = []
+    for event in torch_profile.key_averages():
+        row = {
+            'name': event.key,
+            'count': event.count,
+            'self_cpu_ms': round(event.self_cpu_time_total / 1000, 3),
+            'cpu_total_ms': round(event.cpu_time_total / 1000, 3)
+        }
+        device_time = getattr(event, 'self_device_time_total', None)
+        if device_time is None:
+            device_time = getattr(event, 'self_cuda_time_total', 0)
+        if device_time:
+            row['self_device_ms'] = round(device_time / 1000, 3)
+        rows.append(row)
+    rows.sort(key=lambda row: row['self_cpu_ms'], reverse=True)
+    return rows[:limit]
+
+
+class ProfileSession:
+    """cProfile + torch.profiler autour d'une seule exécution (obtenue par start_profile)"""
+
+    def __init__(self, label: str, request_id: Optional[str] = None):
+        self.id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:6]}"
+        self.label = label
+        self.request_id = request_id
+        self._cprofile = cProfile.Profile()
+        self._torch_profile = None
+        self._start = None
+
+    def _start_torch(self):
+        try:
+            import torch
+            from torch.profiler import profile, ProfilerActivity
+        except ImportError:
+            return
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        self._torch_profile = profile(activities=activities, record_shapes=False)
+        self._torch_profile.__enter__()
+
+    def start(self):
+        self._start_torch()
+        self._start = time.perf_counter()
+        self._cprofile.enable()
+
+    def stop(self) -> str:
+        """Arrêter les profileurs, enregistrer le rapport et libérer le verrou ; retourne l'ID"""
+        try:
+            self._cprofile.disable()
+            wall_seconds = time.perf_counter() - self._start
+            if self._torch_profile is not None:
+                self._torch_profile.__exit__(None, None, None)
+            report = self._build_report(wall_seconds)
+            profile_store.save(report, self._cprofile)
+            return self.id
+        finally:
+            _active_lock.release()
+
+    def _build_report(self, wall_seconds: float) -> Dict:
+        stats = pstats.Stats(self._cprofile)
+        top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP_FUNCTIONS]
+        text = io.StringIO()
+        pstats.Stats(self._cprofile, stream=text).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        return {
+            'id': self.id,
+            'label': self.label,
+            'request_id': self.request_id,
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'wall_seconds': round(wall_seconds, 4),
+            'cprofile': {
+                'total_calls': stats.total_calls,
+                'primitive_calls': stats.prim_calls,
+                'top_cumulative': [{
+                    'function': f"{_short_path(filename)}:{line}({name})",
+                    'ncalls': ncalls,
+                    'tottime_ms': round(tottime * 1000, 3),
+                    'cumtime_ms': round(cumtime * 1000, 3)
+                } for (filename, line, name), (_, ncalls, tottime, cumtime, _) in top],
+                'text': text.getvalue()
+            },
+            'torch_operators': (_torch_operators(self._torch_profile, PROFILE_TOP_FUNCTIONS)
+                                if self._torch_profile is not None else None)
+        }
+
+
+def start_profile(label: str, request_id: Optional[str] = None) -> Optional[ProfileSession]:
+    """
+    Démarrer un profil si aucun autre n'est en cours
+
+    Returns:
+        Session démarrée (appeler stop()), ou None si un profil est déjà actif
+    """
+    if not _active_lock.acquire(blocking=False):
+        return None
+    try:
+        session = ProfileSession(label, request_id)
+        session.start()
+    except Exception:
+        _active_lock.release()
+        raise
+    return session
+
+
+class ProfileStore:
+    """Rapports sur disque (<id>.json + <id>.prof pour snakeviz / pstats), les plus anciens supprimés"""
+
+    def __init__(self, directory: Path = PROFILE_DIR, max_reports: int = PROFILE_MAX_REPORTS):
+        self.directory = Path(directory)
+        self.max_reports = max_reports
+
+    def save(self, report: Dict, cprofile: cProfile.Profile):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        cprofile.dump_stats(str(self.directory / f"{report['id']}.prof"))
+        (self.directory / f"{report['id']}.json").write_text(
+            json.dumps(report, ensure_ascii=False, default=str), encoding='utf-8'
+        )
+        self._prune()
+
+    def _prune(self):
+        # Les IDs commencent par l'horodatage : l'ordre alphabétique est chronologique
+        reports = sorted(self.directory.glob('*.json'))
+        for path in reports[:max(0, len(reports) - self.max_reports)]:
+            path.unlink(missing_ok=True)
+            path.with_suffix('.prof').unlink(missing_ok=True)
+
+    def path(self, profile_id: str, suffix: str = '.json') -> Optional[Path]:
+        """Chemin d'un rapport existant (None si l'ID est invalide ou inconnu)"""
+        if not _PROFILE_ID_PATTERN.match(profile_id or ''):
+            return None
+        path = self.directory / f"{profile_id}{suffix}"
+        return path if path.exists() else None
+
+    def load(self, profile_id: str) -> Optional[Dict]:
+        path = self.path(profile_id)
+        if path is None:
+            return None
+        return json.loads(path.read_text(encoding='utf-8'))
+
+    def list(self) -> List[Dict]:
+        """Résumés des rapports, du plus récent au plus ancien"""
+        summaries = []
+        if not self.directory.exists():
+            return summaries
+        for path in sorted(self.directory.glob('*.json'), reverse=True):
+            try:
+                report = json.loads(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue
+            summaries.append({key: report.get(key) for key in ('id', 'label', 'request_id', 'created_at', 'wall_seconds')})
+        return summaries
+
+
+profile_store = ProfileStore()
@@ -0,0 +1,595 @@
+"""
+Backend de stockage SQLite (fichier local) pour les détections FOD
+
+Alternative à MongoDB pour les postes sans serveur de base de données :
+- journal WAL (lectures concurrentes pendant les écritures, fsync réduits)
+- une transaction par lot d'images ou par run vidéo (executemany)
+- index alignés sur les filtres de /api/detections (timestamp, type, caméra, label)
+- rollups des statistiques (table detection_rollups) mis à jour dans la même transaction
+
+Les documents sont stockés en JSON dans la colonne `document` ; les champs
+filtrables sont dupliqués dans des colonnes indexées.
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+
+try:
+    import detection_schema
+    import detection_query
+    import detection_rollups
+    from detection_export import detection_row
+    from storage_backends import StorageBackend
+    from structured_logging import get_logger
+except ImportError:
+    from backend import detection_schema, detection_query, detection_rollups
+    from backend.detection_export import detection_row
+    from backend.storage_backends import StorageBackend
+    from backend.structured_logging import get_logger
+
+logger = get_logger('storage.sqlite')
+
+SQLITE_PATH = Path(os.getenv('SQLITE_PATH', str(Path(__file__).parent / 'fod_detections.db')))
+SQLITE_INSERT_BATCH_SIZE = int(os.getenv('SQLITE_INSERT_BATCH_SIZE', '1000'))
+# NORMAL : durable en mode WAL sauf coupure de courant pendant un checkpoint
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    media_type TEXT NOT NULL,
+    camera_id TEXT,
+    status TEXT,
+    detection_count INTEGER NOT NULL DEFAULT 0,
+    max_alert_level INTEGER NOT NULL DEFAULT 1,
+    has_danger_alert INTEGER NOT NULL DEFAULT 0,
+    document TEXT NOT NULL,
+    content_hash TEXT,
+    result_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_detections_timestamp ON detections (timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_detections_media_type ON detections (media_type, timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_detections_camera ON detections (camera_id, timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_detections_alert ON detections (max_alert_level, timestamp DESC, id DESC);
+
+CREATE TABLE IF NOT EXISTS detection_labels (
+    label TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    detection_id TEXT NOT NULL,
+    PRIMARY KEY (label, timestamp, detection_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS video_detections (
+    run_id TEXT NOT NULL,
+    frame_number INTEGER,
+    frame_time REAL,
+    track_id INTEGER,
+    label TEXT,
+    alert_level INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_video_detections_run ON video_detections (run_id, frame_number);
+CREATE INDEX IF NOT EXISTS idx_video_detections_label ON video_detections (label);
+
+CREATE TABLE IF NOT EXISTS video_tracks (
+    run_id TEXT NOT NULL,
+    track_id INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (run_id, track_id)
+);
+
+CREATE TABLE IF NOT EXISTS detection_rollups (
+    granularity TEXT NOT NULL,
+    period TEXT NOT NULL,
+    camera_id TEXT NOT NULL,
+    counter TEXT NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, period, camera_id, counter)
+) WITHOUT ROWID;
+"""
+
+# Colonnes ajoutées après la première version du schéma (bases existantes : ALTER TABLE)
+ADDED_COLUMNS = {'content_hash': 'TEXT', 'result_hash': 'TEXT'}
+
+HASH_INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_detections_content_hash ON detections (content_hash) WHERE content_hash IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_detections_result_hash ON detections (result_hash, media_type);
+"""
+
+HEADER_INSERT = (
+    'INTO detections (id, timestamp, media_type, camera_id, status, detection_count, max_alert_level, '
+    'has_danger_alert, document, content_hash, result_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+)
+
+# Un compteur par ligne (clés de detection_rollups.rollup_increments), incrémenté par upsert
+ROLLUP_UPSERT = (
+    'INSERT INTO detection_rollups VALUES (?, ?, ?, ?, ?) '
+    'ON CONFLICT (granularity, period, camera_id, counter) DO UPDATE SET value = value + excluded.value'
+)
+
+
+def _timestamp_key(value: datetime) -> str:
+    """Horodatage triable lexicographiquement (toujours avec microsecondes)"""
+    return value.isoformat(timespec='microseconds')
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=_json_default)
+
+
+def _load_document(row_id: str, raw: str) -> Dict:
+    """Document JSON -> dict au format des documents MongoDB (_id, timestamp datetime)"""
+    document = json.loads(raw)
+    document['_id'] = row_id
+    document['timestamp'] = datetime.fromisoformat(document['timestamp'])
+    return document
+
+
+class SQLiteService(StorageBackend):
+    """Stockage des détections dans un fichier SQLite local"""
+
+    name = 'sqlite'
+
+    def __init__(self, path: Path = SQLITE_PATH, batch_size: int = SQLITE_INSERT_BATCH_SIZE):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.conn = None
+        self.collection = None
+        # Une seule connexion d'écriture partagée (thread d'écriture différée + requêtes)
+        self._lock = threading.RLock()
+        self._connect()
+
+    def _connect(self):
+        """Ouvrir la base, activer le WAL et créer le schéma"""
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}')
+            conn.execute('PRAGMA busy_timeout=5000')
+            conn.executescript(SCHEMA)
+            existing_columns = {row[1] for row in conn.execute('PRAGMA table_info(detections)')}
+            for column, column_type in ADDED_COLUMNS.items():
+                if column not in existing_columns:
+                    conn.execute(f'ALTER TABLE detections ADD COLUMN {column} {column_type}')
+            conn.executescript(HASH_INDEXES)
+            self.conn = conn
+            self.collection = 'detections'
+            print(f"✅ Stockage SQLite prêt: {self.path}")
+        except Exception as e:
+            print(f"❌ Impossible d'ouvrir la base SQLite {self.path}: {e}")
+            self.conn = None
+            self.collection = None
+
+    def _read_connection(self) -> sqlite3.Connection:
+        """Connexion de lecture dédiée (WAL : lit sans bloquer l'écriture)"""
+        conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        conn.execute('PRAGMA query_only=1')
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.conn
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+
+    @staticmethod
+    def _header_row(document: Dict):
+        body = {key: value for key, value in document.items() if key != '_id'}
+        return (
+            str(document['_id']),
+            _timestamp_key(document['timestamp']),
+            document['media_type'],
+            (document.get('metadata') or {}).get('camera_id'),
+            document.get('status', 'complete'),
+            document.get('detection_count', 0),
+            document.get('max_alert_level', 1),
+            int(bool(document.get('has_danger_alert'))),
+            _dumps(body),
+            document.get('content_hash'),
+            document.get('result_hash')
+        )
+
+    @staticmethod
+    def _label_rows(document: Dict):
+        timestamp = _timestamp_key(document['timestamp'])
+        return [(label, timestamp, str(document['_id'])) for label in document.get('labels', [])]
+
+    @staticmethod
+    def _add_rollups(totals: Dict, document: Dict, detections: Optional[List[Dict]]):
+        """Cumuler les compteurs d'un document dans totals ({(granularité, période, caméra, compteur): valeur})"""
+        increments = detection_rollups.rollup_increments(document, detections)
+        for granularity, period, camera_id in detection_rollups.rollup_buckets(document):
+            period = _timestamp_key(period)
+            for counter, value in increments.items():
+                totals[(granularity, period, camera_id, counter)] += value
+
+    @staticmethod
+    def _rollup_rows(totals: Dict):
+        return [key + (value,) for key, value in totals.items()]
+
+    # ------------------------------------------------------------------
+    # Écriture
+    # ------------------------------------------------------------------
+    def build_image_document(self,
+                             detections: List[Dict],
+                             image_filename: Optional[str] = None,
+                             image_size: Optional[Dict] = None,
+                             metadata: Optional[Dict] = None,
+                             document_id: Optional[str] = None,
+                             media_hash: Optional[str] = None,
+                             detected_at: Optional[datetime] = None) -> Dict:
+        document = detection_schema.build_image_document(detections, image_filename, image_size, metadata, media_hash,
+                                                         detected_at)
+        document['_id'] = document_id or str(ObjectId())
+        return document
+
+    def insert_image_documents(self, documents: List[Dict]) -> int:
+        """Insérer des documents image, une transaction par lot (ID et empreintes existants ignorés)"""
+        inserted = 0
+        for start in range(0, len(documents), self.batch_size):
+            batch = documents[start:start + self.batch_size]
+            with self._transaction() as conn:
+                # Une insertion par document : seuls les documents réellement insérés (pas les
+                # rejeux) sont comptés dans les statistiques
+                written = [document for document in batch
+                           if conn.execute('INSERT OR IGNORE ' + HEADER_INSERT, self._header_row(document)).rowcount]
+                conn.executemany(
+                    'INSERT OR IGNORE INTO detection_labels VALUES (?, ?, ?)',
+                    [row for document in written for row in self._label_rows(document)]
+                )
+                totals = defaultdict(int)
+                for document in written:
+                    self._add_rollups(totals, document, document['detections'])
+                conn.executemany(ROLLUP_UPSERT, self._rollup_rows(totals))
+            inserted += len(written)
+        return inserted
+
+    def write_video_detection(self,
+                              frames: List[Dict],
+                              video_filename: Optional[str] = None,
+                              video_info: Optional[Dict] = None,
+                              metadata: Optional[Dict] = None,
+                              run_id: Optional[str] = None,
+                              media_hash: Optional[str] = None,
+                              detected_at: Optional[datetime] = None) -> str:
+        """
+        Écrire un run vidéo dans une seule transaction (en-tête, détections, tracks)
+
+        La transaction rend l'écriture atomique : un run déjà présent est forcément
+        complet et n'est pas réécrit (rejeu idempotent avec run_id). Un run de même
+        empreinte media_hash est réutilisé tel quel. detected_at date l'en-tête.
+        """
+        run_id = str(run_id or ObjectId())
+        all_detections, frames_with_detections = detection_schema.flatten_video_frames(frames, run_id)
+        tracks = detection_schema.summarize_tracks(run_id, all_detections)
+        # Nombre réel de frames de la vidéo (en mode événements, seules les frames avec événement sont transmises)
+        total_frames = (video_info or {}).get('totalFrames') or len(frames)
+        header = detection_schema.build_video_header(
+            run_id, total_frames, frames_with_detections, all_detections, tracks,
+            video_filename, video_info, metadata, detected_at, media_hash
+        )
+        header['status'] = 'complete'
+
+        with self._transaction() as conn:
+            if conn.execute('SELECT 1 FROM detections WHERE id = ?', (run_id,)).fetchone():
+                return run_id
+            if media_hash is not None:
+                duplicate = conn.execute('SELECT id FROM detections WHERE content_hash = ?', (media_hash,)).fetchone()
+                if duplicate:
+                    logger.debug("Vidéo déjà enregistrée (SQLite, ID: %s)", duplicate[0])
+                    return duplicate[0]
+            conn.execute('INSERT ' + HEADER_INSERT, self._header_row(header))
+            conn.executemany('INSERT OR IGNORE INTO detection_labels VALUES (?, ?, ?)', self._label_rows(header))
+            for start in range(0, len(all_detections), self.batch_size):
+                conn.executemany(
+                    'INSERT INTO video_detections VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    [(run_id, det['frame_number'], det['frame_time'], det.get('trackId'),
+                      det.get('label'), det.get('alertLevel'), _dumps(det))
+                     for det in all_detections[start:start + self.batch_size]]
+                )
+            conn.executemany(
+                'INSERT OR REPLACE INTO video_tracks VALUES (?, ?, ?)',
+                [(run_id, track['track_id'], _dumps(track)) for track in tracks]
+            )
+            # Compteurs de l'en-tête (événements de track comptés une fois par track)
+            totals = defaultdict(int)
+            self._add_rollups(totals, header, None)
+            conn.executemany(ROLLUP_UPSERT, self._rollup_rows(totals))
+
+        logger.info("Vidéo sauvegardée (SQLite)", extra={
+            'run_id': run_id, 'detections': len(all_detections), 'tracks': len(tracks)
+        })
+        return run_id
+
+    def release_content_hash(self, document_id: str):
+        """Retirer l'empreinte d'un run (détections brutes expirées) pour permettre une nouvelle analyse"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE detections SET content_hash = NULL, document = json_remove(document, '$.content_hash') "
+                "WHERE id = ?",
+                (str(document_id),)
+            )
+
+    # ------------------------------------------------------------------
+    # Lecture
+    # ------------------------------------------------------------------
+    def get_recent_detections(self, limit: int = 100) -> List[Dict]:
+        if self.conn is None:
+            return []
+        conn = self._read_connection()
+        try:
+            rows = conn.execute(
+                'SELECT id, document FROM detections ORDER BY timestamp DESC, id DESC LIMIT ?', (limit,)
+            ).fetchall()
+            return [_load_document(row_id, raw) for row_id, raw in rows]
+        finally:
+            conn.close()
+
+    def _find_one(self, where: str, params) -> Optional[Dict]:
+        if self.conn is None:
+            return None
+        conn = self._read_connection()
+        try:
+            row = conn.execute(f'SELECT id, document FROM detections WHERE {where} LIMIT 1', params).fetchone()
+            return _load_document(*row) if row else None
+        finally:
+            conn.close()
+
+    def find_by_content_hash(self, media_hash: str) -> Optional[Dict]:
+        return self._find_one('content_hash = ?', (media_hash,))
+
+    def find_by_result_hash(self, result_hash: str, media_type: str = 'image',
+                            filename: Optional[str] = None) -> Optional[Dict]:
+        return self._find_one(
+            f"result_hash = ? AND media_type = ? AND json_extract(document, '$.{media_type}_filename') IS ?",
+            (result_hash, media_type, filename)
+        )
+
+    def get_video_detections(self, run_id, limit: int = 0) -> List[Dict]:
+        """Détections d'un run vidéo, triées par frame"""
+        if self.conn is None:
+            return []
+        conn = self._read_connection()
+        try:
+            sql = 'SELECT data FROM video_detections WHERE run_id = ? ORDER BY frame_number'
+            params = [str(run_id)]
+            if limit:
+                sql += ' LIMIT ?'
+                params.append(limit)
+            return [json.loads(raw) for (raw,) in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _where(filters: Dict):
+        """Filtres normalisés (detection_query.parse_filters) -> clause WHERE SQL"""
+        clauses, params = [], []
+        if 'media_type' in filters:
+            clauses.append('media_type = ?')
+            params.append(filters['media_type'])
+        if 'camera_id' in filters:
+            clauses.append('camera_id = ?')
+            params.append(filters['camera_id'])
+        if 'max_alert_level' in filters:
+            clauses.append('max_alert_level = ?')
+            params.append(filters['max_alert_level'])
+        elif 'min_alert_level' in filters:
+            clauses.append('max_alert_level >= ?')
+            params.append(filters['min_alert_level'])
+        if 'from' in filters:
+            clauses.append('timestamp >= ?')
+            params.append(_timestamp_key(filters['from']))
+        if 'to' in filters:
+            clauses.append('timestamp < ?')
+            params.append(_timestamp_key(filters['to']))
+        if 'label' in filters:
+            clauses.append('id IN (SELECT detection_id FROM detection_labels WHERE label = ?)')
+            params.append(filters['label'])
+        return clauses, params
+
+    def query_detections(self, filters: Dict, limit: int = detection_query.DEFAULT_PAGE_SIZE,
+                         cursor: Optional[str] = None, include_detections: bool = False) -> Dict:
+        """Requête paginée par curseur (timestamp, id), mêmes filtres que MongoDBService"""
+        if self.conn is None:
+            return {'items': [], 'nextCursor': None}
+
+        clauses, params = self._where(filters)
+        if cursor:
+            position = detection_query.decode_cursor(cursor)
+            timestamp = _timestamp_key(position['timestamp'])
+            clauses.append('(timestamp < ? OR (timestamp = ? AND id < ?))')
+            params += [timestamp, timestamp, str(position['_id'])]
+        sql = 'SELECT id, document FROM detections'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY timestamp DESC, id DESC LIMIT ?'
+        params.append(limit + 1)
+
+        fields = set(detection_query.SUMMARY_PROJECTION) | ({'detections'} if include_detections else set())
+        conn = self._read_connection()
+        try:
+            documents = []
+            for row_id, raw in conn.execute(sql, params):
+                document = _load_document(row_id, raw)
+                summary = {key: value for key, value in document.items() if key in fields or key == '_id'}
+                camera_id = (document.get('metadata') or {}).get('camera_id')
+                if camera_id is not None:
+                    summary['metadata'] = {'camera_id': camera_id}
+                documents.append(summary)
+        finally:
+            conn.close()
+
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = detection_query.encode_cursor(documents[-1])
+        return {'items': documents, 'nextCursor': next_cursor}
+
+    def iter_detection_rows(self, filters: Dict, batch_size: int = 1000):
+        """Lignes d'export (une par détection), lues par lots avec fetchmany"""
+        label = filters.get('label')
+        clauses, params = self._where(filters)
+        sql = 'SELECT id, document FROM detections'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY timestamp DESC, id DESC'
+
+        conn = self._read_connection()
+        try:
+            documents = conn.execute(sql, params)
+            while True:
+                batch = documents.fetchmany(batch_size)
+                if not batch:
+                    break
+                for row_id, raw in batch:
+                    document = _load_document(row_id, raw)
+                    if document.get('media_type') == 'video':
+                        det_sql = 'SELECT data FROM video_detections WHERE run_id = ?'
+                        det_params = [row_id]
+                        if label:
+                            det_sql += ' AND label = ?'
+                            det_params.append(label)
+                        det_cursor = conn.execute(det_sql + ' ORDER BY frame_number', det_params)
+                        detections = (json.loads(data) for (data,) in det_cursor)
+                    else:
+                        detections = document.get('detections', [])
+                    for det in detections:
+                        if label and det.get('label') != label:
+                            continue
+                        yield detection_row(document, det)
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Statistiques
+    # ------------------------------------------------------------------
+    def get_statistics(self, granularity: str = 'day', filters: Optional[Dict] = None) -> Dict:
+        """
+        Statistiques lues dans la table detection_rollups (même format que MongoDBService)
+
+        Args:
+            granularity: 'hour' ou 'day'
+            filters: Filtres normalisés ; seuls 'from', 'to' et 'camera_id' s'appliquent
+
+        Returns:
+            Totaux, compteurs par label / niveau d'alerte / type / caméra et série temporelle
+        """
+        if granularity not in detection_rollups.GRANULARITIES:
+            raise ValueError(f"Granularité inconnue: {granularity}")
+        if self.conn is None:
+            return detection_rollups.merge_rollups([], granularity)
+        filters = filters or {}
+        clauses, params = ['granularity = ?'], [granularity]
+        if 'camera_id' in filters:
+            clauses.append('camera_id = ?')
+            params.append(filters['camera_id'])
+        if 'from' in filters:
+            clauses.append('period >= ?')
+            params.append(_timestamp_key(detection_rollups.bucket_start(filters['from'], granularity)))
+        if 'to' in filters:
+            clauses.append('period < ?')
+            params.append(_timestamp_key(filters['to']))
+
+        conn = self._read_connection()
+        try:
+            buckets = {}
+            sql = 'SELECT period, camera_id, counter, value FROM detection_rollups WHERE ' + ' AND '.join(clauses)
+            for period, camera_id, counter, value in conn.execute(sql, params):
+                buckets.setdefault((period, camera_id), {})[counter] = value
+        finally:
+            conn.close()
+        return detection_rollups.merge_rollups(
+            (detection_rollups.rollup_from_counters(granularity, datetime.fromisoformat(period), camera_id, counters)
+             for (period, camera_id), counters in buckets.items()),
+            granularity
+        )
+
+    def _accumulate_rollups(self, conn: sqlite3.Connection, totals: Dict, after_rowid: int):
+        """Cumuler les rollups des documents de rowid > after_rowid ; retourne (documents, dernier rowid)"""
+        processed, last_rowid = 0, after_rowid
+        cursor = conn.execute(
+            'SELECT rowid, id, document FROM detections WHERE rowid > ? ORDER BY rowid', (after_rowid,)
+        )
+        for rowid, row_id, raw in cursor:
+            document = _load_document(row_id, raw)
+            # En-tête vidéo : ses compteurs (valables même si les détections brutes ont expiré)
+            detections = None if 'label_counts' in document else document.get('detections', [])
+            self._add_rollups(totals, document, detections)
+            processed += 1
+            last_rowid = rowid
+        return processed, last_rowid
+
+    def rebuild_rollups(self) -> int:
+        """
+        Reconstruire la table detection_rollups depuis les documents existants
+
+        Le parcours se fait sur une connexion de lecture (instantané WAL), sans bloquer les
+        écritures. La transaction finale, courte, ajoute les documents écrits depuis (rowid
+        supérieur, les runs n'étant jamais supprimés ni réécrits) et remplace la table d'un
+        coup : chaque document est compté une fois. Les compteurs sont cumulés en mémoire
+        par intervalle et par caméra, pas par document. Appelé en arrière-plan par
+        start_rollup_rebuild.
+
+        Returns:
+            Nombre de documents agrégés
+        """
+        totals = defaultdict(int)
+        conn = self._read_connection()
+        try:
+            processed, last_rowid = self._accumulate_rollups(conn, totals, 0)
+        finally:
+            conn.close()
+        with self._transaction() as conn:
+            written, _ = self._accumulate_rollups(conn, totals, last_rowid)
+            conn.execute('DELETE FROM detection_rollups')
+            conn.executemany(ROLLUP_UPSERT, self._rollup_rows(totals))
+        processed += written
+        logger.info("Rollups reconstruits (SQLite)", extra={'documents': processed})
+        return processed
+
+    # ------------------------------------------------------------------
+    # Connexion
+    # ------------------------------------------------------------------
+    def reconnect(self) -> bool:
+        if self.conn is None:
+            self._connect()
+        return self.conn is not None
+
+    def is_connected(self) -> bool:
+        return self.conn is not None
+
+    def health(self) -> Dict:
+        return {
+            'connected': self.is_connected(),
+            'backend': self.name,
+            'path': str(self.path)
+        }
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+                self.collection = None
+                print("✅ Base SQLite fermée")
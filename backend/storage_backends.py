@@ -0,0 +1,283 @@
+"""
+Interface commune des backends de stockage des détections
+
+Deux implémentations, choisies par la variable STORAGE_BACKEND :
+- 'mongodb' : MongoDBService (serveur MongoDB, défaut)
+- 'sqlite'  : SQLiteService (fichier local, pour les postes en bord de piste
+              sans serveur MongoDB, ou pour les tests sans service externe)
+
+Les endpoints et la file d'écriture différée n'utilisent que les méthodes
+définies ici.
+"""
+import os
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List, Optional
+
+try:
+    from structured_logging import get_logger
+except ImportError:
+    from backend.structured_logging import get_logger
+
+logger = get_logger('storage')
+
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'mongodb').lower()
+# Jeton exigé par POST /api/stats/rebuild (en-tête X-Rebuild-Token) ; vide = endpoint désactivé
+STATS_REBUILD_TOKEN = os.getenv('STATS_REBUILD_TOKEN', '')
+REBUILD_TOKEN_HEADER = 'X-Rebuild-Token'
+
+# Démarrage des reconstructions de rollups (une seule à la fois par backend)
+_rebuild_lock = threading.Lock()
+
+
+def rebuild_allowed(value: Optional[str]) -> bool:
+    """
+    Vérifier le jeton d'une demande de reconstruction des rollups
+
+    Args:
+        value: Valeur de l'en-tête X-Rebuild-Token
+
+    Returns:
+        True si STATS_REBUILD_TOKEN est défini et que la valeur lui correspond
+    """
+    return bool(STATS_REBUILD_TOKEN) and value == STATS_REBUILD_TOKEN
+
+
+class StorageBackend(ABC):
+    """Opérations de stockage attendues par l'application"""
+
+    name = 'base'
+
+    # None tant que le stockage est indisponible (les appelants testent `collection is None`)
+    collection = None
+
+    # ------------------------------------------------------------------
+    # Écriture
+    # ------------------------------------------------------------------
+    @abstractmethod
+    def build_image_document(self,
+                             detections: List[Dict],
+                             image_filename: Optional[str] = None,
+                             image_size: Optional[Dict] = None,
+                             metadata: Optional[Dict] = None,
+                             document_id: Optional[str] = None,
+                             media_hash: Optional[str] = None,
+                             detected_at: Optional[datetime] = None) -> Dict:
+        """Construire le document d'une image (sans l'écrire)"""
+
+    @abstractmethod
+    def insert_image_documents(self, documents: List[Dict]) -> int:
+        """Écrire des documents image par lots ; les ID et empreintes déjà présents sont ignorés"""
+
+    @abstractmethod
+    def write_video_detection(self,
+                              frames: List[Dict],
+                              video_filename: Optional[str] = None,
+                              video_info: Optional[Dict] = None,
+                              metadata: Optional[Dict] = None,
+                              run_id: Optional[str] = None,
+                              media_hash: Optional[str] = None,
+                              detected_at: Optional[datetime] = None) -> str:
+        """
+        Écrire un run vidéo (idempotent avec run_id) ; lève une exception en cas d'échec
+
+        Si un run complet porte déjà la même empreinte media_hash, son ID est retourné.
+        detected_at (heure de l'analyse, défaut : maintenant) date l'en-tête et les détections.
+        """
+
+    def save_image_detection(self,
+                             detections: List[Dict],
+                             image_filename: Optional[str] = None,
+                             image_size: Optional[Dict] = None,
+                             metadata: Optional[Dict] = None,
+                             document_id: Optional[str] = None,
+                             media_hash: Optional[str] = None,
+                             detected_at: Optional[datetime] = None) -> Optional[str]:
+        """Sauvegarder une image ; retourne l'ID (celui du document existant si l'empreinte est connue) ou None si erreur"""
+        if self.collection is None:
+            logger.warning("Stockage %s indisponible - détections non sauvegardées", self.name)
+            return None
+        try:
+            document = self.build_image_document(detections, image_filename, image_size, metadata, document_id, media_hash,
+                                                 detected_at)
+            if not self.insert_image_documents([document]) and media_hash is not None:
+                existing = self.find_by_content_hash(media_hash)
+                if existing is not None:
+                    logger.debug("Média déjà enregistré (%s, ID: %s)", self.name, existing['_id'])
+                    return str(existing['_id'])
+            logger.debug("%d détections sauvegardées (%s, ID: %s)", document['detection_count'], self.name, document['_id'])
+            return str(document['_id'])
+        except Exception as e:
+            logger.exception("Erreur lors de la sauvegarde (%s): %s", self.name, e)
+            return None
+
+    def save_video_detection(self,
+                             frames: List[Dict],
+                             video_filename: Optional[str] = None,
+                             video_info: Optional[Dict] = None,
+                             metadata: Optional[Dict] = None,
+                             run_id: Optional[str] = None,
+                             media_hash: Optional[str] = None,
+                             detected_at: Optional[datetime] = None) -> Optional[str]:
+        """Sauvegarder un run vidéo ; retourne l'ID ou None si erreur"""
+        if self.collection is None:
+            logger.warning("Stockage %s indisponible - détections non sauvegardées", self.name)
+            return None
+        try:
+            return self.write_video_detection(frames, video_filename, video_info, metadata, run_id, media_hash, detected_at)
+        except Exception as e:
+            logger.exception("Erreur lors de la sauvegarde (%s): %s", self.name, e)
+            return None
+
+    # ------------------------------------------------------------------
+    # Lecture
+    # ------------------------------------------------------------------
+    @abstractmethod
+    def get_recent_detections(self, limit: int = 100) -> List[Dict]:
+        """Documents les plus récents"""
+
+    def find_by_content_hash(self, media_hash: str) -> Optional[Dict]:
+        """Document (image ou en-tête vidéo complet) portant cette empreinte de média, ou None"""
+        return None
+
+    def find_by_result_hash(self, result_hash: str, media_type: str = 'image',
+                            filename: Optional[str] = None) -> Optional[Dict]:
+        """Document de même type et même fichier aux détections identiques (voir detection_schema.result_hash), ou None"""
+        return None
+
+    def release_content_hash(self, document_id: str):
+        """Retirer l'empreinte d'un document (run vidéo dont les détections brutes ont expiré)"""
+
+    def query_detections(self, filters: Dict, limit: int = 50, cursor: Optional[str] = None,
+                         include_detections: bool = False) -> Dict:
+        """Requête paginée par curseur (voir detection_query)"""
+        raise NotImplementedError(f"Requêtes non supportées par le backend {self.name}")
+
+    def iter_detection_rows(self, filters: Dict, batch_size: int = 1000):
+        """Générateur des lignes d'export (une par détection)"""
+        raise NotImplementedError(f"Export non supporté par le backend {self.name}")
+
+    def get_statistics(self, granularity: str = 'day', filters: Optional[Dict] = None) -> Dict:
+        """Statistiques agrégées (voir detection_rollups)"""
+        raise NotImplementedError(f"Statistiques non supportées par le backend {self.name}")
+
+    def rebuild_rollups(self) -> int:
+        """Reconstruire les agrégats depuis l'historique (sans bloquer les écritures) ; retourne le nombre de documents"""
+        raise NotImplementedError(f"Statistiques non supportées par le backend {self.name}")
+
+    def start_rollup_rebuild(self) -> Dict:
+        """
+        Lancer rebuild_rollups dans un thread d'arrière-plan (sans effet si une reconstruction est en cours)
+
+        Returns:
+            État de la reconstruction (voir rollup_rebuild_status)
+
+        Raises:
+            NotImplementedError: si le backend ne sait pas reconstruire les rollups
+        """
+        if type(self).rebuild_rollups is StorageBackend.rebuild_rollups:
+            raise NotImplementedError(f"Statistiques non supportées par le backend {self.name}")
+        with _rebuild_lock:
+            status = self.rollup_rebuild_status()
+            if status['state'] == 'running':
+                return status
+            self._rollup_rebuild = {
+                'state': 'running', 'started_at': datetime.utcnow().isoformat(),
+                'finished_at': None, 'documents': None, 'error': None
+            }
+        threading.Thread(target=self._run_rollup_rebuild, name='rollup-rebuild', daemon=True).start()
+        return self.rollup_rebuild_status()
+
+    def _run_rollup_rebuild(self):
+        try:
+            documents = self.rebuild_rollups()
+            result = {'state': 'done', 'documents': documents}
+        except Exception as e:
+            logger.exception("Reconstruction des rollups échouée (%s): %s", self.name, e)
+            result = {'state': 'failed', 'error': f"{type(e).__name__}: {e}"}
+        with _rebuild_lock:
+            self._rollup_rebuild.update(result, finished_at=datetime.utcnow().isoformat())
+
+    def rollup_rebuild_status(self) -> Dict:
+        """État de la dernière reconstruction : state ('idle', 'running', 'done', 'failed'), dates, documents, erreur"""
+        return dict(getattr(self, '_rollup_rebuild', None) or {'state': 'idle'})
+
+    def export_to_csv(self, detections: List[Dict]) -> str:
+        """
+        Exporter les détections en format CSV
+
+        Args:
+            detections: Liste des détections
+
+        Returns:
+            Contenu CSV en string
+        """
+        import csv
+        import io
+
+        output = io.StringIO()
+        writer = csv.writer(output)
+
+        # En-têtes
+        writer.writerow([
+            'ID', 'Label', 'Confidence', 'Risk Level', 'Alert Level',
+            'Size (cm)', 'Size (m)', 'Position', 'BBox X (%)', 'BBox Y (%)',
+            'BBox Width (%)', 'BBox Height (%)'
+        ])
+
+        # Données
+        for det in detections:
+            writer.writerow([
+                det.get('id', ''),
+                det.get('label', ''),
+                f"{det.get('confidence', 0):.3f}",
+                det.get('riskLevel', ''),
+                det.get('alertLevel', ''),
+                det.get('sizeCm', ''),
+                det.get('sizeMeters', ''),
+                det.get('position', ''),
+                f"{det.get('bbox', {}).get('x', 0):.2f}",
+                f"{det.get('bbox', {}).get('y', 0):.2f}",
+                f"{det.get('bbox', {}).get('width', 0):.2f}",
+                f"{det.get('bbox', {}).get('height', 0):.2f}"
+            ])
+
+        return output.getvalue()
+
+    # ------------------------------------------------------------------
+    # Connexion
+    # ------------------------------------------------------------------
+    @abstractmethod
+    def reconnect(self) -> bool:
+        """Tenter de rétablir l'accès au stockage"""
+
+    @abstractmethod
+    def is_connected(self) -> bool:
+        """Stockage utilisable"""
+
+    @abstractmethod
+    def health(self) -> Dict:
+        """État de santé (pour /api/health)"""
+
+    @abstractmethod
+    def close(self):
+        """Libérer les connexions"""
+
+
+def create_storage_backend(name: str = STORAGE_BACKEND) -> StorageBackend:
+    """Instancier le backend configuré ('mongodb' ou 'sqlite')"""
+    if name == 'sqlite':
+        try:
+            from sqlite_service import SQLiteService
+        except ImportError:
+            from backend.sqlite_service import SQLiteService
+        return SQLiteService()
+
+    if name != 'mongodb':
+        logger.warning("STORAGE_BACKEND inconnu '%s', utilisation de MongoDB", name)
+    try:
+        from mongodb_service import mongodb_service
+    except ImportError:
+        from backend.mongodb_service import mongodb_service
+    return mongodb_service
@@ -0,0 +1,169 @@
+"""
+Journalisation structurée et non bloquante
+
+- les appels logger.* ne font que filtrer par niveau et déposer l'enregistrement
+  dans une file bornée (QueueHandler) ; le formatage et l'écriture sur stdout se
+  font dans un thread dédié (QueueListener). Si la file est pleine, l'enregistrement
+  est abandonné et compté plutôt que de bloquer la requête.
+- sortie JSON (une ligne par événement) ou texte lisible (LOG_FORMAT=text)
+- identifiant de corrélation par requête (en-tête X-Request-ID, ou généré) ajouté
+  à chaque ligne émise pendant la requête
+- les messages utilisent le formatage paresseux de logging
+  (`logger.debug('%d boxes', n)`) : rien n'est formaté si le niveau est désactivé
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+ROOT_LOGGER_NAME = 'fod'
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# Attributs standard d'un LogRecord : tout le reste vient de `extra=` et est sérialisé
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+def _exception_text(formatter: logging.Formatter, record: logging.LogRecord) -> Optional[str]:
+    """Trace d'exception (déjà mise en texte par NonBlockingQueueHandler, ou à formater)"""
+    if record.exc_info:
+        return formatter.formatException(record.exc_info)
+    return record.exc_text
+
+
+class RequestIdFilter(logging.Filter):
+    """Ajoute l'identifiant de corrélation de la requête courante à l'enregistrement"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par événement (horodatage UTC, niveau, logger, message, requête, champs extra)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        entry.update(_extra_fields(record))
+        exc_text = _exception_text(self, record)
+        if exc_text:
+            entry['exc'] = exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Format lisible pour le développement : heure, niveau, [requête], message, clé=valeur"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} "
+        if getattr(record, 'request_id', None):
+            line += f"[{record.request_id}] "
+        line += record.getMessage()
+        fields = _extra_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        exc_text = _exception_text(self, record)
+        if exc_text:
+            line += '\n' + exc_text
+        return line
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler qui abandonne (et compte) les enregistrements quand la file est pleine"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Figer le message et la trace dans le thread appelant (les arguments peuvent changer),
+        # le formatage JSON / texte reste dans le thread d'écriture
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_setup_lock = threading.Lock()
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT) -> logging.Logger:
+    """
+    Configurer le logger racine de l'application (idempotent)
+
+    Args:
+        level: Niveau minimal (DEBUG, INFO, WARNING...)
+        log_format: 'json' ou 'text'
+
+    Returns:
+        Logger racine 'fod'
+    """
+    global _queue_handler, _listener
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    with _setup_lock:
+        if _queue_handler is not None:
+            return root
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(TextFormatter() if log_format == 'text' else JsonFormatter())
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _queue_handler = NonBlockingQueueHandler(log_queue)
+        _queue_handler.addFilter(RequestIdFilter())
+        _listener = QueueListener(log_queue, stream_handler, respect_handler_level=False)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        root.setLevel(getattr(logging, level, logging.INFO))
+        root.addHandler(_queue_handler)
+        root.propagate = False
+    return root
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger enfant de 'fod' (configure la journalisation au premier appel)"""
+    setup_logging()
+    return logging.getLogger(f'{ROOT_LOGGER_NAME}.{name}')
+
+
+def dropped_records() -> int:
+    """Nombre d'enregistrements abandonnés faute de place dans la file"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
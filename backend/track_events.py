@@ -0,0 +1,220 @@
+"""
+Agrégation des détections vidéo en événements de cycle de vie des tracks
+
+Au lieu d'une détection par track et par frame traitée (un boulon immobile pendant
+une minute = des centaines d'enregistrements identiques), chaque track produit :
+- 'appeared' à sa première observation
+- 'escalated' à chaque hausse du niveau d'alerte
+- 'disappeared' quand il n'est plus observé depuis TRACK_EVENT_LOST_SECONDS (ou en fin de vidéo)
+
+Chaque événement a la forme d'une détection (label, confidence, bbox, alertLevel...,
+stockable telle quelle) et porte en plus la meilleure frame (confiance maximale, avec
+vignette optionnelle), la synthèse de la trajectoire et la taille / l'alerte maximales.
+"""
+import math
+import os
+from typing import Callable, Dict, List, Optional
+
+TRACK_EVENT_LOST_SECONDS = float(os.getenv('TRACK_EVENT_LOST_SECONDS', '2.0'))
+TRACK_TRAJECTORY_POINTS = int(os.getenv('TRACK_TRAJECTORY_POINTS', '20'))
+# Côté du plus grand bord de la vignette JPEG de la meilleure frame (0 = pas de vignette)
+TRACK_THUMBNAIL_SIZE = int(os.getenv('TRACK_THUMBNAIL_SIZE', '96'))
+# Ce qui est enregistré pour une vidéo : 'events' (un enregistrement par événement) ou 'frames' (par frame)
+VIDEO_PERSIST_MODE = os.getenv('VIDEO_PERSIST_MODE', 'events')
+
+# Champs de détection repris de l'observation de confiance maximale
+_BEST_FIELDS = ('label', 'confidence', 'position', 'bbox')
+# Champs repris de l'observation de niveau d'alerte maximal
+_ALERT_FIELDS = ('riskLevel', 'alertType')
+
+
+def _center(bbox: Dict) -> Optional[tuple]:
+    """Centre d'une bbox en pourcentages (None si incomplète)"""
+    try:
+        return bbox['x'] + bbox['width'] / 2, bbox['y'] + bbox['height'] / 2
+    except (KeyError, TypeError):
+        return None
+
+
+def _downsample(points: List, limit: int) -> List:
+    """Au plus `limit` points répartis régulièrement, premier et dernier inclus"""
+    if limit < 2 or len(points) <= limit:
+        return list(points)
+    step = (len(points) - 1) / (limit - 1)
+    return [points[round(i * step)] for i in range(limit)]
+
+
+class _TrackState:
+    __slots__ = ('key', 'track_id', 'first_frame', 'first_time', 'last_frame', 'last_time', 'observations',
+                 'best', 'best_frame', 'best_time', 'thumbnail', 'alert', 'max_alert', 'max_size_meters',
+                 'max_size_cm', 'points', 'path_length', 'extent')
+
+    def __init__(self, key, track_id, frame_index: int, frame_time: float):
+        self.key = key
+        self.track_id = track_id
+        self.first_frame = self.last_frame = frame_index
+        self.first_time = self.last_time = frame_time
+        self.observations = 0
+        self.best = None
+        self.best_frame = frame_index
+        self.best_time = frame_time
+        self.thumbnail = None
+        self.alert = None
+        self.max_alert = 0
+        self.max_size_meters = 0.0
+        self.max_size_cm = 0.0
+        self.points = []
+        self.path_length = 0.0
+        self.extent = None
+
+
+class TrackEventAggregator:
+    """Transforme la sortie du tracker, frame par frame, en événements par track"""
+
+    def __init__(self, lost_seconds: float = TRACK_EVENT_LOST_SECONDS,
+                 thumbnail_fn: Optional[Callable] = None,
+                 trajectory_points: int = TRACK_TRAJECTORY_POINTS):
+        """
+        Args:
+            lost_seconds: Absence (temps vidéo) au-delà de laquelle un track est déclaré disparu
+            thumbnail_fn: fn(frame, détection) -> vignette (str base64) de la meilleure frame, optionnelle
+            trajectory_points: Nombre maximal de points de trajectoire conservés par événement
+        """
+        self.lost_seconds = lost_seconds
+        self.thumbnail_fn = thumbnail_fn
+        self.trajectory_points = trajectory_points
+        self._tracks = {}
+        self.events = []
+        self.track_count = 0
+
+    def update(self, frame_index: int, frame_time: float, detections: List[Dict], frame=None) -> List[Dict]:
+        """
+        Intégrer les détections d'une frame traitée
+
+        Args:
+            frame_index: Numéro de la frame (base 0)
+            frame_time: Temps de la frame en secondes
+            detections: Détections de la frame (avec trackId si le tracking est actif)
+            frame: Image de la frame, transmise à thumbnail_fn (optionnelle)
+
+        Returns:
+            Événements émis par cette frame (également ajoutés à self.events)
+        """
+        emitted = []
+        for det in detections:
+            track_id = det.get('trackId')
+            # Sans tracking, la classe sert de clé (comme pour les alertes des flux caméra)
+            key = track_id if track_id is not None else f"label:{det.get('label')}"
+            state = self._tracks.get(key)
+            is_new = state is None
+            if is_new:
+                state = self._tracks[key] = _TrackState(key, track_id, frame_index, frame_time)
+                self.track_count += 1
+            level = det.get('alertLevel', 1) or 1
+            escalated = not is_new and level > state.max_alert
+            self._observe(state, det, level, frame_index, frame_time, frame)
+            if is_new:
+                emitted.append(self._event(state, 'appeared', frame_index, frame_time, level))
+            elif escalated:
+                emitted.append(self._event(state, 'escalated', frame_index, frame_time, level))
+
+        for key in [key for key, state in self._tracks.items() if frame_time - state.last_time > self.lost_seconds]:
+            state = self._tracks.pop(key)
+            emitted.append(self._event(state, 'disappeared', state.last_frame, state.last_time, state.max_alert))
+
+        self.events.extend(emitted)
+        return emitted
+
+    def finish(self) -> List[Dict]:
+        """Clore les tracks encore actifs (fin de vidéo) ; retourne tous les événements"""
+        for state in self._tracks.values():
+            self.events.append(self._event(state, 'disappeared', state.last_frame, state.last_time, state.max_alert))
+        self._tracks = {}
+        self.events.sort(key=lambda event: event['frame'])
+        return self.events
+
+    def _observe(self, state: _TrackState, det: Dict, level: int, frame_index: int, frame_time: float, frame):
+        state.last_frame = frame_index
+        state.last_time = frame_time
+        state.observations += 1
+        if level > state.max_alert:
+            state.max_alert = level
+            state.alert = det
+        state.max_size_meters = max(state.max_size_meters, det.get('sizeMeters') or 0.0)
+        state.max_size_cm = max(state.max_size_cm, det.get('sizeCm') or 0.0)
+
+        confidence = det.get('confidence') or 0.0
+        if state.best is None or confidence > (state.best.get('confidence') or 0.0):
+            state.best = det
+            state.best_frame = frame_index
+            state.best_time = frame_time
+            if frame is not None and self.thumbnail_fn is not None:
+                state.thumbnail = self.thumbnail_fn(frame, det)
+
+        bbox = det.get('bbox')
+        center = _center(bbox)
+        if center is None:
+            return
+        if state.points:
+            _, _, previous_x, previous_y = state.points[-1]
+            state.path_length += math.hypot(center[0] - previous_x, center[1] - previous_y)
+        state.points.append((frame_index, round(frame_time, 3), center[0], center[1]))
+        x2, y2 = bbox['x'] + bbox['width'], bbox['y'] + bbox['height']
+        if state.extent is None:
+            state.extent = [bbox['x'], bbox['y'], x2, y2]
+        else:
+            extent = state.extent
+            extent[0], extent[1] = min(extent[0], bbox['x']), min(extent[1], bbox['y'])
+            extent[2], extent[3] = max(extent[2], x2), max(extent[3], y2)
+
+    def _trajectory(self, state: _TrackState) -> Optional[Dict]:
+        if not state.points:
+            return None
+        start, end = state.points[0], state.points[-1]
+        x1, y1, x2, y2 = state.extent
+        return {
+            'start': {'frame': start[0], 'x': start[2], 'y': start[3]},
+            'end': {'frame': end[0], 'x': end[2], 'y': end[3]},
+            'extent': {'x': x1, 'y': y1, 'width': x2 - x1, 'height': y2 - y1},
+            'pathLength': round(state.path_length, 3),
+            'displacement': round(math.hypot(end[2] - start[2], end[3] - start[3]), 3),
+            'points': [{'frame': frame, 'time': time, 'x': round(x, 3), 'y': round(y, 3)}
+                       for frame, time, x, y in _downsample(state.points, self.trajectory_points)]
+        }
+
+    def _event(self, state: _TrackState, kind: str, frame_index: int, frame_time: float, level: int) -> Dict:
+        """Instantané du track au format d'une détection, enrichi du cycle de vie"""
+        event = {
+            'id': f"track_{state.track_id}" if state.track_id is not None else str(state.key),
+            'event': kind,
+            'trackId': state.track_id,
+            'frame': frame_index,
+            'time': frame_time,
+            'alertLevel': level,
+            'maxAlertLevel': state.max_alert,
+            'sizeMeters': state.max_size_meters,
+            'sizeCm': state.max_size_cm,
+            'firstFrame': state.first_frame,
+            'firstTime': state.first_time,
+            'lastFrame': state.last_frame,
+            'lastTime': state.last_time,
+            'observations': state.observations,
+            'bestFrame': {'frame': state.best_frame, 'time': state.best_time, 'thumbnail': state.thumbnail},
+            'trajectory': self._trajectory(state)
+        }
+        for field in _BEST_FIELDS:
+            event[field] = state.best.get(field)
+        for field in _ALERT_FIELDS:
+            event[field] = state.alert.get(field)
+        return event
+
+
+def event_frames(events: List[Dict]) -> List[Dict]:
+    """Événements au format frames ({'frame', 'time', 'detections'}) attendu par les backends de stockage"""
+    frames = {}
+    for event in events:
+        frame = frames.setdefault(event['frame'], {'frame': event['frame'], 'time': event['time'], 'detections': []})
+        frame['detections'].append(event)
+    for frame in frames.values():
+        frame['count'] = len(frame['detections'])
+    return [frames[index] for index in sorted(frames)]
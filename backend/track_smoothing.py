@@ -0,0 +1,203 @@
+"""
+Lissage des bounding boxes par track (repli quand supervision n'est pas disponible)
+
+L'état de tous les tracks tient dans des tableaux NumPy préalloués (une ligne par
+track, agrandis par doublement) ; un dict ne sert qu'à associer trackId -> ligne.
+Une frame se traite en un seul appel (update_batch) :
+- lissage exponentiel (mode 'ema') ou filtre de Kalman à vitesse constante
+  (mode 'kalman') appliqué à toutes les boxes de la frame en opérations vectorisées
+- expiration des tracks non vus depuis max_age frames par un masque, à chaque frame
+  (les lignes libérées sont réutilisées)
+
+Les boxes sont en pourcentages de l'image : {'x', 'y', 'width', 'height'}.
+"""
+import os
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+BBOX_SMOOTHING = os.getenv('BBOX_SMOOTHING', 'ema')  # 'ema' ou 'kalman'
+# Bruits du filtre de Kalman (unités : pourcentage de l'image, par frame)
+BBOX_KALMAN_PROCESS_NOISE = float(os.getenv('BBOX_KALMAN_PROCESS_NOISE', '0.05'))
+BBOX_KALMAN_MEASUREMENT_NOISE = float(os.getenv('BBOX_KALMAN_MEASUREMENT_NOISE', '0.5'))
+
+_BBOX_KEYS = ('x', 'y', 'width', 'height')
+_INITIAL_CAPACITY = 64
+# Kalman : état [cx, cy, w, h, vx, vy, vw, vh], mesure [cx, cy, w, h]
+_H = np.hstack([np.eye(4), np.zeros((4, 4))])
+
+
+def _to_center(boxes: np.ndarray) -> np.ndarray:
+    """(x, y, w, h) coin haut-gauche -> (cx, cy, w, h)"""
+    centers = boxes.copy()
+    centers[:, :2] += boxes[:, 2:] / 2
+    return centers
+
+
+def _to_corner(centers: np.ndarray) -> np.ndarray:
+    boxes = centers.copy()
+    boxes[:, :2] -= centers[:, 2:] / 2
+    return boxes
+
+
+class BBoxSmoother:
+    """
+    Smoother pour réduire le jitter des bounding boxes avec tracking
+    (état en tableaux NumPy, mises à jour vectorisées par frame)
+    """
+
+    def __init__(self, alpha: float = 0.7, max_age: int = 5, mode: str = BBOX_SMOOTHING,
+                 process_noise: float = BBOX_KALMAN_PROCESS_NOISE,
+                 measurement_noise: float = BBOX_KALMAN_MEASUREMENT_NOISE):
+        """
+        Args:
+            alpha: Facteur de lissage exponentiel (0-1), plus proche de 1 = moins de lissage
+            max_age: Nombre de frames sans détection avant suppression du track
+            mode: 'ema' (lissage exponentiel) ou 'kalman' (vitesse constante)
+            process_noise: Variance du bruit de modèle (Kalman)
+            measurement_noise: Variance du bruit de mesure (Kalman)
+        """
+        if mode not in ('ema', 'kalman'):
+            raise ValueError(f"Mode de lissage inconnu: {mode}")
+        self.alpha = alpha
+        self.max_age = max_age
+        self.mode = mode
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self._rows = {}  # {track_id: ligne}
+        self._free = []
+        self._allocate(_INITIAL_CAPACITY)
+
+    def _allocate(self, capacity: int):
+        """Préallouer (ou agrandir en conservant le contenu) les tableaux d'état"""
+        previous = getattr(self, '_capacity', 0)
+        boxes = np.zeros((capacity, 4))
+        last_frame = np.zeros(capacity, dtype=np.int64)
+        active = np.zeros(capacity, dtype=bool)
+        ids = np.zeros(capacity, dtype=object)
+        if previous:
+            boxes[:previous] = self._boxes
+            last_frame[:previous] = self._last_frame
+            active[:previous] = self._active
+            ids[:previous] = self._ids
+        self._boxes, self._last_frame, self._active, self._ids = boxes, last_frame, active, ids
+        if self.mode == 'kalman':
+            state = np.zeros((capacity, 8))
+            covariance = np.zeros((capacity, 8, 8))
+            if previous:
+                state[:previous] = self._state
+                covariance[:previous] = self._covariance
+            self._state, self._covariance = state, covariance
+        self._free.extend(range(capacity - 1, previous - 1, -1))
+        self._capacity = capacity
+
+    def _row_for(self, track_id) -> int:
+        row = self._rows.get(track_id)
+        if row is None:
+            if not self._free:
+                self._allocate(self._capacity * 2)
+            row = self._free.pop()
+            self._rows[track_id] = row
+            self._ids[row] = track_id
+        return row
+
+    def update_batch(self, track_ids: Sequence, boxes: np.ndarray, frame_number: int) -> np.ndarray:
+        """
+        Lisser toutes les boxes d'une frame en une passe
+
+        Args:
+            track_ids: IDs de tracking (un par box, distincts)
+            boxes: Tableau (N, 4) x, y, width, height en pourcentages
+            frame_number: Numéro de la frame
+
+        Returns:
+            Tableau (N, 4) des boxes lissées, dans le même ordre
+        """
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        self.cleanup(frame_number)
+        if len(boxes) == 0:
+            return boxes
+        known = np.array([track_id in self._rows for track_id in track_ids], dtype=bool)
+        rows = np.fromiter((self._row_for(track_id) for track_id in track_ids), dtype=np.int64, count=len(boxes))
+
+        if self.mode == 'kalman':
+            smoothed = self._kalman_update(rows, known, boxes, frame_number)
+        else:
+            smoothed = boxes.copy()
+            smoothed[known] = self.alpha * boxes[known] + (1 - self.alpha) * self._boxes[rows[known]]
+
+        self._boxes[rows] = smoothed
+        self._last_frame[rows] = frame_number
+        self._active[rows] = True
+        return smoothed
+
+    def _kalman_update(self, rows: np.ndarray, known: np.ndarray, boxes: np.ndarray, frame_number: int) -> np.ndarray:
+        measurements = _to_center(boxes)
+        new_rows = rows[~known]
+        if len(new_rows):
+            # Nouveau track : position mesurée, vitesse nulle mais incertaine
+            self._state[new_rows] = 0.0
+            self._state[new_rows, :4] = measurements[~known]
+            self._covariance[new_rows] = np.diag([self.measurement_noise] * 4 + [10.0 * self.measurement_noise] * 4)
+
+        tracked = rows[known]
+        if len(tracked):
+            # Prédiction avec l'intervalle propre à chaque track (frames sautées incluses)
+            dt = np.maximum(frame_number - self._last_frame[tracked], 1).astype(float)
+            transition = np.broadcast_to(np.eye(8), (len(tracked), 8, 8)).copy()
+            transition[:, np.arange(4), np.arange(4) + 4] = dt[:, None]
+            state = np.einsum('nij,nj->ni', transition, self._state[tracked])
+            covariance = transition @ self._covariance[tracked] @ transition.transpose(0, 2, 1)
+            covariance += np.eye(8) * self.process_noise * dt[:, None, None]
+
+            # Correction par la mesure
+            innovation = measurements[known] - state[:, :4]
+            innovation_cov = covariance[:, :4, :4] + np.eye(4) * self.measurement_noise
+            gain = covariance @ _H.T @ np.linalg.inv(innovation_cov)
+            state = state + np.einsum('nij,nj->ni', gain, innovation)
+            covariance = (np.eye(8) - gain @ _H) @ covariance
+            self._state[tracked] = state
+            self._covariance[tracked] = covariance
+
+        return _to_corner(self._state[rows, :4])
+
+    def update(self, track_id, bbox: Dict, frame_number: int) -> Dict:
+        """
+        Met à jour ou crée une track avec lissage (une seule box ; préférer update_batch)
+        bbox: {'x': float, 'y': float, 'width': float, 'height': float}
+        """
+        smoothed = self.update_batch([track_id], np.array([[bbox[key] for key in _BBOX_KEYS]]), frame_number)[0]
+        return dict(zip(_BBOX_KEYS, smoothed.tolist()))
+
+    def cleanup(self, current_frame: int) -> int:
+        """Supprime les tracks non vus depuis plus de max_age frames ; retourne leur nombre"""
+        expired = np.flatnonzero(self._active & (current_frame - self._last_frame > self.max_age))
+        if len(expired) == 0:
+            return 0
+        self._active[expired] = False
+        for row in expired.tolist():
+            del self._rows[self._ids[row]]
+            self._ids[row] = None
+        self._free.extend(expired.tolist())
+        return len(expired)
+
+    def get_active_tracks(self, current_frame: int) -> Dict:
+        """Retourne les tracks actives (non expirées) : {track_id: {'bbox', 'last_frame'}}"""
+        rows = np.flatnonzero(self._active & (current_frame - self._last_frame <= self.max_age))
+        return {
+            self._ids[row]: {'bbox': dict(zip(_BBOX_KEYS, self._boxes[row].tolist())), 'last_frame': int(self._last_frame[row])}
+            for row in rows.tolist()
+        }
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+def bbox_array(bboxes: List[Dict]) -> np.ndarray:
+    """Liste de bbox en pourcentages -> tableau (N, 4)"""
+    return np.array([[bbox[key] for key in _BBOX_KEYS] for bbox in bboxes], dtype=float).reshape(-1, 4)
+
+
+def bbox_dicts(boxes: np.ndarray) -> List[Dict]:
+    """Tableau (N, 4) -> liste de bbox en pourcentages"""
+    return [dict(zip(_BBOX_KEYS, row)) for row in boxes.tolist()]
@@ -0,0 +1,247 @@
+"""
+Décodage vidéo interchangeable : PyAV (FFmpeg) ou OpenCV
+
+Les deux lecteurs exposent la même interface, proche de cv2.VideoCapture
+(isOpened / grab / retrieve / read / release) avec en plus :
+- fps, frame_count et duration : avec PyAV, frame_count vient de l'en-tête du conteneur
+  ou d'un comptage des paquets (sans décodage), juste aussi pour les vidéos à fréquence
+  variable (CAP_PROP_FRAME_COUNT d'OpenCV est estimé à partir de la durée)
+- timestamp : temps de présentation (PTS) de la dernière frame lue, en secondes
+- width / height : taille des frames retournées (après mise à l'échelle éventuelle)
+- seek(secondes) : repositionnement sur la keyframe précédente
+
+Le lecteur PyAV décode sur plusieurs threads et fait la mise à l'échelle et la conversion
+(BGR ou niveaux de gris) dans la même passe swscale. grab() décode sans convertir : une
+frame sautée ne coûte que son décodage. Le mode keyframes_only ne décode que les
+images clés. OpenCV reste le repli si PyAV n'est pas installé (`pip install av`).
+"""
+import os
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+try:
+    from structured_logging import get_logger
+except ImportError:
+    from backend.structured_logging import get_logger
+
+try:
+    import av
+    PYAV_AVAILABLE = True
+except ImportError:
+    av = None
+    PYAV_AVAILABLE = False
+
+VIDEO_DECODER = os.getenv('VIDEO_DECODER', 'auto')  # 'auto' (PyAV si installé), 'pyav' ou 'opencv'
+VIDEO_DECODE_THREADS = int(os.getenv('VIDEO_DECODE_THREADS', '0'))  # 0 = choix de FFmpeg
+# Largeur des frames décodées (0 = résolution d'origine), hauteur proportionnelle
+VIDEO_DECODE_WIDTH = int(os.getenv('VIDEO_DECODE_WIDTH', '0'))
+
+logger = get_logger('video')
+
+
+def _output_size(width: int, height: int, output_width: int) -> Tuple[int, int]:
+    """Taille de sortie (largeur paire pour swscale), jamais agrandie"""
+    if not output_width or output_width >= width or width <= 0:
+        return width, height
+    scaled_height = max(2, round(height * output_width / width / 2) * 2)
+    return output_width - output_width % 2, scaled_height
+
+
+class OpenCVVideoReader:
+    """cv2.VideoCapture derrière l'interface commune"""
+
+    backend = 'opencv'
+
+    def __init__(self, source: str, output_width: int = 0, gray: bool = False, threads: int = 0, live: bool = False):
+        params = []
+        if threads and hasattr(cv2, 'CAP_PROP_N_THREADS'):
+            params = [cv2.CAP_PROP_N_THREADS, threads]
+        self._capture = cv2.VideoCapture(source, cv2.CAP_ANY, params) if params else cv2.VideoCapture(source)
+        if live:
+            # Ne pas laisser OpenCV accumuler des frames en avance (RTSP)
+            self._capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.gray = gray
+        self.fps = self._capture.get(cv2.CAP_PROP_FPS) or 0.0
+        # Estimation (durée x fps) : approximative pour les vidéos à fréquence variable
+        self.frame_count = max(0, int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT)))
+        self.duration = self.frame_count / self.fps if self.fps > 0 else 0.0
+        self.source_width = int(self._capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.source_height = int(self._capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.width, self.height = _output_size(self.source_width, self.source_height, output_width)
+        self.timestamp = 0.0
+        self._index = -1
+
+    def isOpened(self) -> bool:
+        return self._capture.isOpened()
+
+    def grab(self) -> bool:
+        if not self._capture.grab():
+            return False
+        self._index += 1
+        position = self._capture.get(cv2.CAP_PROP_POS_MSEC)
+        self.timestamp = position / 1000 if position > 0 or self._index == 0 else (
+            self._index / self.fps if self.fps > 0 else 0.0)
+        return True
+
+    def retrieve(self) -> Tuple[bool, Optional[np.ndarray]]:
+        ok, frame = self._capture.retrieve()
+        if not ok:
+            return False, None
+        if (self.width, self.height) != (self.source_width, self.source_height):
+            frame = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        if self.gray:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return True, frame
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        return self.retrieve() if self.grab() else (False, None)
+
+    def seek(self, seconds: float) -> bool:
+        return self._capture.set(cv2.CAP_PROP_POS_MSEC, seconds * 1000)
+
+    def release(self):
+        self._capture.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class PyAVVideoReader:
+    """Décodage FFmpeg via PyAV : multi-thread, mise à l'échelle dans swscale, PTS exacts"""
+
+    backend = 'pyav'
+
+    def __init__(self, source: str, output_width: int = 0, gray: bool = False, threads: int = 0,
+                 live: bool = False, keyframes_only: bool = False):
+        self._container = None
+        self._frame = None
+        self._index = -1
+        self.timestamp = 0.0
+        self.fps = 0.0
+        self.frame_count = 0
+        self.duration = 0.0
+        self.width = self.height = self.source_width = self.source_height = 0
+        self._format = 'gray' if gray else 'bgr24'
+        options = {'rtsp_transport': 'tcp', 'fflags': 'nobuffer', 'flags': 'low_delay'} if live else None
+        try:
+            self._container = av.open(source, options=options, timeout=10 if live else None)
+            self._stream = self._container.streams.video[0]
+        except Exception as e:
+            logger.warning("Ouverture PyAV impossible: %s", e)
+            if self._container is not None:
+                self._container.close()
+                self._container = None
+            return
+
+        # Threads par frame pour les fichiers ; par tranche en direct (pas de frames retenues)
+        self._stream.thread_type = 'SLICE' if live else 'AUTO'
+        if threads:
+            self._stream.thread_count = threads
+        if keyframes_only:
+            self._stream.codec_context.skip_frame = 'NONKEY'
+        rate = self._stream.average_rate or self._stream.guessed_rate
+        self.fps = float(rate) if rate else 0.0
+        self.source_width = self._stream.codec_context.width
+        self.source_height = self._stream.codec_context.height
+        self.width, self.height = _output_size(self.source_width, self.source_height, output_width)
+        if self._stream.duration is not None and self._stream.time_base is not None:
+            self.duration = float(self._stream.duration * self._stream.time_base)
+        elif self._container.duration is not None:
+            self.duration = self._container.duration / av.time_base
+        if not live:
+            self.frame_count = self._stream.frames or self._count_packets(source)
+        self._frames = self._container.decode(self._stream)
+
+    @staticmethod
+    def _count_packets(source: str) -> int:
+        """Nombre exact de frames par lecture des paquets (démultiplexage seul, sans décodage)"""
+        try:
+            with av.open(source) as container:
+                stream = container.streams.video[0]
+                return sum(1 for packet in container.demux(stream) if packet.size)
+        except Exception:
+            return 0
+
+    def isOpened(self) -> bool:
+        return self._container is not None
+
+    def grab(self) -> bool:
+        if self._container is None:
+            return False
+        try:
+            self._frame = next(self._frames)
+        except StopIteration:
+            return False
+        except Exception as e:
+            # Flux corrompu ou coupé : traité comme une fin de lecture
+            logger.warning("Erreur de décodage PyAV: %s", e)
+            return False
+        self._index += 1
+        frame_time = self._frame.time
+        self.timestamp = float(frame_time) if frame_time is not None else (
+            self._index / self.fps if self.fps > 0 else 0.0)
+        return True
+
+    def retrieve(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if self._frame is None:
+            return False, None
+        return True, self._frame.to_ndarray(format=self._format, width=self.width, height=self.height)
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        return self.retrieve() if self.grab() else (False, None)
+
+    def seek(self, seconds: float) -> bool:
+        """Se placer sur la keyframe qui précède `seconds` (la lecture reprend à cette keyframe)"""
+        if self._container is None:
+            return False
+        try:
+            self._container.seek(int(seconds / self._stream.time_base), stream=self._stream,
+                                 backward=True, any_frame=False)
+        except Exception as e:
+            logger.warning("Repositionnement PyAV impossible: %s", e)
+            return False
+        self._frames = self._container.decode(self._stream)
+        self._frame = None
+        return True
+
+    def release(self):
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def open_video(source: str, output_width: int = VIDEO_DECODE_WIDTH, gray: bool = False, live: bool = False,
+               keyframes_only: bool = False, decoder: str = VIDEO_DECODER, threads: int = VIDEO_DECODE_THREADS):
+    """
+    Ouvrir une vidéo (fichier ou flux) avec le décodeur configuré
+
+    Args:
+        source: Chemin du fichier ou URL (rtsp://...)
+        output_width: Largeur des frames retournées (0 = d'origine), hauteur proportionnelle
+        gray: Frames en niveaux de gris au lieu de BGR
+        live: Flux en direct (pas de mise en tampon, pas de comptage des frames)
+        keyframes_only: Ne décoder que les keyframes (PyAV uniquement)
+        decoder: 'auto', 'pyav' ou 'opencv'
+        threads: Threads de décodage (0 = choix de FFmpeg)
+
+    Returns:
+        Lecteur (vérifier isOpened()) ; PyAVVideoReader si disponible et demandé, sinon OpenCVVideoReader
+    """
+    if decoder in ('auto', 'pyav') and PYAV_AVAILABLE:
+        reader = PyAVVideoReader(source, output_width, gray, threads, live, keyframes_only)
+        if reader.isOpened() or decoder == 'pyav':
+            return reader
+    elif decoder == 'pyav':
+        logger.warning("VIDEO_DECODER=pyav mais PyAV n'est pas installé (pip install av) : repli sur OpenCV")
+    return OpenCVVideoReader(source, output_width, gray, threads, live)
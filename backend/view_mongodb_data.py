@@ -58,14 +58,19 @@ def view_all_detections():
             print(f"⚠️  Niveau d'alerte max: {doc.get('max_alert_level', 0)}")
             
             # Afficher quelques détections d'exemple
-            detections_list = doc.get('detections', [])
+            # (schéma vidéo normalisé : les détections sont dans une collection séparée)
+            if doc.get('storage_layout') == 'normalized':
+                detections_list = mongodb_service.get_video_detections(doc['_id'], limit=5)
+            else:
+                detections_list = doc.get('detections', [])
+            total_listed = doc.get('detection_count', len(detections_list))
             if detections_list:
                 print(f"\n📋 Exemples d'objets détectés (premiers 5):")
                 for i, det in enumerate(detections_list[:5], 1):
                     print(f"   {i}. {det.get('label', 'Unknown')} - Confiance: {det.get('confidence', 0):.2%} - "
                           f"Risque: {det.get('riskLevel', 'N/A')} - Alerte: {det.get('alertLevel', 0)}")
-                if len(detections_list) > 5:
-                    print(f"   ... et {len(detections_list) - 5} autres objets")
+                if total_listed > 5:
+                    print(f"   ... et {total_listed - 5} autres objets")
         
         print_separator()
         
@@ -101,6 +106,15 @@ def view_statistics():
         
         objects_count = list(mongodb_service.collection.aggregate(pipeline))
         
+        # Ajouter les détections vidéo du schéma normalisé (une détection par document)
+        if mongodb_service.video_detections is not None:
+            merged = {obj['_id']: obj['count'] for obj in objects_count}
+            video_pipeline = [{"$group": {"_id": "$label", "count": {"$sum": 1}}}]
+            for obj in mongodb_service.video_detections.aggregate(video_pipeline):
+                merged[obj['_id']] = merged.get(obj['_id'], 0) + obj['count']
+            objects_count = [{'_id': label, 'count': count}
+                             for label, count in sorted(merged.items(), key=lambda kv: -kv[1])]
+        
         print(f"\n📦 Documents totaux: {total_docs}")
         print(f"🖼️  Images: {images}")
         print(f"🎬 Vidéos: {videos}")
@@ -128,19 +142,22 @@ def export_to_json(filename="mongodb_export.json"):
         return
     
     try:
-        detections = list(mongodb_service.collection.find())
-        
-        # Convertir ObjectId en string pour JSON
-        for doc in detections:
-            doc['_id'] = str(doc['_id'])
-            if 'timestamp' in doc and isinstance(doc['timestamp'], datetime):
-                doc['timestamp'] = doc['timestamp'].isoformat()
-        
+        # Lecture du curseur par lots et écriture au fil de l'eau (mémoire constante)
+        count = 0
         with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(detections, f, indent=2, ensure_ascii=False)
+            f.write('[')
+            for doc in mongodb_service.collection.find().batch_size(1000):
+                # Convertir ObjectId en string pour JSON
+                doc['_id'] = str(doc['_id'])
+                if 'timestamp' in doc and isinstance(doc['timestamp'], datetime):
+                    doc['timestamp'] = doc['timestamp'].isoformat()
+                f.write(',\n' if count else '\n')
+                f.write(json.dumps(doc, indent=2, ensure_ascii=False, default=str))
+                count += 1
+            f.write('\n]' if count else ']')
         
         print(f"✅ Données exportées dans: {filename}")
-        print(f"   {len(detections)} documents exportés")
+        print(f"   {count} documents exportés")
         
     except Exception as e:
         print(f"❌ Erreur lors de l'export: {e}")
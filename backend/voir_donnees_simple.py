@@ -79,8 +79,12 @@ try:
             if 'video_filename' in doc:
                 print(f"   Vidéo: {doc.get('video_filename', 'N/A')}")
             
-            # Afficher quelques détections
-            detections = doc.get('detections', [])
+            # Afficher quelques détections (collection séparée pour les vidéos normalisées)
+            if doc.get('storage_layout') == 'normalized':
+                detections = list(db['video_detections'].find({'run_id': doc['_id']}).sort('frame_number', 1).limit(5))
+            else:
+                detections = doc.get('detections', [])
+            total_listed = doc.get('detection_count', len(detections))
             if detections:
                 print(f"   Objets détectés:")
                 for det in detections[:5]:  # Afficher les 5 premiers
@@ -88,8 +92,8 @@ try:
                     confidence = det.get('confidence', 0)
                     risk = det.get('riskLevel', 'N/A')
                     print(f"     - {label} (confiance: {confidence:.2f}, risque: {risk})")
-                if len(detections) > 5:
-                    print(f"     ... et {len(detections) - 5} autres")
+                if total_listed > 5:
+                    print(f"     ... et {total_listed - 5} autres")
     
     client.close()
     